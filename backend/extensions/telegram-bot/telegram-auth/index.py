@@ -7,32 +7,28 @@ Flow:
 2. Bot generates unique auth link and sends to user
 3. User clicks link -> frontend exchanges token for JWT
 4. Refresh tokens stored hashed (SHA256) in DB
+5. Refresh tokens rotate on every refresh; replaying a consumed token revokes its family
 """
 
 import json
 import os
 import hashlib
+import random
 import secrets
+import time
 from datetime import datetime, timezone, timedelta
 from typing import Optional
-import psycopg2
 import jwt
 
+from sweep_shared.db import get_db, get_schema, release_db
+from sweep_shared.metrics import instrumented, log_event, set_action
+from sweep_shared.web import cors_headers, json_response, options_response as empty_response
+
 
 # =============================================================================
 # CONFIGURATION
 # =============================================================================
 
-def get_db_connection():
-    return psycopg2.connect(os.environ["DATABASE_URL"])
-
-
-def get_schema() -> str:
-    """Get database schema prefix."""
-    schema = os.environ.get("MAIN_DB_SCHEMA", "public")
-    return f"{schema}." if schema else ""
-
-
 def get_env(key: str) -> str:
     value = os.environ.get(key)
     if not value:
@@ -40,6 +36,22 @@ def get_env(key: str) -> str:
     return value
 
 
+# Expired-token cleanup runs in bounded batches: from the dedicated
+# ?action=cleanup entry point, or opportunistically on a small share of requests.
+CLEANUP_BATCH_SIZE = 1000
+CLEANUP_MAX_BATCHES = 50
+CLEANUP_MIN_INTERVAL = 60
+
+_last_cleanup = 0.0
+
+
+def get_cleanup_probability() -> float:
+    try:
+        return float(os.environ.get("TOKEN_CLEANUP_PROBABILITY", "0.01"))
+    except ValueError:
+        return 0.0
+
+
 # =============================================================================
 # SECURITY HELPERS
 # =============================================================================
@@ -52,6 +64,16 @@ def generate_token(length: int = 32) -> str:
     return secrets.token_urlsafe(length)
 
 
+def generate_refresh_token(family_id: str) -> str:
+    """Refresh token carries its family id as a prefix: '<family_id>.<secret>'."""
+    return f"{family_id}.{generate_token(48)}"
+
+
+def get_token_family(refresh_token: str) -> Optional[str]:
+    family_id, sep, _ = refresh_token.partition(".")
+    return family_id if sep and family_id else None
+
+
 def create_jwt(user_id: int, secret: str, expires_in: int = 900) -> str:
     payload = {
         "user_id": user_id,
@@ -65,16 +87,22 @@ def create_jwt(user_id: int, secret: str, expires_in: int = 900) -> str:
 # DATABASE OPERATIONS
 # =============================================================================
 
-def get_auth_token(cursor, token: str) -> Optional[dict]:
-    """Get auth token data by token."""
+def consume_auth_token(cursor, token: str) -> Optional[dict]:
+    """
+    Atomically mark auth token as used and return its data.
+    Returns None if token is unknown, expired, already used or not yet bound
+    to a Telegram user (such a token stays usable until the bot binds it).
+    """
     token_hash = hash_token(token)
     schema = get_schema()
 
     cursor.execute(f"""
-        SELECT telegram_id, telegram_username, telegram_first_name,
-               telegram_last_name, telegram_photo_url, expires_at, used
-        FROM {schema}telegram_auth_tokens
-        WHERE token_hash = %s
+        UPDATE {schema}telegram_auth_tokens
+        SET used = TRUE
+        WHERE token_hash = %s AND used = FALSE AND expires_at > NOW()
+          AND telegram_id IS NOT NULL
+        RETURNING telegram_id, telegram_username, telegram_first_name,
+                  telegram_last_name, telegram_photo_url
     """, (token_hash,))
 
     row = cursor.fetchone()
@@ -87,54 +115,40 @@ def get_auth_token(cursor, token: str) -> Optional[dict]:
         "telegram_first_name": row[2],
         "telegram_last_name": row[3],
         "telegram_photo_url": row[4],
-        "expires_at": row[5],
-        "used": row[6],
     }
 
 
-def mark_token_used(cursor, token: str) -> bool:
-    """Mark token as used."""
+def get_auth_token_status(cursor, token: str) -> Optional[dict]:
+    """Get expiry/used flags of a token that could not be consumed (error reporting only)."""
     token_hash = hash_token(token)
     schema = get_schema()
 
     cursor.execute(f"""
-        UPDATE {schema}telegram_auth_tokens
-        SET used = TRUE
-        WHERE token_hash = %s AND used = FALSE
-        RETURNING id
+        SELECT expires_at <= NOW(), used
+        FROM {schema}telegram_auth_tokens
+        WHERE token_hash = %s
     """, (token_hash,))
 
-    return cursor.fetchone() is not None
-
+    row = cursor.fetchone()
+    if not row:
+        return None
 
-def cleanup_expired_tokens(cursor) -> None:
-    """Remove expired auth tokens."""
-    schema = get_schema()
-    cursor.execute(f"""
-        DELETE FROM {schema}telegram_auth_tokens
-        WHERE expires_at < NOW() OR (used = TRUE AND created_at < NOW() - INTERVAL '1 hour')
-    """)
+    return {"expired": row[0], "used": row[1]}
 
 
-def find_user_by_telegram_id(cursor, telegram_id: str) -> Optional[dict]:
-    """Find user by Telegram ID."""
+def cleanup_expired_tokens(cursor, limit: int = CLEANUP_BATCH_SIZE) -> int:
+    """Remove up to `limit` expired auth tokens. Returns number of rows deleted."""
     schema = get_schema()
     cursor.execute(f"""
-        SELECT id, email, name, avatar_url, telegram_id
-        FROM {schema}users
-        WHERE telegram_id = %s
-    """, (telegram_id,))
-
-    row = cursor.fetchone()
-    if row:
-        return {
-            "id": row[0],
-            "email": row[1],
-            "name": row[2],
-            "avatar_url": row[3],
-            "telegram_id": row[4],
-        }
-    return None
+        DELETE FROM {schema}telegram_auth_tokens
+        WHERE id IN (
+            SELECT id FROM {schema}telegram_auth_tokens
+            WHERE expires_at < NOW() OR (used = TRUE AND created_at < NOW() - INTERVAL '1 hour')
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+    """, (limit,))
+    return cursor.rowcount
 
 
 def create_or_update_user(
@@ -156,27 +170,17 @@ def create_or_update_user(
         name_parts.append(last_name)
     display_name = " ".join(name_parts) if name_parts else username or f"User {telegram_id}"
 
-    # Check if user exists
-    existing = find_user_by_telegram_id(cursor, telegram_id)
-
-    if existing:
-        # Update existing user
-        cursor.execute(f"""
-            UPDATE {schema}users
-            SET name = COALESCE(%s, name),
-                avatar_url = COALESCE(%s, avatar_url),
-                last_login_at = NOW(),
-                updated_at = NOW()
-            WHERE telegram_id = %s
-            RETURNING id, email, name, avatar_url, telegram_id
-        """, (display_name, photo_url, telegram_id))
-    else:
-        # Create new user
-        cursor.execute(f"""
-            INSERT INTO {schema}users (telegram_id, name, avatar_url, email_verified, password_hash, created_at, updated_at, last_login_at)
-            VALUES (%s, %s, %s, TRUE, '', NOW(), NOW(), NOW())
-            RETURNING id, email, name, avatar_url, telegram_id
-        """, (telegram_id, display_name, photo_url))
+    # Insert or update in one statement (users.telegram_id is unique)
+    cursor.execute(f"""
+        INSERT INTO {schema}users AS u (telegram_id, name, avatar_url, email_verified, password_hash, created_at, updated_at, last_login_at)
+        VALUES (%s, %s, %s, TRUE, '', NOW(), NOW(), NOW())
+        ON CONFLICT (telegram_id) DO UPDATE
+        SET name = COALESCE(EXCLUDED.name, u.name),
+            avatar_url = COALESCE(EXCLUDED.avatar_url, u.avatar_url),
+            last_login_at = NOW(),
+            updated_at = NOW()
+        RETURNING id, email, name, avatar_url, telegram_id
+    """, (telegram_id, display_name, photo_url))
 
     row = cursor.fetchone()
     return {
@@ -188,60 +192,125 @@ def create_or_update_user(
     }
 
 
-def save_refresh_token(cursor, user_id: int, token_hash: str, expires_at: datetime) -> None:
+def save_refresh_token(cursor, user_id: int, token_hash: str, expires_at: datetime, family_id: str) -> None:
     """Save hashed refresh token to DB."""
     schema = get_schema()
     cursor.execute(f"""
-        INSERT INTO {schema}refresh_tokens (user_id, token_hash, expires_at)
-        VALUES (%s, %s, %s)
-    """, (user_id, token_hash, expires_at))
+        INSERT INTO {schema}refresh_tokens (user_id, token_hash, expires_at, family_id)
+        VALUES (%s, %s, %s, %s)
+    """, (user_id, token_hash, expires_at, family_id))
 
 
-def find_refresh_token(cursor, token_hash: str) -> Optional[dict]:
-    """Find refresh token by hash."""
+def rotate_refresh_token(
+    cursor, token_hash: str, new_token_hash: str, new_expires_at: datetime, family_id: str
+) -> Optional[dict]:
+    """
+    Consume refresh token and issue its successor in one statement.
+    The consumed row is kept with used_at set (until it expires) so that a replay can be told
+    apart from an unknown token. The successor is stored under family_id, the prefix of the
+    successor token itself, so the stored family always matches the token (rows from before
+    V0009 carry a backfilled md5 family that no token prefix can match; they are re-keyed,
+    together with the consumed row, on their next rotation).
+    Returns user data, or None if the token is unknown, expired or already used.
+    """
     schema = get_schema()
     cursor.execute(f"""
-        SELECT user_id, expires_at
-        FROM {schema}refresh_tokens
-        WHERE token_hash = %s AND expires_at > NOW()
-    """, (token_hash,))
+        WITH old AS (
+            UPDATE {schema}refresh_tokens SET used_at = NOW(), family_id = %s
+            WHERE token_hash = %s AND expires_at > NOW() AND used_at IS NULL
+            RETURNING user_id
+        ), new AS (
+            INSERT INTO {schema}refresh_tokens (user_id, token_hash, expires_at, family_id)
+            SELECT user_id, %s, %s, %s FROM old
+            RETURNING user_id, family_id
+        )
+        SELECT u.id, u.email, u.name, u.avatar_url, u.telegram_id, new.family_id
+        FROM new JOIN {schema}users u ON u.id = new.user_id
+    """, (family_id, token_hash, new_token_hash, new_expires_at, family_id))
 
     row = cursor.fetchone()
-    if row:
-        return {"user_id": row[0], "expires_at": row[1]}
-    return None
+    if not row:
+        return None
+    return {
+        "user": {
+            "id": row[0],
+            "email": row[1],
+            "name": row[2],
+            "avatar_url": row[3],
+            "telegram_id": row[4],
+        },
+        "family_id": row[5],
+    }
 
 
-def delete_refresh_token(cursor, token_hash: str) -> None:
-    """Delete refresh token."""
+def get_used_token_family(cursor, token_hash: str) -> Optional[str]:
+    """Family of a refresh token that was already rotated away, or None."""
     schema = get_schema()
-    cursor.execute(f"DELETE FROM {schema}refresh_tokens WHERE token_hash = %s", (token_hash,))
+    cursor.execute(
+        f"SELECT family_id FROM {schema}refresh_tokens WHERE token_hash = %s AND used_at IS NOT NULL",
+        (token_hash,),
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
 
 
-def get_user_by_id(cursor, user_id: int) -> Optional[dict]:
-    """Get user by ID."""
+def get_stored_token_family(cursor, token_hash: str) -> Optional[str]:
+    """Family stored for a refresh token (used or not), or None for an unknown token."""
     schema = get_schema()
-    cursor.execute(f"""
-        SELECT id, email, name, avatar_url, telegram_id
-        FROM {schema}users WHERE id = %s
-    """, (user_id,))
-
+    cursor.execute(f"SELECT family_id FROM {schema}refresh_tokens WHERE token_hash = %s", (token_hash,))
     row = cursor.fetchone()
-    if row:
-        return {
-            "id": row[0],
-            "email": row[1],
-            "name": row[2],
-            "avatar_url": row[3],
-            "telegram_id": row[4],
-        }
-    return None
+    return row[0] if row else None
+
+
+def revoke_token_family(cursor, family_id: str) -> int:
+    """Delete every refresh token of a family. Returns number of tokens revoked."""
+    schema = get_schema()
+    cursor.execute(f"DELETE FROM {schema}refresh_tokens WHERE family_id = %s", (family_id,))
+    return cursor.rowcount
 
 
-def cleanup_expired_refresh_tokens(cursor) -> None:
-    """Remove expired refresh tokens."""
+def cleanup_expired_refresh_tokens(cursor, limit: int = CLEANUP_BATCH_SIZE) -> int:
+    """Remove up to `limit` expired refresh tokens. Returns number of rows deleted."""
     schema = get_schema()
-    cursor.execute(f"DELETE FROM {schema}refresh_tokens WHERE expires_at < NOW()")
+    cursor.execute(f"""
+        DELETE FROM {schema}refresh_tokens
+        WHERE id IN (
+            SELECT id FROM {schema}refresh_tokens
+            WHERE expires_at < NOW()
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+    """, (limit,))
+    return cursor.rowcount
+
+
+def run_cleanup(conn, max_batches: int = CLEANUP_MAX_BATCHES) -> dict:
+    """Delete expired tokens batch by batch, committing after each batch."""
+    removed = {"auth_tokens": 0, "refresh_tokens": 0}
+    cursor = conn.cursor()
+    for key, cleanup in (("auth_tokens", cleanup_expired_tokens), ("refresh_tokens", cleanup_expired_refresh_tokens)):
+        for _ in range(max_batches):
+            deleted = cleanup(cursor)
+            conn.commit()
+            removed[key] += deleted
+            if deleted < CLEANUP_BATCH_SIZE:
+                break
+    cursor.close()
+    return removed
+
+
+def maybe_cleanup(conn) -> None:
+    """Opportunistic single-batch sweep, at most once per CLEANUP_MIN_INTERVAL per warm instance."""
+    global _last_cleanup
+    now = time.monotonic()
+    if now - _last_cleanup < CLEANUP_MIN_INTERVAL or random.random() >= get_cleanup_probability():
+        return
+    _last_cleanup = now
+    try:
+        run_cleanup(conn, max_batches=1)
+    except Exception as e:
+        conn.rollback()
+        log_event("error", where="cleanup", error=repr(e))
 
 
 # =============================================================================
@@ -249,28 +318,15 @@ def cleanup_expired_refresh_tokens(cursor) -> None:
 # =============================================================================
 
 def get_cors_headers() -> dict:
-    allowed_origins = os.environ.get("ALLOWED_ORIGINS", "*")
-    return {
-        "Access-Control-Allow-Origin": allowed_origins,
-        "Access-Control-Allow-Methods": "POST, OPTIONS",
-        "Access-Control-Allow-Headers": "Content-Type",
-    }
+    return cors_headers()
 
 
 def cors_response(status: int, body: dict) -> dict:
-    return {
-        "statusCode": status,
-        "headers": {**get_cors_headers(), "Content-Type": "application/json"},
-        "body": json.dumps(body),
-    }
+    return json_response(status, body, get_cors_headers())
 
 
 def options_response() -> dict:
-    return {
-        "statusCode": 204,
-        "headers": get_cors_headers(),
-        "body": "",
-    }
+    return empty_response(get_cors_headers())
 
 
 # =============================================================================
@@ -287,33 +343,25 @@ def handle_callback(cursor, body: dict) -> dict:
     if not token:
         return cors_response(400, {"error": "Missing token"})
 
-    token_data = get_auth_token(cursor, token)
-
-    if not token_data:
-        return cors_response(404, {"error": "Token not found"})
-
-    # Check if expired (handle both naive and aware datetime from DB)
-    expires_at = token_data["expires_at"]
-    now = datetime.now(timezone.utc)
-    # Convert to naive UTC for comparison if needed
-    if expires_at.tzinfo is None:
-        expires_at = expires_at.replace(tzinfo=timezone.utc)
-    if expires_at < now:
-        return cors_response(410, {"error": "Token expired"})
-
-    # Check if already used
-    if token_data["used"]:
-        return cors_response(410, {"error": "Token already used"})
-
-    # Check if user data exists
-    if not token_data["telegram_id"]:
-        return cors_response(400, {"error": "Token not authenticated"})
-
     # Get JWT secret
     jwt_secret = get_env("JWT_SECRET")
     if len(jwt_secret) < 32:
         return cors_response(500, {"error": "Server configuration error"})
 
+    # Consume token (check + mark used in one statement)
+    token_data = consume_auth_token(cursor, token)
+
+    if not token_data:
+        status = get_auth_token_status(cursor, token)
+        if not status:
+            return cors_response(404, {"error": "Token not found"})
+        if status["used"]:
+            return cors_response(410, {"error": "Token already used"})
+        if status["expired"]:
+            return cors_response(410, {"error": "Token expired"})
+        # not bound by the bot yet: the token stays unused, the frontend may retry
+        return cors_response(400, {"error": "Token not authenticated"})
+
     # Create or update user
     user = create_or_update_user(
         cursor,
@@ -324,16 +372,14 @@ def handle_callback(cursor, body: dict) -> dict:
         photo_url=token_data["telegram_photo_url"],
     )
 
-    # Mark token as used
-    mark_token_used(cursor, token)
-
-    # Generate tokens
+    # Generate tokens (login starts a new refresh token family)
     access_token = create_jwt(user["id"], jwt_secret)
-    refresh_token = generate_token(48)
+    family_id = secrets.token_hex(16)
+    refresh_token = generate_refresh_token(family_id)
     refresh_token_hash = hash_token(refresh_token)
     refresh_expires = datetime.now(timezone.utc) + timedelta(days=30)
 
-    save_refresh_token(cursor, user["id"], refresh_token_hash, refresh_expires)
+    save_refresh_token(cursor, user["id"], refresh_token_hash, refresh_expires, family_id)
 
     return cors_response(200, {
         "access_token": access_token,
@@ -355,24 +401,51 @@ def handle_refresh(cursor, body: dict) -> dict:
     jwt_secret = get_env("JWT_SECRET")
     token_hash = hash_token(refresh_token)
 
-    token_data = find_refresh_token(cursor, token_hash)
-    if not token_data:
-        return cors_response(401, {"error": "Invalid or expired refresh token"})
+    # Rotate: old token is consumed, successor in the same family is issued
+    # (a legacy token without a family prefix starts a new family)
+    family_id = get_token_family(refresh_token) or secrets.token_hex(16)
+    new_refresh_token = generate_refresh_token(family_id)
+    refresh_expires = datetime.now(timezone.utc) + timedelta(days=30)
 
-    user = get_user_by_id(cursor, token_data["user_id"])
-    if not user:
-        return cors_response(401, {"error": "User not found"})
+    rotated = rotate_refresh_token(
+        cursor, token_hash, hash_token(new_refresh_token), refresh_expires, family_id
+    )
+    if not rotated:
+        # Only a token that was already rotated away is a replay: revoke its whole family.
+        # Unknown or expired tokens revoke nothing - their prefix is not proof of anything.
+        used_family = get_used_token_family(cursor, token_hash)
+        if used_family and revoke_token_family(cursor, used_family):
+            log_event("refresh_token_reuse", family_id=used_family)
+        return cors_response(401, {"error": "Invalid or expired refresh token"})
 
     # Generate new access token
+    user = rotated["user"]
     access_token = create_jwt(user["id"], jwt_secret)
 
     return cors_response(200, {
         "access_token": access_token,
+        "refresh_token": new_refresh_token,
         "expires_in": 900,
         "user": user,
     })
 
 
+def handle_cleanup(conn, event: dict) -> dict:
+    """
+    POST ?action=cleanup
+    Maintenance entry point (cron): removes expired tokens in bounded batches.
+    Requires X-Maintenance-Key header matching MAINTENANCE_KEY.
+    """
+    expected = os.environ.get("MAINTENANCE_KEY", "")
+    headers = event.get("headers") or {}
+    provided = headers.get("X-Maintenance-Key") or headers.get("x-maintenance-key") or ""
+    if not expected or not secrets.compare_digest(provided, expected):
+        return cors_response(403, {"error": "Forbidden"})
+
+    removed = run_cleanup(conn)
+    return cors_response(200, {"success": True, "removed": removed})
+
+
 def handle_logout(cursor, body: dict) -> dict:
     """
     POST ?action=logout
@@ -380,8 +453,10 @@ def handle_logout(cursor, body: dict) -> dict:
     """
     refresh_token = body.get("refresh_token")
     if refresh_token:
-        token_hash = hash_token(refresh_token)
-        delete_refresh_token(cursor, token_hash)
+        # the family is taken from the stored row, never from the unverified token prefix
+        family_id = get_stored_token_family(cursor, hash_token(refresh_token))
+        if family_id:
+            revoke_token_family(cursor, family_id)
 
     return cors_response(200, {"success": True})
 
@@ -390,6 +465,7 @@ def handle_logout(cursor, body: dict) -> dict:
 # MAIN HANDLER
 # =============================================================================
 
+@instrumented("telegram-auth")
 def handler(event, context):
     """Main entry point."""
     method = event.get("httpMethod", "GET")
@@ -401,6 +477,7 @@ def handler(event, context):
     # Parse query params
     params = event.get("queryStringParameters") or {}
     action = params.get("action", "")
+    set_action(action)
 
     # Parse body for POST requests
     body = {}
@@ -413,12 +490,12 @@ def handler(event, context):
 
     conn = None
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        conn = get_db()
 
-        # Cleanup expired tokens periodically
-        cleanup_expired_tokens(cursor)
-        cleanup_expired_refresh_tokens(cursor)
+        if action == "cleanup" and method == "POST":
+            return handle_cleanup(conn, event)
+
+        cursor = conn.cursor()
 
         # Route to action handler
         if action == "callback" and method == "POST":
@@ -431,6 +508,9 @@ def handler(event, context):
             response = cors_response(400, {"error": f"Unknown action: {action}"})
 
         conn.commit()
+
+        # Cleanup expired tokens occasionally, after the response is committed
+        maybe_cleanup(conn)
         return response
 
     except ValueError as e:
@@ -438,8 +518,8 @@ def handler(event, context):
     except Exception as e:
         if conn:
             conn.rollback()
-        print(f"Error: {e}")
+        log_event("error", where="handler", action=action, error=repr(e))
         return cors_response(500, {"error": "Internal server error"})
     finally:
         if conn:
-            conn.close()
+            release_db(conn)
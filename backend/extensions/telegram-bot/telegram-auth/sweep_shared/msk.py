@@ -0,0 +1,20 @@
+"""Московское время."""
+
+from datetime import datetime, timedelta, timezone
+
+MSK = timezone(timedelta(hours=3))
+
+
+def now_msk():
+    return datetime.now(MSK)
+
+
+def msk_today_start():
+    """Начало текущих суток МСК без зоны — граница для hour_msk."""
+    return now_msk().replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+
+
+# «сегодня» в SQL — те же сутки МСК; created_at хранится в UTC без зоны
+MSK_TODAY_SQL = "((NOW() AT TIME ZONE 'UTC') + INTERVAL '3 hours')::date"
+# начало суток МСК в UTC — граница для created_at
+MSK_TODAY_START_SQL = f"({MSK_TODAY_SQL} - INTERVAL '3 hours')"
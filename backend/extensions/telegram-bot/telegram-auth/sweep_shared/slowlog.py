@@ -0,0 +1,164 @@
+"""
+Сэмплирование медленных запросов (включается SLOW_QUERY_SAMPLING=1).
+
+SamplingCursor замеряет каждый execute; запросы дольше SLOW_QUERY_MS пишутся
+в лог с нормализованным отпечатком SQL. EXECUTE подготовленного запроса
+(sweep_shared.prepared) учитывается по его зарегистрированному SQL. С вероятностью
+EXPLAIN_SAMPLE_RATE (не чаще раза в EXPLAIN_MIN_INTERVAL секунд на отпечаток) снимается
+план EXPLAIN (ANALYZE, BUFFERS): запрос выполняется ещё раз в отдельной транзакции, которая
+откатывается (для SELECT — READ ONLY), с EXPLAIN_TIMEOUT_MS и коротким EXPLAIN_LOCK_TIMEOUT_MS,
+чтобы не ждать блокировок, которые держит транзакция самого запроса. Откат не возвращает
+значения последовательностей, израсходованные INSERT. DDL, COPY, LOCK и REFRESH не объясняются.
+SLOW_QUERY_SINK=table дополнительно сохраняет сэмплы в query_samples.
+EXPLAIN и запись сэмплов идут через одно служебное соединение инстанса (autocommit).
+"""
+
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+
+import psycopg2
+
+from sweep_shared import prepared
+from sweep_shared.metrics import InstrumentedCursor, current, log_event
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|%\(\w+\)s|%s|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+_WRITES = re.compile(r"\b(INSERT|UPDATE|DELETE)\b", re.I)
+_UNEXPLAINABLE = re.compile(r"\b(TRUNCATE|COPY|CREATE|ALTER|DROP|REFRESH|LOCK)\b", re.I)
+_EXECUTE = re.compile(r"\s*EXECUTE\s+(\w+)", re.I)
+
+_last_explain = {}
+_service_conn = None
+_service_lock = threading.Lock()
+
+
+def is_enabled() -> bool:
+    return os.environ.get("SLOW_QUERY_SAMPLING", "") in ("1", "true")
+
+
+def _env_float(key, default):
+    try:
+        return float(os.environ.get(key, default))
+    except ValueError:
+        return float(default)
+
+
+def normalize(sql: str) -> str:
+    """SQL без литералов и параметров: одинаковые по форме запросы дают одну строку."""
+    sql = _LITERALS.sub("?", sql)
+    sql = _IN_LISTS.sub("(?)", sql)
+    return _SPACES.sub(" ", sql).strip()
+
+
+def fingerprint(sql: str) -> str:
+    return hashlib.md5(normalize(sql).encode()).hexdigest()[:16]
+
+
+def _head(sql: str) -> str:
+    return sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+
+
+def is_explainable(sql: str) -> bool:
+    return _head(sql) in ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE") and not _UNEXPLAINABLE.search(sql)
+
+
+def _run_service(fn):
+    """fn(cur) на служебном соединении: оно открывается один раз и переоткрывается после обрыва."""
+    global _service_conn
+    with _service_lock:
+        if _service_conn is None or _service_conn.closed:
+            _service_conn = psycopg2.connect(os.environ["DATABASE_URL"])
+            _service_conn.autocommit = True
+        try:
+            cur = _service_conn.cursor()
+            try:
+                return fn(cur)
+            finally:
+                cur.close()
+        except psycopg2.OperationalError:
+            _service_conn.close()
+            raise
+
+
+def explain(sql: str):
+    """EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) в транзакции, которая всегда откатывается."""
+    def run(cur):
+        cur.execute("BEGIN")
+        try:
+            if _head(sql) in ("SELECT", "WITH") and not _WRITES.search(sql):
+                cur.execute("SET TRANSACTION READ ONLY")
+            cur.execute("SET LOCAL statement_timeout = %s", (int(_env_float("EXPLAIN_TIMEOUT_MS", 5000)),))
+            cur.execute("SET LOCAL lock_timeout = %s", (int(_env_float("EXPLAIN_LOCK_TIMEOUT_MS", 100)),))
+            cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql)
+            return cur.fetchone()[0]
+        finally:
+            cur.execute("ROLLBACK")
+    return _run_service(run)
+
+
+def store_sample(sample: dict) -> None:
+    schema = os.environ.get("MAIN_DB_SCHEMA", "public")
+    prefix = f"{schema}." if schema else ""
+    _run_service(lambda cur: cur.execute(
+        f"INSERT INTO {prefix}query_samples (fingerprint, query, duration_ms, function, action, plan) "
+        "VALUES (%s, %s, %s, %s, %s, %s)",
+        (sample["fingerprint"], sample["query"], sample["duration_ms"], sample["function"],
+         sample["action"], json.dumps(sample["plan"]) if sample["plan"] is not None else None),
+    ))
+
+
+def record_slow_query(template: str, executed: str, elapsed: float) -> None:
+    fp = fingerprint(template)
+    inv = current()
+    plan = None
+    now = time.monotonic()
+    if (
+        is_explainable(executed)
+        and random.random() < _env_float("EXPLAIN_SAMPLE_RATE", 0.05)
+        and now - _last_explain.get(fp, -1e9) >= _env_float("EXPLAIN_MIN_INTERVAL", 300)
+    ):
+        _last_explain[fp] = now
+        try:
+            plan = explain(executed)
+        except psycopg2.Error as e:
+            log_event("explain_error", fingerprint=fp, error=repr(e))
+    sample = {
+        "fingerprint": fp,
+        "query": normalize(template),
+        "duration_ms": round(elapsed * 1000, 2),
+        "function": inv.function if inv else None,
+        "action": inv.action if inv else None,
+        "plan": plan,
+    }
+    log_event("slow_query", **{k: v for k, v in sample.items() if k != "plan"}, explained=plan is not None)
+    if os.environ.get("SLOW_QUERY_SINK", "log") == "table":
+        try:
+            store_sample(sample)
+        except psycopg2.Error as e:
+            log_event("slow_query_store_error", fingerprint=fp, error=repr(e))
+
+
+class SamplingCursor(InstrumentedCursor):
+    """InstrumentedCursor, который дополнительно сэмплирует запросы дольше SLOW_QUERY_MS."""
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            elapsed = time.perf_counter() - start
+            if elapsed * 1000 >= _env_float("SLOW_QUERY_MS", 200) and self.query:
+                template = query if isinstance(query, str) else self.query.decode(errors="replace")
+                executed = self.query.decode(errors="replace")
+                # EXECUTE name — отпечаток и план по SQL, под которым запрос зарегистрирован
+                match = _EXECUTE.match(template)
+                sql = match and prepared.statement_sql(match.group(1))
+                if sql:
+                    template, executed = sql, self.mogrify(sql, vars).decode(errors="replace")
+                record_slow_query(template, executed, elapsed)
@@ -14,9 +14,11 @@ import hashlib
 from datetime import datetime, timezone, timedelta
 from typing import Optional
 
-import psycopg2
 import telebot
 
+from sweep_shared.db import get_db, get_schema, release_db
+from sweep_shared.web import cors_headers, json_response, options_response as empty_response
+
 
 # =============================================================================
 # CONFIGURATION
@@ -40,39 +42,20 @@ def get_default_chat_id() -> str:
     return os.environ.get("TELEGRAM_CHAT_ID", "")
 
 
-def get_schema() -> str:
-    """Get database schema prefix."""
-    schema = os.environ.get("MAIN_DB_SCHEMA", "public")
-    return f"{schema}." if schema else ""
-
-
 # =============================================================================
 # CORS HELPERS
 # =============================================================================
 
 def get_cors_headers() -> dict:
-    allowed_origins = os.environ.get("ALLOWED_ORIGINS", "*")
-    return {
-        "Access-Control-Allow-Origin": allowed_origins,
-        "Access-Control-Allow-Methods": "POST, OPTIONS",
-        "Access-Control-Allow-Headers": "Content-Type, X-Telegram-Bot-Api-Secret-Token",
-    }
+    return cors_headers(allow_headers="Content-Type, X-Telegram-Bot-Api-Secret-Token")
 
 
 def cors_response(status: int, body: dict) -> dict:
-    return {
-        "statusCode": status,
-        "headers": {**get_cors_headers(), "Content-Type": "application/json"},
-        "body": json.dumps(body),
-    }
+    return json_response(status, body, get_cors_headers())
 
 
 def options_response() -> dict:
-    return {
-        "statusCode": 204,
-        "headers": get_cors_headers(),
-        "body": "",
-    }
+    return empty_response(get_cors_headers())
 
 
 # =============================================================================
@@ -90,7 +73,7 @@ def save_auth_token(
     token_hash = hashlib.sha256(token.encode()).hexdigest()
     schema = get_schema()
 
-    conn = psycopg2.connect(os.environ["DATABASE_URL"])
+    conn = get_db()
     try:
         cursor = conn.cursor()
         cursor.execute(f"""
@@ -109,7 +92,7 @@ def save_auth_token(
         ))
         conn.commit()
     finally:
-        conn.close()
+        release_db(conn)
 
     return token
 
@@ -0,0 +1,202 @@
+"""
+Сводка по ресторанам и источникам за сегодня или за всё время (HTML для Telegram).
+Итоги за всё время включают месяцы, перенесённые в холодный архив (они остаются в hourly_counts).
+
+Сводка считается один раз в агрегат (summary_aggregate) и из него же рендерится:
+целиком (build_summary) или страницами не длиннее лимита сообщения Telegram (summary_pages).
+Агрегат сохраняется в summary_snapshots, чтобы листать страницы в боте без пересчёта.
+"""
+
+import html
+import json
+import os
+import re
+from collections import OrderedDict
+
+from sweep_shared.db import get_schema
+from sweep_shared.msk import msk_today_start, now_msk
+
+TELEGRAM_TEXT_LIMIT = 4096
+SNAPSHOT_TTL = int(os.environ.get("SUMMARY_SNAPSHOT_TTL", "86400"))
+SNAPSHOT_CACHE_SIZE = 64
+
+TOKEN_RE = re.compile(r"<[^>]*>|&#?[a-zA-Z0-9]+;|[^<&]")
+TAG_RE = re.compile(r"<(/?)([a-zA-Z][a-zA-Z0-9-]*)[^>]*>")
+
+# id снимка -> агрегат; снимки неизменяемы, поэтому кеш не устаревает, только вытесняется
+_snapshots = OrderedDict()
+
+
+def text_length(text: str) -> int:
+    """Длина в UTF-16 кодовых единицах, как считает Telegram (с тегами — с запасом)."""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _track(stack, piece):
+    """Стек открытых тегов [(name, open_tag)] после куска HTML."""
+    stack = list(stack)
+    for match in TAG_RE.finditer(piece):
+        closing, name = match.group(1), match.group(2).lower()
+        if not closing:
+            stack.append((name, match.group(0)))
+        elif any(n == name for n, _ in stack):
+            while stack.pop()[0] != name:
+                pass
+    return stack
+
+
+def _pieces(text, size):
+    """Строки текста (с \\n); строка длиннее size режется по границам тегов и сущностей."""
+    for line in text.splitlines(keepends=True):
+        if text_length(line) <= size:
+            yield line
+            continue
+        piece = ""
+        for token in TOKEN_RE.findall(line):
+            if piece and text_length(piece + token) > size:
+                yield piece
+                piece = ""
+            piece += token
+        if piece:
+            yield piece
+
+
+def split_html(text: str, limit: int = TELEGRAM_TEXT_LIMIT):
+    """
+    Делит HTML-текст на куски не длиннее limit. Режет по строкам, а слишком длинные строки —
+    между тегами и сущностями; теги, открытые на границе, закрываются и открываются заново.
+    """
+    if text_length(text) <= limit:
+        return [text]
+    chunks, current, stack = [], "", []
+
+    def close(tags):
+        return "".join(f"</{name}>" for name, _ in reversed(tags))
+
+    # запас на переоткрытие тегов в начале следующего куска
+    for piece in _pieces(text, max(limit // 2, limit - 256)):
+        after = _track(stack, piece)
+        if current.strip() and text_length(current + piece + close(after)) > limit:
+            chunks.append(current.rstrip("\n") + close(stack))
+            current = "".join(tag for _, tag in stack)
+        current += piece
+        stack = after
+    if current.strip():
+        chunks.append(current.rstrip("\n") + close(stack))
+    return chunks
+
+
+def summary_aggregate(cur, period="today"):
+    """
+    -> {"period", "generated_at", "total", "restaurants": [[name, count, [[label, count], ...]], ...]};
+    рестораны без ответов не включаются, источники — по убыванию.
+    """
+    schema = get_schema()
+    cur.execute(f"SELECT id, name FROM {schema}restaurants ORDER BY id")
+    restaurants = cur.fetchall()
+    cur.execute(f"SELECT key, label FROM {schema}source_options WHERE active = true ORDER BY sort_order")
+    source_map = {r[0]: r[1] for r in cur.fetchall()}
+
+    # «сегодня» — сутки МСК, как и везде (sweep_shared.msk); суммы считает Postgres
+    sql = f"SELECT restaurant_id, source, SUM(count)::int FROM {schema}hourly_counts"
+    args = ()
+    if period == "today":
+        sql += " WHERE hour_msk >= %s"
+        args = (msk_today_start(),)
+    cur.execute(sql + " GROUP BY 1, 2", args)
+    counts = {}
+    for rid, skey, cnt in cur.fetchall():
+        counts.setdefault(rid, {})[skey] = cnt
+
+    items = []
+    for rid, rname in restaurants:
+        rows = sorted(counts.get(rid, {}).items(), key=lambda r: r[1], reverse=True)
+        if rows:
+            items.append([rname, sum(r[1] for r in rows), [[source_map.get(k, k), cnt] for k, cnt in rows]])
+    return {
+        "period": period, "generated_at": now_msk().strftime("%d.%m.%Y %H:%M"),
+        "total": sum(r[1] for r in items), "restaurants": items,
+    }
+
+
+def _header(aggregate, page=None):
+    title = "📊 Сводка за сегодня" if aggregate["period"] == "today" else "📊 Сводка за всё время"
+    if page:
+        title += f" · {page[0]}/{page[1]}"
+    return f"<b>{title}</b>\n🕐 {aggregate['generated_at']} МСК\n📋 Всего ответов: {aggregate['total']}"
+
+
+def _blocks(aggregate):
+    for rname, rcount, rows in aggregate["restaurants"]:
+        lines = [f"\n🏪 <b>{html.escape(rname)}</b> — {rcount}"]
+        lines += [f"   • {html.escape(label)}: {cnt}" for label, cnt in rows]
+        yield "\n".join(lines)
+
+
+def render_summary(aggregate):
+    text = _header(aggregate) + "".join(_blocks(aggregate))
+    return text if aggregate["restaurants"] else text + "\n\nНет данных"
+
+
+def summary_pages(aggregate, limit=TELEGRAM_TEXT_LIMIT):
+    """Страницы сводки не длиннее limit; в каждой — заголовок с номером и целые блоки ресторанов."""
+    if not aggregate["restaurants"]:
+        return [render_summary(aggregate)]
+    budget = limit - text_length(_header(aggregate, (999, 999)))
+    pages, current = [], ""
+    for block in _blocks(aggregate):
+        # блок одного ресторана длиннее страницы делится по строкам источников
+        for part in split_html(block, budget) if text_length(block) > budget else [block]:
+            if current and text_length(current + part) > budget:
+                pages.append(current)
+                current = ""
+            current += part if part.startswith("\n") else "\n" + part
+    pages.append(current)
+    if len(pages) == 1:
+        return [_header(aggregate) + pages[0]]
+    return [_header(aggregate, (i, len(pages))) + body for i, body in enumerate(pages, 1)]
+
+
+def build_summary(cur, period="today"):
+    """Возвращает (text, total)."""
+    aggregate = summary_aggregate(cur, period)
+    return render_summary(aggregate), aggregate["total"]
+
+
+def save_snapshot(cur, aggregate) -> int:
+    """Сохраняет агрегат для постраничного просмотра; просроченные снимки удаляются тут же."""
+    schema = get_schema()
+    cur.execute(f"DELETE FROM {schema}summary_snapshots WHERE expires_at < NOW()")
+    cur.execute(
+        f"INSERT INTO {schema}summary_snapshots (period, payload, expires_at) "
+        "VALUES (%s, %s, NOW() + %s * INTERVAL '1 second') RETURNING id",
+        (aggregate["period"], json.dumps(aggregate, ensure_ascii=False), SNAPSHOT_TTL),
+    )
+    snapshot_id = cur.fetchone()[0]
+    _remember_snapshot(snapshot_id, aggregate)
+    return snapshot_id
+
+
+def _remember_snapshot(snapshot_id, aggregate):
+    _snapshots[snapshot_id] = aggregate
+    _snapshots.move_to_end(snapshot_id)
+    while len(_snapshots) > SNAPSHOT_CACHE_SIZE:
+        _snapshots.popitem(last=False)
+
+
+def load_snapshot(cur, snapshot_id):
+    """Агрегат по id из памяти инстанса или из БД; None — снимок просрочен или не найден."""
+    cached = _snapshots.get(snapshot_id)
+    if cached is not None:
+        _snapshots.move_to_end(snapshot_id)
+        return cached
+    cur.execute(
+        f"SELECT payload FROM {get_schema()}summary_snapshots WHERE id = %s AND expires_at >= NOW()",
+        (snapshot_id,),
+    )
+    row = cur.fetchone()
+    if not row:
+        return None
+    aggregate = json.loads(row[0])
+    _remember_snapshot(snapshot_id, aggregate)
+    return aggregate
@@ -0,0 +1,52 @@
+"""
+Перенос закрытых месяцев из responses в холодный архив (то же, что action archive_months).
+
+    DATABASE_URL=... python backend/shared/archive_responses.py
+    DATABASE_URL=... ARCHIVE_PATH=s3://bucket/sweep python backend/shared/archive_responses.py --format parquet
+    DATABASE_URL=... python backend/shared/archive_responses.py --keep-months 6 --dry-run
+
+Архивируются месяцы МСК старше --keep-months (по умолчанию ARCHIVE_KEEP_MONTHS или 12).
+Каждый месяц — отдельная транзакция: строки удаляются только после записи файла.
+"""
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from sweep_shared.archive import archivable_months, archive_month, get_storage  # noqa: E402
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keep-months", type=int, help="сколько последних месяцев оставить в БД")
+    parser.add_argument("--format", choices=("ndjson", "parquet"), help="по умолчанию ARCHIVE_FORMAT или ndjson")
+    parser.add_argument("--path", help="по умолчанию ARCHIVE_PATH или ./archive")
+    parser.add_argument("--dry-run", action="store_true", help="только показать месяцы")
+    args = parser.parse_args(argv)
+    if args.keep_months is not None and args.keep_months < 1:
+        parser.error("--keep-months must be at least 1")
+
+    import psycopg2
+    conn = psycopg2.connect(os.environ["DATABASE_URL"])
+    storage = get_storage(args.path)
+    try:
+        cur = conn.cursor()
+        months = archivable_months(cur, args.keep_months)
+        if args.dry_run:
+            print(json.dumps([m.isoformat() for m in months]))
+            return 0
+        for month in months:
+            result = archive_month(cur, month, storage=storage, fmt=args.format)
+            conn.commit()
+            print(json.dumps(result, ensure_ascii=False))
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,82 @@
+"""
+Бенчмарк prepared statements на пути add_response: вставка ответа + счётчик за сегодня.
+
+    DATABASE_URL=postgresql://localhost/sweep python backend/shared/bench_prepared.py \
+        --iterations 2000 --restaurant-id 1 --source instagram
+
+Для режимов plain (обычный SQL) и prepared (реестр sweep_shared.prepared) печатает время
+на итерацию и Planning Time из EXPLAIN ANALYZE запроса today_count. Всё выполняется
+в одной транзакции, которая в конце откатывается, — данные в БД не меняются.
+Планы показательны на объёме, поэтому БД стоит заполнить seed.py.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import psycopg2  # noqa: E402
+
+from sweep_shared import prepared  # noqa: E402
+from sweep_shared.msk import MSK_TODAY_START_SQL  # noqa: E402
+from sweep_shared.prepared import PreparingConnection  # noqa: E402
+
+INSERT = "INSERT INTO responses (restaurant_id, source) VALUES (%s, %s) RETURNING id, created_at"
+TODAY = f"SELECT COUNT(*) FROM responses WHERE restaurant_id = %s AND created_at >= {MSK_TODAY_START_SQL}"
+
+
+def planning_ms(cur, statement, args):
+    cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + statement, args)
+    plan = cur.fetchone()[0]
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    return plan[0]["Planning Time"]
+
+
+def run(mode, args):
+    os.environ["DB_PREPARE"] = "server" if mode == "prepared" else "off"
+    conn = psycopg2.connect(os.environ["DATABASE_URL"], connection_factory=PreparingConnection)
+    try:
+        cur = conn.cursor()
+        timings = []
+        for _ in range(args.iterations):
+            start = time.perf_counter()
+            prepared.execute(cur, "bench_insert", (args.restaurant_id, args.source))
+            cur.fetchone()
+            prepared.execute(cur, "bench_today", (args.restaurant_id,))
+            cur.fetchone()
+            timings.append(time.perf_counter() - start)
+        if mode == "prepared":
+            plan = planning_ms(cur, "EXECUTE bench_today (%s)", (args.restaurant_id,))
+        else:
+            plan = planning_ms(cur, TODAY, (args.restaurant_id,))
+        return timings, plan
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--restaurant-id", type=int, default=1)
+    parser.add_argument("--source", default="instagram")
+    args = parser.parse_args(argv)
+
+    prepared.register("bench_insert", INSERT)
+    prepared.register("bench_today", TODAY)
+    for mode in ("plain", "prepared"):
+        timings, plan = run(mode, args)
+        ordered = sorted(timings)
+        print(f"{mode:8} mean {statistics.mean(ordered) * 1000:6.3f} ms   "
+              f"p95 {ordered[int(0.95 * (len(ordered) - 1))] * 1000:6.3f} ms   "
+              f"planning(today_count) {plan:6.3f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
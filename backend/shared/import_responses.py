@@ -0,0 +1,58 @@
+"""
+Импорт исторических ответов из CSV или NDJSON напрямую в БД (то же, что action import_responses).
+
+    DATABASE_URL=... python backend/shared/import_responses.py tallies.csv
+    DATABASE_URL=... python backend/shared/import_responses.py export.ndjson --replace
+    cat tallies.csv | DATABASE_URL=... python backend/shared/import_responses.py - --format csv --dry-run
+
+Колонки/поля: restaurant (slug), source (ключ источника), created_at (ISO; без пояса — МСК).
+Файл читается потоком, так что размер не ограничен; при любой ошибке ничего не пишется.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from sweep_shared.importer import ImportFailed, import_responses  # noqa: E402
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="файл или - для stdin")
+    parser.add_argument("--format", choices=("csv", "ndjson"), help="по умолчанию — по расширению файла")
+    parser.add_argument("--replace", action="store_true", help="заменить ответы тех же ресторанов за те же дни")
+    parser.add_argument("--dry-run", action="store_true", help="только проверить")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+    import psycopg2
+    conn = psycopg2.connect(os.environ["DATABASE_URL"])
+    stream = sys.stdin if args.path == "-" else open(args.path, encoding="utf-8-sig", newline="")
+    started = time.perf_counter()
+    try:
+        cur = conn.cursor()
+        result = import_responses(cur, stream, fmt, replace=args.replace, dry_run=args.dry_run)
+        if result["ok"] and not args.dry_run:
+            conn.commit()
+        else:
+            conn.rollback()
+    except ImportFailed as e:
+        conn.rollback()
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+        conn.close()
+    result["seconds"] = round(time.perf_counter() - started, 2)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0 if result["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,146 @@
+"""
+Генератор синтетических данных для нагрузочных тестов: рестораны, источники и ответы.
+
+    DATABASE_URL=postgresql://localhost/sweep python backend/shared/seed.py \
+        --restaurants 20 --days 365 --per-day 150 --seed 42 --end 2026-01-31
+
+Ответы распределены реалистично: пик ужина 19–21 МСК, небольшой пик обеда, пятница
+и суббота выше будней; у каждого ресторана своя смесь источников вокруг общей.
+При одинаковых --seed и --end данные совпадают побайтно. Загрузка — один COPY FROM
+STDIN в одной транзакции; hourly_counts заполняется триггером, представления
+дашборда обновляются в конце. Рестораны генератора имеют slug bench-NNN; --reset
+удаляет их вместе с ответами перед загрузкой.
+
+Из кода: seed(conn, ...) или generate_responses(...) для собственных сценариев.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from sweep_shared.bulk import copy_rows  # noqa: E402
+
+DEFAULT_SOURCES = [
+    ("instagram", "Instagram / соцсети", "Instagram", 1),
+    ("friends", "Рекомендация друзей", "Users", 2),
+    ("internet_ads", "Реклама в интернете", "Globe", 3),
+    ("banner", "Баннер / вывеска", "Signpost", 4),
+    ("passerby", "Проходил(а) мимо", "Footprints", 5),
+    ("other", "Другое", "MessageCircle", 6),
+]
+SOURCE_MIX = {"instagram": 0.30, "friends": 0.25, "internet_ads": 0.15, "banner": 0.10, "passerby": 0.15, "other": 0.05}
+
+# относительная посещаемость по часам МСК: обед 12–14, ужин с пиком в 20
+HOUR_WEIGHTS = [0.2, 0.1, 0.05, 0.02, 0.02, 0.02, 0.05, 0.2, 0.5, 0.8, 1.2, 2.0,
+                4.0, 4.5, 3.5, 2.0, 1.8, 2.5, 5.0, 7.5, 8.0, 6.0, 3.5, 1.2]
+HOUR_CUM = list(accumulate(HOUR_WEIGHTS))
+# пн..вс
+WEEKDAY_FACTOR = [0.8, 0.85, 0.9, 1.0, 1.35, 1.5, 1.2]
+MSK_OFFSET = timedelta(hours=3)
+
+
+def restaurant_profiles(rng, count, per_day):
+    """[(slug, name, средний поток в день, накопленные веса источников)]."""
+    keys = list(SOURCE_MIX)
+    profiles = []
+    for i in range(1, count + 1):
+        weights = [rng.gammavariate(SOURCE_MIX[k] * 20, 1) for k in keys]
+        profiles.append((f"bench-{i:03d}", f"Тестовый ресторан {i}", per_day * rng.uniform(0.5, 1.5),
+                         list(accumulate(weights))))
+    return keys, profiles
+
+
+def generate_responses(restaurant_ids, profiles, keys, days, end, rng):
+    """Кортежи (restaurant_id, source, created_at UTC) по дням; порядок детерминирован rng."""
+    start = end - timedelta(days=days - 1)
+    hours = range(24)
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        midnight = datetime.combine(day, datetime.min.time()) - MSK_OFFSET
+        factor = WEEKDAY_FACTOR[day.weekday()]
+        for rid, (_, _, mean, source_cum) in zip(restaurant_ids, profiles):
+            expected = mean * factor
+            n = max(0, round(rng.gauss(expected, expected ** 0.5)))
+            if not n:
+                continue
+            picked_hours = rng.choices(hours, cum_weights=HOUR_CUM, k=n)
+            picked_sources = rng.choices(keys, cum_weights=source_cum, k=n)
+            for hour, source in zip(picked_hours, picked_sources):
+                yield rid, source, midnight + timedelta(hours=hour, seconds=rng.randrange(3600))
+
+
+def reset(cur):
+    cur.execute("DELETE FROM responses WHERE restaurant_id IN (SELECT id FROM restaurants WHERE slug LIKE 'bench-%')")
+    cur.execute("DELETE FROM restaurants WHERE slug LIKE 'bench-%'")
+
+
+def seed(conn, restaurants=20, days=365, per_day=150, seed_value=42, end=None, refresh_views=True):
+    """Создаёт рестораны и источники, загружает ответы одним COPY; возвращает число ответов."""
+    rng = random.Random(seed_value)
+    end = end or date.today()
+    keys, profiles = restaurant_profiles(rng, restaurants, per_day)
+    cur = conn.cursor()
+    cur.executemany(
+        "INSERT INTO source_options (key, label, icon, sort_order) VALUES (%s, %s, %s, %s) "
+        "ON CONFLICT (key) DO NOTHING",
+        DEFAULT_SOURCES,
+    )
+    restaurant_ids = []
+    for slug, name, _, _ in profiles:
+        cur.execute(
+            "INSERT INTO restaurants (name, slug) VALUES (%s, %s) "
+            "ON CONFLICT (slug) DO UPDATE SET name = EXCLUDED.name RETURNING id",
+            (name, slug),
+        )
+        restaurant_ids.append(cur.fetchone()[0])
+    count = copy_rows(cur, "responses", ("restaurant_id", "source", "created_at"),
+                      generate_responses(restaurant_ids, profiles, keys, days, end, rng))
+    if refresh_views:
+        for view in ("mv_daily_totals", "mv_restaurant_totals", "mv_source_totals"):
+            cur.execute(f"REFRESH MATERIALIZED VIEW {view}")
+        cur.execute(
+            "INSERT INTO app_settings (key, value) VALUES ('views_refreshed_at', EXTRACT(EPOCH FROM NOW())::bigint::text) "
+            "ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, updated_at = NOW()"
+        )
+    conn.commit()
+    cur.close()
+    return count
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--restaurants", type=int, default=20)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--per-day", type=float, default=150, help="средний поток ответов на ресторан в день")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--end", type=date.fromisoformat, default=None, help="последний день (МСК), по умолчанию сегодня")
+    parser.add_argument("--reset", action="store_true", help="удалить ранее сгенерированные bench-рестораны")
+    parser.add_argument("--no-refresh-views", action="store_true")
+    args = parser.parse_args(argv)
+
+    import psycopg2
+    conn = psycopg2.connect(os.environ["DATABASE_URL"])
+    try:
+        if args.reset:
+            cur = conn.cursor()
+            reset(cur)
+            conn.commit()
+            cur.close()
+        started = time.perf_counter()
+        count = seed(conn, args.restaurants, args.days, args.per_day, args.seed, args.end,
+                     refresh_views=not args.no_refresh_views)
+        print(f"loaded {count} responses for {args.restaurants} restaurants in {time.perf_counter() - started:.1f} s")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,198 @@
+"""
+Холодный архив закрытых месяцев.
+
+Ответы месяца (по МСК) выгружаются в сжатый файл — gzip NDJSON или Parquet
+(ARCHIVE_FORMAT=parquet, нужен pyarrow) — в хранилище ARCHIVE_PATH: локальный каталог
+(по умолчанию ./archive) или s3://bucket/prefix (нужен boto3, ключи из окружения AWS_*).
+В БД остаются archived_monthly_counts (итоги по ресторану и источнику за месяц) и
+archived_files (что и где лежит), а строки месяца удаляются из responses. hourly_counts
+за месяц сохраняется (триггер пропускает удаление при sweep.keep_rollups = 'on'), так что
+статистика, тепловая карта и представления видят архивные месяцы. Экспорт дочитывает
+строки из файлов через iter_archived_rows; хранилище файла выбирается по его location.
+"""
+
+import gzip
+import io
+import json
+import os
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+from sweep_shared.db import get_schema
+from sweep_shared.msk import now_msk
+
+MSK_OFFSET = timedelta(hours=3)
+
+
+class LocalStorage:
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def write(self, name, data: bytes) -> str:
+        path = self.root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_bytes(data)
+        tmp.replace(path)
+        return str(path.resolve())
+
+    def read(self, location) -> bytes:
+        return Path(location).read_bytes()
+
+
+class S3Storage:
+    def __init__(self, url):
+        import boto3
+        bucket, _, prefix = url[len("s3://"):].partition("/")
+        self.bucket, self.prefix = bucket, prefix.strip("/")
+        self.client = boto3.client("s3", endpoint_url=os.environ.get("AWS_ENDPOINT_URL") or None)
+
+    def write(self, name, data: bytes) -> str:
+        key = f"{self.prefix}/{name}" if self.prefix else name
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+        return f"s3://{self.bucket}/{key}"
+
+    def read(self, location) -> bytes:
+        key = location[len(f"s3://{self.bucket}/"):]
+        return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+
+
+def get_storage(path=None):
+    path = path or os.environ.get("ARCHIVE_PATH", "archive")
+    return S3Storage(path) if path.startswith("s3://") else LocalStorage(path)
+
+
+def storage_for(location, cache=None):
+    """Хранилище, в которое был записан файл: s3:// — клиент его бакета, иначе локальный путь."""
+    root = f"s3://{location[len('s3://'):].partition('/')[0]}" if location.startswith("s3://") else ""
+    if cache is not None and root in cache:
+        return cache[root]
+    storage = S3Storage(root) if root else LocalStorage(".")
+    if cache is not None:
+        cache[root] = storage
+    return storage
+
+
+def month_bounds(month: date):
+    """Первый день месяца МСК -> границы created_at (UTC) [start, end)."""
+    start = datetime(month.year, month.month, 1)
+    end = datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+    return start - MSK_OFFSET, end - MSK_OFFSET
+
+
+def archivable_months(cur, keep_months=None):
+    """Закрытые месяцы старше keep_months (ARCHIVE_KEEP_MONTHS, по умолчанию 12), где ещё есть ответы."""
+    keep_months = int(os.environ.get("ARCHIVE_KEEP_MONTHS", "12")) if keep_months is None else keep_months
+    today = now_msk().date()
+    index = today.year * 12 + today.month - 1 - keep_months
+    cutoff = date(index // 12, index % 12 + 1, 1)
+    cutoff_utc = datetime.combine(cutoff, datetime.min.time()) - MSK_OFFSET
+    cur.execute(
+        f"SELECT DISTINCT date_trunc('month', created_at + INTERVAL '3 hours')::date FROM {get_schema()}responses "
+        "WHERE created_at < %s ORDER BY 1",
+        (cutoff_utc,),
+    )
+    return [r[0] for r in cur.fetchall()]
+
+
+def encode_rows(rows, fmt):
+    """[(id, restaurant_id, source, created_at)] -> байты файла."""
+    if fmt == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        ids, rids, sources, ts = (list(c) for c in zip(*rows)) if rows else ([], [], [], [])
+        table = pa.table({
+            "id": pa.array(ids, pa.int64()), "restaurant_id": pa.array(rids, pa.int32()),
+            "source": pa.array(sources, pa.string()).dictionary_encode(),
+            # created_at в БД — UTC без зоны; микросекунды сохраняются
+            "created_at": pa.array(ts, pa.timestamp("us", tz="UTC")),
+        })
+        buf = io.BytesIO()
+        pq.write_table(table, buf, compression="zstd")
+        return buf.getvalue()
+    lines = (
+        json.dumps({"id": rid, "restaurant_id": restaurant_id, "source": source, "created_at": created_at.isoformat()})
+        for rid, restaurant_id, source, created_at in rows
+    )
+    return gzip.compress(("\n".join(lines) + "\n").encode() if rows else b"")
+
+
+def decode_rows(data: bytes, fmt):
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        table = pq.read_table(io.BytesIO(data))
+        ids, rids, sources, ts = (table.column(name).to_pylist() for name in ("id", "restaurant_id", "source", "created_at"))
+        # как в БД и в ndjson: UTC без зоны (файлы без зоны в колонке читаются как есть)
+        ts = [t.astimezone(timezone.utc).replace(tzinfo=None) if t.tzinfo else t for t in ts]
+        yield from zip(ids, rids, sources, ts)
+        return
+    for line in gzip.decompress(data).splitlines():
+        if line:
+            r = json.loads(line)
+            yield r["id"], r["restaurant_id"], r["source"], datetime.fromisoformat(r["created_at"])
+
+
+def archive_month(cur, month: date, storage=None, fmt=None):
+    """
+    Переносит ответы месяца в архив (в транзакции вызывающего; commit — после успешной записи файла).
+    Повторный запуск по тому же месяцу дописывает новую часть, если в месяце появились строки.
+    -> {"month", "rows", "location"}.
+    """
+    schema = get_schema()
+    storage = storage or get_storage()
+    fmt = fmt or os.environ.get("ARCHIVE_FORMAT", "ndjson")
+    start, end = month_bounds(month)
+    # месяц блокируется от параллельного архивирования того же месяца
+    cur.execute("SELECT pg_advisory_xact_lock(30002, %s)", (month.year * 100 + month.month,))
+    cur.execute(
+        f"SELECT id, restaurant_id, source, created_at FROM {schema}responses "
+        "WHERE created_at >= %s AND created_at < %s ORDER BY id FOR UPDATE",
+        (start, end),
+    )
+    rows = cur.fetchall()
+    if not rows:
+        return {"month": month.isoformat(), "rows": 0, "location": None}
+    cur.execute(f"SELECT COUNT(*) FROM {schema}archived_files WHERE month_msk = %s", (month,))
+    part = cur.fetchone()[0] + 1
+    ext = "parquet" if fmt == "parquet" else "ndjson.gz"
+    location = storage.write(f"responses/{month:%Y-%m}/part-{part:03d}.{ext}", encode_rows(rows, fmt))
+
+    ids = [r[0] for r in rows]
+    cur.execute(
+        f"INSERT INTO {schema}archived_monthly_counts (restaurant_id, source, month_msk, count) "
+        f"SELECT restaurant_id, source, %s, COUNT(*) FROM {schema}responses WHERE id = ANY(%s) GROUP BY 1, 2 "
+        "ON CONFLICT (restaurant_id, source, month_msk) "
+        "DO UPDATE SET count = archived_monthly_counts.count + EXCLUDED.count",
+        (month, ids),
+    )
+    cur.execute(
+        f"INSERT INTO {schema}archived_files (month_msk, part, location, format, row_count) VALUES (%s, %s, %s, %s, %s)",
+        (month, part, location, fmt, len(rows)),
+    )
+    # hourly_counts не уменьшается: архивный месяц остаётся в статистике и представлениях
+    cur.execute("SELECT set_config('sweep.keep_rollups', 'on', true)")
+    cur.execute(f"DELETE FROM {schema}responses WHERE id = ANY(%s)", (ids,))
+    cur.execute("SELECT set_config('sweep.keep_rollups', 'off', true)")
+    return {"month": month.isoformat(), "rows": len(rows), "location": location}
+
+
+def iter_archived_rows(cur, since=None, until=None, restaurant_id=None):
+    """
+    Архивные ответы (id, restaurant_id, source, created_at UTC) за [since, until) по created_at, по месяцам.
+    Строки удалённых ресторанов пропускаются: файлы архива неизменяемы.
+    """
+    schema = get_schema()
+    cur.execute(f"SELECT id FROM {schema}restaurants")
+    existing = {r[0] for r in cur.fetchall()}
+    cur.execute(f"SELECT month_msk, location, format FROM {schema}archived_files ORDER BY month_msk, part")
+    storages = {}
+    for month, location, fmt in cur.fetchall():
+        start, end = month_bounds(month)
+        if (since and end <= since) or (until and start >= until):
+            continue
+        for row in decode_rows(storage_for(location, storages).read(location), fmt):
+            if row[1] not in existing or (restaurant_id and row[1] != int(restaurant_id)):
+                continue
+            if (since and row[3] < since) or (until and row[3] >= until):
+                continue
+            yield row
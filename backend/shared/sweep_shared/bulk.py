@@ -0,0 +1,49 @@
+"""
+Потоковая загрузка строк через COPY FROM STDIN без промежуточного файла в памяти.
+"""
+
+from datetime import datetime
+
+_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def copy_value(value) -> str:
+    """Значение в текстовом формате COPY: None -> \\N, datetime -> ISO, спецсимволы экранируются."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return str(value).translate(_ESCAPES)
+
+
+class RowStream:
+    """Файлоподобный объект для cursor.copy_expert: строки-кортежи отдаются по мере чтения."""
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = b""
+        self.count = 0
+
+    def read(self, size=-1):
+        chunks, total = [self._buffer], len(self._buffer)
+        while size < 0 or total < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            line = ("\t".join(copy_value(v) for v in row) + "\n").encode()
+            chunks.append(line)
+            total += len(line)
+            self.count += 1
+        data = b"".join(chunks)
+        if size < 0:
+            self._buffer = b""
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+
+def copy_rows(cur, table: str, columns, rows, size: int = 1 << 16) -> int:
+    """COPY table (columns) FROM STDIN из итератора кортежей; возвращает число отправленных строк."""
+    stream = RowStream(rows)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", stream, size)
+    return stream.count
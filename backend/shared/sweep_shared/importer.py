@@ -0,0 +1,159 @@
+"""
+Массовый импорт исторических ответов (CSV или NDJSON: ресторан по slug, ключ источника, время).
+
+Строки разбираются потоком и через COPY попадают во временную таблицу; ссылки на
+restaurants и source_options проверяются одним запросом по всей таблице, затем ответы
+вставляются одним INSERT ... SELECT. hourly_counts пересчитывается триггерами этого же
+оператора, представления дашборда помечаются устаревшими. Уведомления в Telegram не шлются.
+Время без часового пояса считается московским.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime, timedelta, timezone
+
+from sweep_shared.bulk import copy_rows
+from sweep_shared.db import get_schema
+from sweep_shared.settings import set_setting
+
+RESTAURANT_FIELDS = ("restaurant", "restaurant_slug", "slug")
+SOURCE_FIELDS = ("source", "source_key")
+TIME_FIELDS = ("created_at", "timestamp", "time")
+MAX_REPORTED_ERRORS = 20
+MSK_OFFSET = timedelta(hours=3)
+
+
+class ImportFailed(ValueError):
+    pass
+
+
+def _pick(record, names):
+    for name in names:
+        value = record.get(name)
+        if value not in (None, ""):
+            return str(value).strip()
+    return ""
+
+
+def parse_time(value: str) -> datetime:
+    """ISO-время -> naive UTC, как хранится responses.created_at; без пояса — МСК."""
+    ts = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if ts.tzinfo is None:
+        return ts - MSK_OFFSET
+    return ts.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def iter_records(stream, fmt: str):
+    """(номер строки, slug, source, сырое время) из текстового потока CSV (с заголовком) или NDJSON."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, _pick(record, RESTAURANT_FIELDS), _pick(record, SOURCE_FIELDS), _pick(record, TIME_FIELDS)
+    elif fmt == "ndjson":
+        for line_no, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield line_no, "", "", None
+                continue
+            if not isinstance(record, dict):
+                yield line_no, "", "", None
+                continue
+            yield line_no, _pick(record, RESTAURANT_FIELDS), _pick(record, SOURCE_FIELDS), _pick(record, TIME_FIELDS)
+    else:
+        raise ImportFailed(f"Unknown format: {fmt}")
+
+
+def import_responses(cur, stream, fmt="csv", replace=False, dry_run=False, max_rows=None):
+    """
+    Импорт в текущей транзакции (commit/rollback — на вызывающем).
+    replace=True сначала удаляет существующие ответы тех же ресторанов за те же дни МСК.
+    -> {"ok", "rows", "inserted", "deleted", "errors", "error_count"}; при ошибках ничего не пишется.
+    """
+    schema = get_schema()
+    errors = []
+    error_count = 0
+    failure = None
+
+    def parsed():
+        # исключение внутри потока, который читает copy_expert, psycopg2 превращает в QueryCanceled:
+        # ошибка запоминается, поток обрывается, а ImportFailed поднимается уже после COPY
+        nonlocal error_count, failure
+        records = iter_records(stream, fmt)
+        n = 0
+        while True:
+            try:
+                line_no, slug, source, raw_time = next(records)
+            except StopIteration:
+                return
+            except (csv.Error, UnicodeDecodeError, ImportFailed) as e:
+                failure = e if isinstance(e, ImportFailed) else ImportFailed(f"Malformed {fmt}: {e}")
+                return
+            n += 1
+            if max_rows and n > max_rows:
+                failure = ImportFailed(f"Too many rows, limit is {max_rows}")
+                return
+            try:
+                if not slug or not source or not raw_time:
+                    raise ValueError("restaurant, source and created_at are required")
+                created_at = parse_time(raw_time)
+            except ValueError as e:
+                error_count += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({"line": line_no, "error": str(e) or "invalid record"})
+                continue
+            yield line_no, slug, source, created_at
+
+    cur.execute(
+        "CREATE TEMP TABLE import_staging (line_no INTEGER, slug TEXT, source TEXT, created_at TIMESTAMP) "
+        "ON COMMIT DROP"
+    )
+    rows = copy_rows(cur, "import_staging", ("line_no", "slug", "source", "created_at"), parsed())
+    if failure is not None:
+        raise failure
+
+    cur.execute(
+        "SELECT s.line_no, s.slug, s.source, r.id IS NULL, o.key IS NULL, COUNT(*) OVER () "
+        f"FROM import_staging s LEFT JOIN {schema}restaurants r ON r.slug = s.slug "
+        f"LEFT JOIN {schema}source_options o ON o.key = s.source "
+        "WHERE r.id IS NULL OR o.key IS NULL ORDER BY s.line_no LIMIT %s",
+        (MAX_REPORTED_ERRORS,),
+    )
+    unknown = cur.fetchall()
+    parse_errors = error_count
+    if unknown:
+        error_count += unknown[0][5]
+    for line_no, slug, source, bad_restaurant, _, _ in unknown:
+        errors.append({"line": line_no, "error": f"unknown restaurant '{slug}'" if bad_restaurant
+                       else f"unknown source '{source}'"})
+    result = {
+        "ok": not error_count, "rows": rows + parse_errors, "inserted": 0, "deleted": 0,
+        "errors": sorted(errors, key=lambda e: e["line"])[:MAX_REPORTED_ERRORS], "error_count": error_count,
+    }
+    if error_count or dry_run or not rows:
+        return result
+
+    if replace:
+        cur.execute(
+            f"DELETE FROM {schema}responses x USING ("
+            " SELECT DISTINCT r.id AS restaurant_id, date_trunc('day', s.created_at + INTERVAL '3 hours') AS day_msk"
+            f" FROM import_staging s JOIN {schema}restaurants r ON r.slug = s.slug"
+            ") d WHERE x.restaurant_id = d.restaurant_id"
+            " AND x.created_at >= d.day_msk - INTERVAL '3 hours' AND x.created_at < d.day_msk + INTERVAL '21 hours'"
+        )
+        result["deleted"] = cur.rowcount
+    cur.execute(
+        f"INSERT INTO {schema}responses (restaurant_id, source, created_at) "
+        f"SELECT r.id, s.source, s.created_at FROM import_staging s JOIN {schema}restaurants r ON r.slug = s.slug"
+    )
+    result["inserted"] = cur.rowcount
+    # hourly_counts уже обновлён триггерами; представления помечаются устаревшими до cron refresh_views
+    set_setting(cur, "views_refreshed_at", "0")
+    return result
+
+
+def import_text(cur, text: str, fmt="csv", **kwargs):
+    return import_responses(cur, io.StringIO(text), fmt, **kwargs)
@@ -0,0 +1,174 @@
+"""
+Живой счётчик «сегодня» в Telegram: одно закреплённое сообщение на ресторан в чате,
+которое обновляется через editMessageText вместо нового сообщения на каждый ответ.
+
+id сообщения хранится в live_counters; с новым днём отправляется и закрепляется новое,
+а вчерашнее открепляется.
+Правки ограничены одной в LIVE_COUNTER_INTERVAL секунд (по умолчанию 5) на сообщение:
+слот правки захватывается атомарно в БД, так что параллельные инстансы не правят одно
+сообщение одновременно. Ответ, не получивший слот, помечает счётчик dirty. Таймеров нет
+(serverless-инстанс замораживается после ответа): dirty-счётчики чата, у которых интервал
+уже прошёл, дописывает следующий touch, а хвост последней пачки — cron-действие
+flush_live_counters в sweep-api (flush_pending).
+"""
+
+import html
+import os
+
+from sweep_shared.db import get_db, get_schema, release_db
+from sweep_shared.metrics import log_event
+from sweep_shared.msk import MSK_TODAY_SQL, MSK_TODAY_START_SQL, now_msk
+from sweep_shared.telegram import api_request
+
+INTERVAL = float(os.environ.get("LIVE_COUNTER_INTERVAL", "5"))
+
+
+def claim(cur, chat_id, restaurant_id):
+    """
+    Захватывает слот правки -> (claimed, message_id, previous_id). Новый день сбрасывает message_id,
+    а сообщение прошлого дня возвращается в previous_id (previous читает строку до этого UPDATE);
+    без слота счётчик помечается dirty.
+    """
+    schema = get_schema()
+    cur.execute(f"""
+        WITH previous AS (
+            SELECT message_id FROM {schema}live_counters
+            WHERE chat_id = %(chat_id)s AND restaurant_id = %(restaurant_id)s AND day <> {MSK_TODAY_SQL}
+        )
+        INSERT INTO {schema}live_counters (chat_id, restaurant_id, day, edited_at, dirty)
+        VALUES (%(chat_id)s, %(restaurant_id)s, {MSK_TODAY_SQL}, NOW(), false)
+        ON CONFLICT (chat_id, restaurant_id) DO UPDATE SET
+            dirty = live_counters.day = {MSK_TODAY_SQL}
+                AND live_counters.edited_at > NOW() - %(interval)s * INTERVAL '1 second',
+            edited_at = CASE WHEN live_counters.day = {MSK_TODAY_SQL}
+                AND live_counters.edited_at > NOW() - %(interval)s * INTERVAL '1 second'
+                THEN live_counters.edited_at ELSE NOW() END,
+            message_id = CASE WHEN live_counters.day = {MSK_TODAY_SQL} THEN live_counters.message_id END,
+            day = {MSK_TODAY_SQL}
+        RETURNING NOT dirty, message_id, (SELECT message_id FROM previous)
+    """, {"chat_id": str(chat_id), "restaurant_id": restaurant_id, "interval": INTERVAL})
+    return cur.fetchone()
+
+
+def claim_dirty(cur, chat_id=None):
+    """Слоты для отложенных правок: dirty-счётчики, у которых интервал прошёл -> [(chat_id, restaurant_id, message_id)]."""
+    sql = (
+        f"UPDATE {get_schema()}live_counters SET dirty = false, edited_at = NOW() "
+        f"WHERE dirty AND day = {MSK_TODAY_SQL} AND edited_at <= NOW() - %s * INTERVAL '1 second'"
+    )
+    args = [INTERVAL]
+    if chat_id is not None:
+        sql += " AND chat_id = %s"
+        args.append(str(chat_id))
+    cur.execute(sql + " RETURNING chat_id, restaurant_id, message_id", args)
+    return cur.fetchall()
+
+
+def render(cur, restaurant_id):
+    """Текст сообщения: итог за сегодня и разбивка по источникам — одним запросом."""
+    schema = get_schema()
+    cur.execute(f"""
+        SELECT r.name, COALESCE(o.label, x.source), x.cnt
+        FROM {schema}restaurants r
+        LEFT JOIN (
+            SELECT source, COUNT(*)::int AS cnt FROM {schema}responses
+            WHERE restaurant_id = %(rid)s AND created_at >= {MSK_TODAY_START_SQL} GROUP BY source
+        ) x ON TRUE
+        LEFT JOIN {schema}source_options o ON o.key = x.source
+        WHERE r.id = %(rid)s
+        ORDER BY x.cnt DESC NULLS LAST
+    """, {"rid": restaurant_id})
+    rows = cur.fetchall()
+    if not rows:
+        return None
+    total = sum(r[2] or 0 for r in rows)
+    lines = [f"📊 <b>Сегодня</b> · 🏪 {html.escape(rows[0][0])} — {total}"]
+    lines += [f"   • {html.escape(label)}: {cnt}" for _, label, cnt in rows if cnt]
+    # время в тексте делает каждую правку отличной от предыдущей
+    lines.append(f"🕐 обновлено {now_msk().strftime('%H:%M:%S')} МСК")
+    return "\n".join(lines)
+
+
+def publish(cur, chat_id, restaurant_id, message_id):
+    """Правит сообщение или отправляет и закрепляет новое; id нового сохраняется (commit — на вызывающем)."""
+    text = render(cur, restaurant_id)
+    if text is None:
+        return
+    if message_id:
+        _, error = api_request("editMessageText", {
+            "chat_id": chat_id, "message_id": message_id, "text": text, "parse_mode": "HTML",
+        })
+        if error is None or "message is not modified" in error:
+            return
+        if "message to edit not found" not in error and "message can't be edited" not in error:
+            # сбой сети или лимит — повторит следующая правка
+            mark_dirty(cur, chat_id, restaurant_id)
+            return
+    result, _ = api_request("sendMessage", {
+        "chat_id": chat_id, "text": text, "parse_mode": "HTML", "disable_notification": True,
+    })
+    if not result:
+        mark_dirty(cur, chat_id, restaurant_id)
+        return
+    api_request("pinChatMessage", {
+        "chat_id": chat_id, "message_id": result["message_id"], "disable_notification": True,
+    })
+    cur.execute(
+        f"UPDATE {get_schema()}live_counters SET message_id = %s WHERE chat_id = %s AND restaurant_id = %s",
+        (result["message_id"], str(chat_id), restaurant_id),
+    )
+
+
+def mark_dirty(cur, chat_id, restaurant_id):
+    cur.execute(
+        f"UPDATE {get_schema()}live_counters SET dirty = true WHERE chat_id = %s AND restaurant_id = %s",
+        (str(chat_id), restaurant_id),
+    )
+
+
+def publish_dirty(cur, conn, chat_id=None) -> int:
+    """Дописывает dirty-счётчики, у которых интервал прошёл (все или одного чата) -> сколько правок."""
+    pending = claim_dirty(cur, chat_id)
+    conn.commit()
+    for pending_chat, restaurant_id, message_id in pending:
+        try:
+            publish(cur, pending_chat, restaurant_id, message_id)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            log_event("error", where="live_counter_flush", error=repr(e))
+    return len(pending)
+
+
+def touch(chat_id, restaurant_id):
+    """
+    Счётчик ресторана изменился (после commit ответа): правка сейчас, если интервал прошёл,
+    иначе счётчик остаётся dirty. Заодно дописываются отложенные счётчики этого чата.
+    """
+    conn = get_db()
+    try:
+        cur = conn.cursor()
+        claimed, message_id, previous_id = claim(cur, chat_id, restaurant_id)
+        conn.commit()
+        if previous_id:
+            # вчерашний счётчик больше не обновляется: открепляем, чтобы закреплённым был только сегодняшний
+            api_request("unpinChatMessage", {"chat_id": chat_id, "message_id": previous_id})
+        if claimed:
+            publish(cur, chat_id, restaurant_id, message_id)
+            conn.commit()
+        publish_dirty(cur, conn, chat_id)
+        cur.close()
+    finally:
+        release_db(conn)
+
+
+def flush_pending() -> int:
+    """Дописывает все отложенные счётчики (cron): хвост пачки, после которой ответов не было."""
+    conn = get_db()
+    try:
+        cur = conn.cursor()
+        flushed = publish_dirty(cur, conn)
+        cur.close()
+        return flushed
+    finally:
+        release_db(conn)
@@ -0,0 +1,38 @@
+"""
+JSON-ответы и CORS-заголовки для обработчиков функций.
+"""
+
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj) -> str:
+    """JSON-кодирование: orjson, если установлен, иначе stdlib."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, default=str)
+
+
+def cors_headers(methods="POST, OPTIONS", allow_headers="Content-Type") -> dict:
+    return {
+        "Access-Control-Allow-Origin": os.environ.get("ALLOWED_ORIGINS", "*"),
+        "Access-Control-Allow-Methods": methods,
+        "Access-Control-Allow-Headers": allow_headers,
+    }
+
+
+def json_response(status: int, body, headers: dict) -> dict:
+    return {
+        "statusCode": status,
+        "headers": {**headers, "Content-Type": "application/json"},
+        "body": dumps(body),
+    }
+
+
+def options_response(headers: dict, status: int = 204) -> dict:
+    return {"statusCode": status, "headers": headers, "body": ""}
@@ -0,0 +1,68 @@
+"""
+Копирует общий пакет sweep_shared в каждую функцию (функции деплоятся по отдельности
+и видят только свою папку) и зеркалирует index.py функций-дубликатов.
+
+    python backend/shared/sync.py          # обновить копии
+    python backend/shared/sync.py --check  # только проверить, что копии совпадают с исходником
+"""
+
+import filecmp
+import shutil
+import sys
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent
+PACKAGE = Path(__file__).resolve().parent / "sweep_shared"
+
+TARGETS = [
+    "sweep-api",
+    "telegram-auth",
+    "telegram-bot",
+    "extensions/telegram-bot/telegram-auth",
+    "extensions/telegram-bot/telegram-bot",
+]
+
+# копия функции -> исходная функция
+MIRRORS = {
+    "extensions/telegram-bot/telegram-auth/index.py": "telegram-auth/index.py",
+}
+
+
+def planned_copies():
+    sources = sorted(p for p in PACKAGE.glob("*.py"))
+    for target in TARGETS:
+        for src in sources:
+            yield src, BACKEND / target / "sweep_shared" / src.name
+    for dst, src in MIRRORS.items():
+        yield BACKEND / src, BACKEND / dst
+
+
+def stale_files(target):
+    """Лишние файлы в копии пакета, которых уже нет в исходнике."""
+    names = {p.name for p in PACKAGE.glob("*.py")}
+    copy_dir = BACKEND / target / "sweep_shared"
+    return [p for p in copy_dir.glob("*.py") if p.name not in names] if copy_dir.exists() else []
+
+
+def main(argv):
+    check = "--check" in argv
+    outdated = []
+    for src, dst in planned_copies():
+        if dst.exists() and filecmp.cmp(src, dst, shallow=False):
+            continue
+        outdated.append(dst)
+        if not check:
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(src, dst)
+    for target in TARGETS:
+        for path in stale_files(target):
+            outdated.append(path)
+            if not check:
+                path.unlink()
+    for path in outdated:
+        print(("outdated: " if check else "synced: ") + str(path.relative_to(BACKEND)))
+    return 1 if check and outdated else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -4,21 +4,30 @@ import hashlib
 import hmac
 import time
 import secrets
-import psycopg2
-from datetime import datetime, timedelta, timezone
+import jwt
+from collections import OrderedDict
+from datetime import datetime, timedelta
 
-MSK = timezone(timedelta(hours=3))
-SECRET_KEY = "sweep-ref-secret-2024"
+from sweep_shared import live_counter, prepared
+from sweep_shared.archive import archivable_months, archive_month, iter_archived_rows
+from sweep_shared.db import get_db, release_db, release_all, run_concurrently
+from sweep_shared.importer import ImportFailed, import_text
+from sweep_shared.metrics import instrumented, log_event, set_action, snapshot
+from sweep_shared.msk import MSK_TODAY_START_SQL, now_msk
+from sweep_shared.settings import get_setting, get_settings, set_setting
+from sweep_shared.summary import render_summary, split_html, summary_aggregate, summary_pages
+from sweep_shared.telegram import send_message
+from sweep_shared.web import dumps
 
-def now_msk():
-    return datetime.now(MSK)
+SECRET_KEY = "sweep-ref-secret-2024"
 
 def make_token(user_id):
     payload = f"{user_id}:{int(time.time()) + 86400 * 7}"
     sig = hmac.new(SECRET_KEY.encode(), payload.encode(), hashlib.sha256).hexdigest()[:16]
     return f"{payload}:{sig}"
 
-def verify_token(token):
+def verify_legacy_token(token):
+    """Токен make_token -> (user_id, exp) или None."""
     try:
         parts = token.split(":")
         if len(parts) != 3:
@@ -27,19 +36,124 @@ def verify_token(token):
         if int(exp) < int(time.time()):
             return None
         expected = hmac.new(SECRET_KEY.encode(), f"{user_id}:{exp}".encode(), hashlib.sha256).hexdigest()[:16]
-        if sig != expected:
+        if not hmac.compare_digest(sig, expected):
             return None
-        return int(user_id)
+        return int(user_id), int(exp)
     except:
         return None
 
+def get_telegram_admins():
+    """users.id из telegram-auth, которым разрешён доступ к админке (ADMIN_TELEGRAM_USERS через запятую)."""
+    raw = os.environ.get("ADMIN_TELEGRAM_USERS", "")
+    return {int(x) for x in raw.split(",") if x.strip().isdigit()}
+
+def verify_jwt(token):
+    """Access-токен telegram-auth (HS256, JWT_SECRET) -> (user_id, exp) или None."""
+    secret = os.environ.get("JWT_SECRET", "")
+    if not secret:
+        return None
+    try:
+        payload = jwt.decode(token, secret, algorithms=["HS256"])
+    except jwt.PyJWTError:
+        return None
+    user_id = payload.get("user_id")
+    if user_id not in get_telegram_admins():
+        return None
+    return user_id, int(payload["exp"])
+
+# LRU уже проверенных токенов: token -> (kind, user_id, exp); запись живёт не дольше exp токена
+TOKEN_CACHE_SIZE = 256
+_token_cache = OrderedDict()
+
+def verify_token(token):
+    """Единая проверка токена админки -> (kind, user_id), kind: "admin" | "telegram"."""
+    if not token:
+        return None
+    now = time.time()
+    cached = _token_cache.get(token)
+    if cached:
+        kind, user_id, exp = cached
+        if exp > now:
+            _token_cache.move_to_end(token)
+            return kind, user_id
+        del _token_cache[token]
+        return None
+    if token.count(".") == 2:
+        kind, verified = "telegram", verify_jwt(token)
+    else:
+        kind, verified = "admin", verify_legacy_token(token)
+    if not verified:
+        return None
+    user_id, exp = verified
+    _token_cache[token] = (kind, user_id, exp)
+    while len(_token_cache) > TOKEN_CACHE_SIZE:
+        _token_cache.popitem(last=False)
+    return kind, user_id
+
+def authenticate(event):
+    headers = event.get("headers") or {}
+    auth = headers.get("X-Authorization", "") or headers.get("Authorization", "")
+    return verify_token(auth.replace("Bearer ", ""))
+
 def check_auth(event):
-    auth = event.get("headers", {}).get("X-Authorization", "") or event.get("headers", {}).get("Authorization", "")
-    token = auth.replace("Bearer ", "")
-    return verify_token(token)
+    principal = authenticate(event)
+    return principal[1] if principal else None
 
-def get_db():
-    return psycopg2.connect(os.environ["DATABASE_URL"])
+def check_maintenance(event):
+    """Вызов от cron: заголовок X-Maintenance-Key совпадает с MAINTENANCE_KEY (как cleanup в telegram-auth)."""
+    expected = os.environ.get("MAINTENANCE_KEY", "")
+    headers = event.get("headers") or {}
+    provided = headers.get("X-Maintenance-Key") or headers.get("x-maintenance-key") or ""
+    return bool(expected) and hmac.compare_digest(provided, expected)
+
+def hostess_token_secret():
+    """Ключ подписи сессий хостес (HOSTESS_TOKEN_SECRET); без него сессии не выдаются и не принимаются."""
+    return os.environ.get("HOSTESS_TOKEN_SECRET", "")
+
+def make_hostess_token(restaurant_id):
+    """
+    Короткоживущая сессия хостес после проверки пароля ресторана (HOSTESS_TOKEN_TTL, по умолчанию 12 ч).
+    Без HOSTESS_TOKEN_SECRET -> None: хостес работает без сессии, если HOSTESS_TOKEN_REQUIRED не включён.
+    """
+    secret = hostess_token_secret()
+    if not secret:
+        log_event("error", where="make_hostess_token", error="HOSTESS_TOKEN_SECRET is not set")
+        return None
+    exp = int(time.time()) + int(os.environ.get("HOSTESS_TOKEN_TTL", "43200"))
+    payload = f"hostess:{restaurant_id}:{exp}"
+    sig = hmac.new(secret.encode(), payload.encode(), hashlib.sha256).hexdigest()[:32]
+    return f"{payload}:{sig}"
+
+def verify_hostess_token(token):
+    """Токен make_hostess_token -> restaurant_id или None."""
+    secret = hostess_token_secret()
+    parts = (token or "").split(":")
+    if not secret or len(parts) != 4 or parts[0] != "hostess" or not parts[1].isdigit() or not parts[2].isdigit():
+        return None
+    if int(parts[2]) < int(time.time()):
+        return None
+    expected = hmac.new(secret.encode(), ":".join(parts[:3]).encode(), hashlib.sha256).hexdigest()[:32]
+    if not hmac.compare_digest(parts[3], expected):
+        return None
+    return int(parts[1])
+
+def hostess_restaurant(body):
+    """
+    restaurant_id для add_response/undo_response.
+    С hostess_token ресторан берётся из токена; без него — из тела, если HOSTESS_TOKEN_REQUIRED не включён.
+    -> (restaurant_id, None) или (None, (статус, ошибка)).
+    """
+    token = body.get("hostess_token")
+    if token:
+        rid = verify_hostess_token(token)
+        if rid is None:
+            return None, (401, "Invalid hostess session")
+        if body.get("restaurant_id") and str(body["restaurant_id"]) != str(rid):
+            return None, (403, "Hostess session is for another restaurant")
+        return rid, None
+    if os.environ.get("HOSTESS_TOKEN_REQUIRED", "") in ("1", "true"):
+        return None, (401, "Hostess session required")
+    return body.get("restaurant_id"), None
 
 def generate_password():
     return secrets.token_urlsafe(8)
@@ -63,44 +177,421 @@ def transliterate(text):
     return slug or 'restaurant'
 
 def resp(status, body_dict, cors):
-    return {"statusCode": status, "headers": cors, "body": json.dumps(body_dict, default=str)}
+    return {"statusCode": status, "headers": cors, "body": dumps(body_dict)}
 
-def get_setting(cur, key, default=""):
-    cur.execute("SELECT value FROM app_settings WHERE key = %s", (key,))
-    row = cur.fetchone()
-    return row[0] if row else default
+def resp_raw(status, body_dict, raw_fields, cors):
+    """Ответ, в который вставляются уже готовые JSON-фрагменты (например, из json_agg в Postgres)."""
+    body = dumps(body_dict)
+    parts = [f"{dumps(k)}: {v}" for k, v in raw_fields.items()]
+    if parts:
+        sep = ", " if len(body) > 2 else ""
+        body = body[:-1] + sep + ", ".join(parts) + "}"
+    return {"statusCode": status, "headers": cors, "body": body}
+
+# горячие запросы хостес: PREPARE один раз на соединение, дальше EXECUTE по имени; «сегодня» — сутки МСК
+prepared.register("restaurant_by_slug", "SELECT id, name, slug FROM restaurants WHERE slug = %s")
+prepared.register(
+    "insert_response",
+    "INSERT INTO responses (restaurant_id, source, request_key) VALUES (%s, %s, %s) "
+    "ON CONFLICT (request_key) WHERE request_key IS NOT NULL DO NOTHING RETURNING id, created_at",
+)
+prepared.register(
+    "today_count", f"SELECT COUNT(*) FROM responses WHERE restaurant_id = %s AND created_at >= {MSK_TODAY_START_SQL}",
+)
+prepared.register(
+    "hostess_bootstrap",
+    "SELECT r.id, r.name, r.slug, r.password_hash, "
+    "(SELECT COALESCE(json_agg(json_build_object('key', key, 'label', label, 'icon', icon) ORDER BY sort_order), '[]') "
+    " FROM source_options WHERE active = true), "
+    "(SELECT COALESCE(json_object_agg(source, cnt), '{}') FROM ("
+    "  SELECT source, COUNT(*) AS cnt FROM responses"
+    f"  WHERE restaurant_id = r.id AND created_at >= {MSK_TODAY_START_SQL} GROUP BY source) c) "
+    "FROM restaurants r WHERE r.slug = %s",
+)
 
-def set_setting(cur, key, value):
+RESPONSES_ORDER = " FROM responses ORDER BY created_at"
+
+def fetch_restaurants_admin(cur):
+    cur.execute("SELECT id, name, slug, password_hash FROM restaurants ORDER BY id")
+    return [{"id": r[0], "name": r[1], "slug": r[2], "has_password": bool(r[3])} for r in cur.fetchall()]
+
+def fetch_source_options(cur):
+    cur.execute("SELECT id, key, label, icon, sort_order, active FROM source_options ORDER BY sort_order")
+    return [
+        {"id": r[0], "key": r[1], "label": r[2], "icon": r[3], "sort_order": r[4], "active": r[5]}
+        for r in cur.fetchall()
+    ]
+
+def fetch_responses(cur, fmt):
+    """Ответы в формате rows (список объектов) или columnar (колонки, время — epoch-секунды)."""
+    if fmt == "columnar":
+        cur.execute("SELECT id, restaurant_id, source, EXTRACT(EPOCH FROM created_at)::bigint" + RESPONSES_ORDER)
+        rows = cur.fetchall()
+        ids, rids, sources, ts = (list(c) for c in zip(*rows)) if rows else ([], [], [], [])
+        return {"ids": ids, "restaurant_ids": rids, "sources": sources, "ts": ts}
+    cur.execute("SELECT id, restaurant_id, source, created_at" + RESPONSES_ORDER)
+    return [
+        {"id": rid, "restaurant_id": restaurant_id, "source": source, "created_at": created_at.isoformat()}
+        for rid, restaurant_id, source, created_at in cur.fetchall()
+    ]
+
+def fetch_responses_json(cur, fmt):
+    """То же, что fetch_responses, но JSON собирается в Postgres через json_agg — без Python-объектов на строку."""
+    if fmt == "columnar":
+        cur.execute(
+            "SELECT json_build_object("
+            "'ids', COALESCE(json_agg(id ORDER BY created_at), '[]'::json), "
+            "'restaurant_ids', COALESCE(json_agg(restaurant_id ORDER BY created_at), '[]'::json), "
+            "'sources', COALESCE(json_agg(source ORDER BY created_at), '[]'::json), "
+            "'ts', COALESCE(json_agg(EXTRACT(EPOCH FROM created_at)::bigint ORDER BY created_at), '[]'::json)"
+            ")::text FROM responses"
+        )
+    else:
+        cur.execute(
+            "SELECT COALESCE(json_agg(json_build_object("
+            "'id', id, 'restaurant_id', restaurant_id, 'source', source, 'created_at', created_at"
+            ") ORDER BY created_at), '[]'::json)::text FROM responses"
+        )
+    return cur.fetchone()[0]
+
+DASHBOARD_VIEWS = ("mv_daily_totals", "mv_restaurant_totals", "mv_source_totals")
+VIEWS_REFRESH_LOCK = 30001
+# представления старше этого (секунды) быстрый get_stats не читает, а считает то же по hourly_counts
+VIEWS_MAX_AGE = int(os.environ.get("VIEWS_MAX_AGE", "900"))
+# определения представлений (V0006, V0016) для чтения в обход них
+LIVE_TOTALS = {
+    "mv_daily_totals": "(SELECT restaurant_id, source, hour_msk::date AS day_msk, SUM(count)::int AS count "
+                       "FROM hourly_counts GROUP BY 1, 2, 3) v",
+    "mv_restaurant_totals": "(SELECT restaurant_id, SUM(count)::int AS count FROM hourly_counts GROUP BY 1) v",
+    "mv_source_totals": "(SELECT source, SUM(count)::int AS count FROM hourly_counts GROUP BY 1) v",
+}
+
+def views_age_seconds(cur):
+    """Сколько секунд назад обновлялись материализованные представления; None — никогда."""
+    value = get_setting(cur, "views_refreshed_at", "", max_age=0)
+    if not value.isdigit():
+        return None
+    return max(0, int(time.time()) - int(value))
+
+def refresh_dashboard_views(cur):
+    """REFRESH CONCURRENTLY всех представлений дашборда. False — обновление уже идёт в другой транзакции."""
+    cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (VIEWS_REFRESH_LOCK,))
+    if not cur.fetchone()[0]:
+        return False
+    for view in DASHBOARD_VIEWS:
+        cur.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}")
+    set_setting(cur, "views_refreshed_at", str(int(time.time())))
+    return True
+
+def fetch_dashboard_totals(cur, live=False):
+    """Итоги дашборда из представлений; live=True — те же запросы прямо по hourly_counts."""
+    src = LIVE_TOTALS if live else {view: view for view in DASHBOARD_VIEWS}
+    cur.execute(f"SELECT restaurant_id, source, day_msk, count FROM {src['mv_daily_totals']} ORDER BY day_msk")
+    daily = [
+        {"restaurant_id": rid, "source": source, "day": day.isoformat(), "count": cnt}
+        for rid, source, day, cnt in cur.fetchall()
+    ]
+    cur.execute(f"SELECT restaurant_id, count FROM {src['mv_restaurant_totals']}")
+    by_restaurant = {rid: cnt for rid, cnt in cur.fetchall()}
+    cur.execute(f"SELECT source, count FROM {src['mv_source_totals']}")
+    by_source = {source: cnt for source, cnt in cur.fetchall()}
+    return {"daily": daily, "by_restaurant": by_restaurant, "by_source": by_source}
+
+def fetch_fast_totals(cur):
+    """-> (итоги, возраст представлений, live): старше VIEWS_MAX_AGE или не обновлявшиеся — в обход них."""
+    age = views_age_seconds(cur)
+    live = age is None or age > VIEWS_MAX_AGE
+    return fetch_dashboard_totals(cur, live), age, live
+
+def parse_date(value):
+    """'YYYY-MM-DD' -> date; None, если значение пустое или некорректное."""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+def heatmap_matrix(cur, date_from, date_to, restaurant_id=None, source=None):
+    """Матрица день недели × час (МСК) из hourly_counts за [date_from, date_to] включительно."""
+    where = ["hour_msk >= %s", "hour_msk < %s"]
+    args = [date_from, date_to + timedelta(days=1)]
+    if restaurant_id:
+        where.append("restaurant_id = %s")
+        args.append(restaurant_id)
+    if source:
+        where.append("source = %s")
+        args.append(source)
     cur.execute(
-        "INSERT INTO app_settings (key, value, updated_at) VALUES (%s, %s, NOW()) "
-        "ON CONFLICT (key) DO UPDATE SET value = %s, updated_at = NOW()",
-        (key, value, value),
+        "SELECT EXTRACT(ISODOW FROM hour_msk)::int - 1 AS dow, EXTRACT(HOUR FROM hour_msk)::int AS hour, SUM(count) "
+        "FROM hourly_counts WHERE " + " AND ".join(where) + " GROUP BY dow, hour",
+        args,
     )
+    matrix = [[0] * 24 for _ in range(7)]
+    total = 0
+    for dow, hour, cnt in cur.fetchall():
+        matrix[dow][hour] = int(cnt)
+        total += int(cnt)
+    return {"from": date_from.isoformat(), "to": date_to.isoformat(), "matrix": matrix, "total": total}
+
+def msk_range(date_from, date_to):
+    """Даты МСК [date_from, date_to] -> границы hour_msk (МСК) и created_at (UTC)."""
+    start = datetime.combine(date_from, datetime.min.time())
+    end = datetime.combine(date_to + timedelta(days=1), datetime.min.time())
+    return start, end, start - timedelta(hours=3), end - timedelta(hours=3)
+
+def reconcile_hourly_counts(cur, date_from, date_to, repair=False):
+    """
+    Сверяет hourly_counts с сырыми responses за период; при repair пересобирает период целиком.
+    Архивные месяцы пропускаются: их строк в responses уже нет, а hourly_counts хранит итоги.
+    """
+    start, end, raw_start, raw_end = msk_range(date_from, date_to)
+    cur.execute("SELECT DISTINCT month_msk FROM archived_files")
+    archived = [r[0] for r in cur.fetchall()]
+    live = "date_trunc('month', hour_msk)::date <> ALL(%s::date[])"
+    if repair:
+        cur.execute("LOCK TABLE hourly_counts IN SHARE ROW EXCLUSIVE MODE")
+    cur.execute(
+        "WITH raw AS ("
+        " SELECT restaurant_id, source, date_trunc('hour', created_at + INTERVAL '3 hours') AS hour_msk, COUNT(*)::int AS cnt"
+        " FROM responses WHERE created_at >= %s AND created_at < %s GROUP BY 1, 2, 3"
+        "), roll AS ("
+        " SELECT restaurant_id, source, hour_msk, count AS cnt FROM hourly_counts WHERE hour_msk >= %s AND hour_msk < %s"
+        ") "
+        "SELECT restaurant_id, source, hour_msk, COALESCE(raw.cnt, 0), COALESCE(roll.cnt, 0) "
+        "FROM raw FULL OUTER JOIN roll USING (restaurant_id, source, hour_msk) "
+        f"WHERE raw.cnt IS DISTINCT FROM roll.cnt AND {live} ORDER BY hour_msk",
+        (raw_start, raw_end, start, end, archived),
+    )
+    mismatches = [
+        {"restaurant_id": r[0], "source": r[1], "hour_msk": r[2].isoformat(), "raw": r[3], "rollup": r[4]}
+        for r in cur.fetchall()
+    ]
+    if repair and mismatches:
+        cur.execute(f"DELETE FROM hourly_counts WHERE hour_msk >= %s AND hour_msk < %s AND {live}", (start, end, archived))
+        cur.execute(
+            "INSERT INTO hourly_counts (restaurant_id, source, hour_msk, count) "
+            "SELECT restaurant_id, source, hour_msk, COUNT(*) FROM ("
+            " SELECT restaurant_id, source, date_trunc('hour', created_at + INTERVAL '3 hours') AS hour_msk"
+            f" FROM responses WHERE created_at >= %s AND created_at < %s) r WHERE {live} GROUP BY 1, 2, 3",
+            (raw_start, raw_end, archived),
+        )
+    return mismatches
+
+MAX_BULK_IDS = 10000
+MAX_IMPORT_ROWS = 200000
+
+def responses_filter(body):
+    """
+    Условие WHERE для массовых операций над responses: список ids либо фильтр
+    {restaurant_id, source, date_from, date_to} (даты МСК, включительно).
+    -> (условия, параметры) или (None, текст ошибки).
+    """
+    ids = body.get("ids")
+    if ids is not None:
+        try:
+            ids = [int(i) for i in ids]
+        except (TypeError, ValueError):
+            return None, "ids must be a list of response ids"
+        if not ids or len(ids) > MAX_BULK_IDS:
+            return None, f"ids must contain 1..{MAX_BULK_IDS} items"
+        return ["id = ANY(%s::int[])"], [ids]
+    flt = body.get("filter") or {}
+    where, args = [], []
+    if flt.get("restaurant_id"):
+        where.append("restaurant_id = %s")
+        args.append(flt["restaurant_id"])
+    if flt.get("source"):
+        where.append("source = %s")
+        args.append(flt["source"])
+    date_from, date_to = parse_date(flt.get("date_from")), parse_date(flt.get("date_to"))
+    if date_from:
+        where.append("created_at >= %s")
+        args.append(msk_range(date_from, date_from)[2])
+    if date_to:
+        where.append("created_at < %s")
+        args.append(msk_range(date_to, date_to)[3])
+    if not where:
+        return None, "Specify ids or a filter"
+    return where, args
 
 def send_telegram(chat_id, text):
-    bot_token = os.environ.get("TELEGRAM_BOT_TOKEN", "")
-    if not bot_token or not chat_id:
-        return
-    import urllib.request
+    send_message(chat_id, text)
+
+def live_counter_chat(settings):
+    """Чат, где вместо сообщения на каждый ответ обновляется закреплённый счётчик; "" — режим выключен."""
+    if settings.get("telegram_notifications_enabled") != "true" or settings.get("telegram_live_counter") != "true":
+        return ""
+    return settings.get("telegram_chat_id", "")
+
+def touch_live_counter(chat_id, restaurant_id):
+    """Правка живого счётчика после commit ответа: её сбой не превращает сохранённый ответ в ошибку."""
+    try:
+        live_counter.touch(chat_id, int(restaurant_id))
+    except Exception as e:
+        log_event("error", where="live_counter_touch", error=repr(e))
+
+# add_response не входит: ключ тапа хранится в responses.request_key (см. add_response)
+IDEMPOTENT_ACTIONS = frozenset({
+    "undo_response", "save_settings", "test_telegram", "send_summary_telegram",
+    "create_restaurant", "rename_restaurant", "delete_restaurant", "reset_restaurant_password",
+    "change_password", "update_source", "create_source", "delete_source", "reorder_sources",
+    "delete_response", "delete_responses", "import_responses", "clear_responses", "reconcile_rollups",
+    "archive_months",
+})
+IDEMPOTENCY_LEASE_SECONDS = 60
+IDEMPOTENCY_CLEANUP_BATCH = 1000
+# поля ответа, которые не сохраняются в idempotency_keys
+SECRET_RESPONSE_FIELDS = ("password",)
+# повтор этих action выдаёт ресторану новый пароль вместо потерянного (см. reissue_password)
+PASSWORD_ACTIONS = frozenset({"create_restaurant", "reset_restaurant_password"})
+
+def get_idempotency_key(event):
+    headers = event.get("headers") or {}
+    key = (headers.get("Idempotency-Key", "") or headers.get("idempotency-key", "")).strip()
+    return key[:200]
+
+def redact_response(text):
+    """Тело ответа для хранения: значения SECRET_RESPONSE_FIELDS заменяются на null."""
     try:
-        data = json.dumps({"chat_id": chat_id, "text": text, "parse_mode": "HTML"}).encode()
-        req = urllib.request.Request(
-            f"https://api.telegram.org/bot{bot_token}/sendMessage",
-            data=data, headers={"Content-Type": "application/json"}, method="POST",
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        return text
+    if not isinstance(data, dict) or not any(data.get(f) is not None for f in SECRET_RESPONSE_FIELDS):
+        return text
+    return dumps({**data, **{f: None for f in SECRET_RESPONSE_FIELDS if f in data}, "redacted": True})
+
+def set_restaurant_password(cur, restaurant_id):
+    """Новый случайный пароль ресторана -> пароль открытым текстом (в базе только sha256)."""
+    pw = generate_password()
+    cur.execute(
+        "UPDATE restaurants SET password_hash = %s WHERE id = %s",
+        (hashlib.sha256(pw.encode()).hexdigest(), restaurant_id),
+    )
+    return pw
+
+def reissue_password(body, response):
+    """
+    Повтор create_restaurant/reset_restaurant_password: пароль первого ответа не сохранён,
+    поэтому ресторану выдаётся новый и возвращается вместе с остальным сохранённым ответом.
+    """
+    data = json.loads(response)
+    if not data.pop("redacted", False):
+        return response
+    conn = get_db()
+    cur = conn.cursor()
+    data["password"] = set_restaurant_password(cur, data.get("id") or body.get("restaurant_id"))
+    conn.commit()
+    cur.close()
+    release_db(conn)
+    return dumps(data)
+
+def cleanup_idempotency_keys(cur):
+    """Удаляет просроченные ключи пачками по IDEMPOTENCY_CLEANUP_BATCH -> сколько удалено."""
+    removed = 0
+    while True:
+        cur.execute(
+            "DELETE FROM idempotency_keys WHERE ctid IN ("
+            "SELECT ctid FROM idempotency_keys WHERE expires_at <= NOW() LIMIT %s FOR UPDATE SKIP LOCKED)",
+            (IDEMPOTENCY_CLEANUP_BATCH,),
         )
-        urllib.request.urlopen(req, timeout=5)
-    except:
-        pass
+        removed += cur.rowcount
+        if cur.rowcount < IDEMPOTENCY_CLEANUP_BATCH:
+            return removed
+
+def idempotency_auth_error(event, body, action):
+    """
+    Та же проверка доступа, что в самом action, но до резервирования ключа: иначе запрос
+    без авторизации занимал бы строки idempotency_keys. -> (статус, ошибка) или None.
+    """
+    if action == "undo_response":
+        return hostess_restaurant(body)[1]
+    if authenticate(event) is None:
+        return 401, "Unauthorized"
+    return None
+
+def run_idempotent(key, action, event, body, cors, execute):
+    """
+    Выполняет мутирующий action не более одного раза на Idempotency-Key.
+    Повтор с тем же ключом отдаёт сохранённый ответ без повторного выполнения (и без уведомлений).
+    Ключ сначала резервируется на IDEMPOTENCY_LEASE_SECONDS; сохраняются только успешные ответы,
+    секреты (SECRET_RESPONSE_FIELDS) — без значений, с пометкой "redacted"; пароль при повторе
+    выдаётся заново (PASSWORD_ACTIONS).
+    """
+    # запрос привязан к телу и к токену: чужой ключ не отдаст сохранённый ответ без той же авторизации
+    headers = event.get("headers") or {}
+    auth = headers.get("X-Authorization", "") or headers.get("Authorization", "")
+    request_hash = hashlib.sha256(dumps(body).encode() + b"\0" + auth.encode()).hexdigest()
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT request_hash, status, response FROM idempotency_keys "
+        "WHERE key = %s AND action = %s AND expires_at > NOW()",
+        (key, action),
+    )
+    row = cur.fetchone()
+    if row is None:
+        cur.execute(
+            "INSERT INTO idempotency_keys (key, action, request_hash, expires_at) "
+            "VALUES (%s, %s, %s, NOW() + %s * INTERVAL '1 second') "
+            "ON CONFLICT (key, action) DO UPDATE SET request_hash = EXCLUDED.request_hash, status = NULL, "
+            "response = NULL, created_at = NOW(), expires_at = EXCLUDED.expires_at "
+            "WHERE idempotency_keys.expires_at <= NOW() RETURNING key",
+            (key, action, request_hash, IDEMPOTENCY_LEASE_SECONDS),
+        )
+        reserved = cur.fetchone() is not None
+        conn.commit()
+        if not reserved:
+            cur.close()
+            release_db(conn)
+            return resp(409, {"error": "Request with this Idempotency-Key is in progress"}, cors)
+    else:
+        cur.close()
+        release_db(conn)
+        stored_hash, status, response = row
+        if stored_hash != request_hash:
+            return resp(422, {"error": "Idempotency-Key was used with a different request"}, cors)
+        if status is None:
+            return resp(409, {"error": "Request with this Idempotency-Key is in progress"}, cors)
+        if action in PASSWORD_ACTIONS:
+            response = reissue_password(body, response)
+        return {"statusCode": status, "headers": {**cors, "Idempotent-Replayed": "true"}, "body": response}
+
+    result = None
+    try:
+        result = execute()
+    finally:
+        if result is not None and 200 <= result["statusCode"] < 300:
+            ttl = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", "86400"))
+            cur.execute(
+                "UPDATE idempotency_keys SET status = %s, response = %s, expires_at = NOW() + %s * INTERVAL '1 second' "
+                "WHERE key = %s AND action = %s",
+                (result["statusCode"], redact_response(result["body"]), ttl, key, action),
+            )
+        else:
+            # ошибка — ничего не сохраняем, клиент может повторить с тем же ключом
+            cur.execute("DELETE FROM idempotency_keys WHERE key = %s AND action = %s", (key, action))
+        conn.commit()
+        cur.close()
+        release_db(conn)
+    return result
 
+@instrumented("sweep-api")
 def handler(event, context):
     """API для Sweep REF — сервиса отслеживания источников гостей (МСК)"""
+    try:
+        return handle(event, context)
+    finally:
+        release_all()
+
+def handle(event, context):
     if event.get("httpMethod") == "OPTIONS":
         return {
             "statusCode": 200,
             "headers": {
                 "Access-Control-Allow-Origin": "*",
                 "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-                "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Authorization",
+                "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Authorization, Idempotency-Key",
                 "Access-Control-Max-Age": "86400",
             },
             "body": "",
@@ -114,56 +605,119 @@ def handler(event, context):
         body = {}
 
     action = body.get("action", "")
+    set_action(action)
 
+    idempotency_key = get_idempotency_key(event) if action in IDEMPOTENT_ACTIONS else ""
+    if idempotency_key:
+        error = idempotency_auth_error(event, body, action)
+        if error:
+            return resp(error[0], {"error": error[1]}, cors)
+        return run_idempotent(idempotency_key, action, event, body, cors, lambda: route(event, body, action, cors))
+    return route(event, body, action, cors)
+
+def route(event, body, action, cors):
     if action == "get_restaurant_by_slug":
         slug = body.get("slug", "")
         if not slug:
             return resp(400, {"error": "Slug required"}, cors)
         conn = get_db()
         cur = conn.cursor()
-        cur.execute("SELECT id, name, slug FROM restaurants WHERE slug = %s", (slug,))
+        prepared.execute(cur, "restaurant_by_slug", (slug,))
         row = cur.fetchone()
         if not row:
             cur.close()
-            conn.close()
+            release_db(conn)
             return resp(404, {"error": "Not found"}, cors)
         cur.execute("SELECT key, label, icon FROM source_options WHERE active = true ORDER BY sort_order")
         sources = [{"key": s[0], "label": s[1], "icon": s[2]} for s in cur.fetchall()]
         cur.close()
-        conn.close()
+        release_db(conn)
         return resp(200, {"restaurant": {"id": row[0], "name": row[1], "slug": row[2]}, "sources": sources}, cors)
 
+    if action == "hostess_bootstrap":
+        slug = body.get("slug", "")
+        if not slug:
+            return resp(400, {"error": "Slug required"}, cors)
+        conn = get_db()
+        cur = conn.cursor()
+        prepared.execute(cur, "hostess_bootstrap", (slug,))
+        row = cur.fetchone()
+        cur.close()
+        release_db(conn)
+        if not row:
+            return resp(404, {"error": "Not found"}, cors)
+        rid, name, rslug, pw_hash, sources, counts = row
+        password = body.get("password", "")
+        if verify_hostess_token(body.get("hostess_token")) == rid or not pw_hash:
+            authed = True
+        elif password:
+            authed = hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), pw_hash)
+            if not authed:
+                return resp(401, {"error": "Wrong password"}, cors)
+        else:
+            authed = False
+        return resp(200, {
+            "restaurant": {"id": rid, "name": name, "slug": rslug},
+            "sources": sources,
+            "today_by_source": counts,
+            "today_count": sum(counts.values()),
+            "needs_auth": not authed,
+            "hostess_token": make_hostess_token(rid) if authed else None,
+        }, cors)
+
     if action == "get_restaurants":
         conn = get_db()
         cur = conn.cursor()
         cur.execute("SELECT id, name, slug FROM restaurants ORDER BY id")
         rows = cur.fetchall()
         cur.close()
-        conn.close()
+        release_db(conn)
         return resp(200, {"restaurants": [{"id": r[0], "name": r[1], "slug": r[2]} for r in rows]}, cors)
 
     if action == "add_response":
-        restaurant_id = body.get("restaurant_id")
+        restaurant_id, error = hostess_restaurant(body)
+        if error:
+            return resp(error[0], {"error": error[1]}, cors)
         source = body.get("source")
         if not restaurant_id or not source:
             return resp(400, {"error": "Missing fields"}, cors)
+        # Idempotency-Key тапа пишется в responses.request_key: повтор не вставит вторую строку,
+        # а лишний запрос (чтение по индексу) нужен только самому повтору
+        request_key = get_idempotency_key(event) or None
         conn = get_db()
         cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO responses (restaurant_id, source) VALUES (%s, %s) RETURNING id, created_at",
-            (restaurant_id, source),
-        )
+        prepared.execute(cur, "insert_response", (restaurant_id, source, request_key))
         row = cur.fetchone()
+        if row is None:
+            cur.execute("SELECT id, restaurant_id, source FROM responses WHERE request_key = %s", (request_key,))
+            prior = cur.fetchone()
+            conn.commit()
+            if not prior:
+                error = "Response with this Idempotency-Key was undone"
+            elif str(prior[1]) != str(restaurant_id) or prior[2] != source:
+                error = "Idempotency-Key was used with a different request"
+            else:
+                error = None
+            if error:
+                cur.close()
+                release_db(conn)
+                return resp(409 if not prior else 422, {"error": error}, cors)
+            prepared.execute(cur, "today_count", (restaurant_id,))
+            today_count = cur.fetchone()[0]
+            cur.close()
+            release_db(conn)
+            result = resp(200, {"ok": True, "response_id": prior[0], "today_count": today_count}, cors)
+            result["headers"] = {**cors, "Idempotent-Replayed": "true"}
+            return result
         conn.commit()
-        cur.execute(
-            "SELECT COUNT(*) FROM responses WHERE restaurant_id = %s AND created_at::date = CURRENT_DATE",
-            (restaurant_id,),
-        )
+        prepared.execute(cur, "today_count", (restaurant_id,))
         today_count = cur.fetchone()[0]
 
-        notifications_on = get_setting(cur, "telegram_notifications_enabled", "false") == "true"
-        chat_id = get_setting(cur, "telegram_chat_id", "")
-        if notifications_on and chat_id:
+        settings = get_settings(cur, ["telegram_notifications_enabled", "telegram_chat_id", "telegram_live_counter"])
+        notifications_on = settings.get("telegram_notifications_enabled", "false") == "true"
+        chat_id = settings.get("telegram_chat_id", "")
+        live_chat = live_counter_chat(settings)
+        if notifications_on and chat_id and not live_chat:
             cur.execute("SELECT name FROM restaurants WHERE id = %s", (restaurant_id,))
             rname = cur.fetchone()
             rname = rname[0] if rname else "?"
@@ -175,12 +729,16 @@ def handler(event, context):
             send_telegram(chat_id, msg)
 
         cur.close()
-        conn.close()
+        release_db(conn)
+        if live_chat:
+            touch_live_counter(live_chat, restaurant_id)
         return resp(200, {"ok": True, "response_id": row[0], "today_count": today_count}, cors)
 
     if action == "undo_response":
+        restaurant_id, error = hostess_restaurant(body)
+        if error:
+            return resp(error[0], {"error": error[1]}, cors)
         response_id = body.get("response_id")
-        restaurant_id = body.get("restaurant_id")
         if not response_id or not restaurant_id:
             return resp(400, {"error": "Missing fields"}, cors)
         conn = get_db()
@@ -192,17 +750,18 @@ def handler(event, context):
         row = cur.fetchone()
         if not row:
             cur.close()
-            conn.close()
+            release_db(conn)
             return resp(400, {"error": "Cannot undo"}, cors)
         cur.execute("DELETE FROM responses WHERE id = %s", (response_id,))
         conn.commit()
-        cur.execute(
-            "SELECT COUNT(*) FROM responses WHERE restaurant_id = %s AND created_at::date = CURRENT_DATE",
-            (restaurant_id,),
-        )
+        prepared.execute(cur, "today_count", (restaurant_id,))
         today_count = cur.fetchone()[0]
+        settings = get_settings(cur, ["telegram_notifications_enabled", "telegram_chat_id", "telegram_live_counter"])
         cur.close()
-        conn.close()
+        release_db(conn)
+        live_chat = live_counter_chat(settings)
+        if live_chat:
+            touch_live_counter(live_chat, restaurant_id)
         return resp(200, {"ok": True, "today_count": today_count}, cors)
 
     if action == "get_today_count":
@@ -211,13 +770,10 @@ def handler(event, context):
             return resp(400, {"error": "Missing restaurant_id"}, cors)
         conn = get_db()
         cur = conn.cursor()
-        cur.execute(
-            "SELECT COUNT(*) FROM responses WHERE restaurant_id = %s AND created_at::date = CURRENT_DATE",
-            (restaurant_id,),
-        )
+        prepared.execute(cur, "today_count", (restaurant_id,))
         count = cur.fetchone()[0]
         cur.close()
-        conn.close()
+        release_db(conn)
         return resp(200, {"today_count": count}, cors)
 
     if action == "check_restaurant_password":
@@ -231,7 +787,7 @@ def handler(event, context):
         cur.execute("SELECT id FROM restaurants WHERE id = %s AND password_hash = %s", (rid, pw_hash))
         row = cur.fetchone()
         cur.close()
-        conn.close()
+        release_db(conn)
         if not row:
             return resp(401, {"error": "Wrong password"}, cors)
         return resp(200, {"ok": True}, cors)
@@ -248,7 +804,7 @@ def handler(event, context):
         )
         row = cur.fetchone()
         cur.close()
-        conn.close()
+        release_db(conn)
         if not row:
             return resp(401, {"error": "Invalid credentials"}, cors)
         token = make_token(row[0])
@@ -259,25 +815,45 @@ def handler(event, context):
         user_id = check_auth(event)
         if not user_id:
             return resp(401, {"error": "Unauthorized"}, cors)
-        conn = get_db()
-        cur = conn.cursor()
-        cur.execute("SELECT id, name, slug, password_hash FROM restaurants ORDER BY id")
-        restaurants = [{"id": r[0], "name": r[1], "slug": r[2], "has_password": bool(r[3])} for r in cur.fetchall()]
-        cur.execute("SELECT id, restaurant_id, source, created_at FROM responses ORDER BY created_at")
-        responses = [
-            {"id": r[0], "restaurant_id": r[1], "source": r[2], "created_at": r[3].isoformat()}
-            for r in cur.fetchall()
-        ]
-        cur.execute("SELECT id, key, label, icon, sort_order, active FROM source_options ORDER BY sort_order")
-        sources = [{"id": r[0], "key": r[1], "label": r[2], "icon": r[3], "sort_order": r[4], "active": r[5]} for r in cur.fetchall()]
-        tg_chat_id = get_setting(cur, "telegram_chat_id", "")
-        tg_notifications = get_setting(cur, "telegram_notifications_enabled", "false") == "true"
-        cur.close()
-        conn.close()
-        return resp(200, {
-            "restaurants": restaurants, "responses": responses, "sources": sources,
-            "settings": {"telegram_chat_id": tg_chat_id, "telegram_notifications_enabled": tg_notifications},
-        }, cors)
+        mode = "fast" if body.get("mode") == "fast" else "exact"
+        fmt = "columnar" if body.get("format") == "columnar" else "rows"
+        pg_json = bool(body.get("pg_json")) and mode == "exact"
+        if mode == "fast":
+            # агрегаты из материализованных представлений, если они не старше VIEWS_MAX_AGE;
+            # чтение их не обновляет — это делает cron-действие refresh_views
+            main_query = fetch_fast_totals
+        elif pg_json:
+            main_query = lambda cur: fetch_responses_json(cur, fmt)
+        else:
+            main_query = lambda cur: fetch_responses(cur, fmt)
+        # независимые чтения идут параллельно на разных соединениях, с реплики
+        parts = run_concurrently({
+            "restaurants": fetch_restaurants_admin,
+            "main": main_query,
+            "sources": fetch_source_options,
+            "settings": lambda cur: get_settings(
+                cur, ["telegram_chat_id", "telegram_notifications_enabled", "telegram_live_counter"],
+            ),
+        }, readonly=True)
+        restaurants, sources, settings = parts["restaurants"], parts["sources"], parts["settings"]
+        tg_chat_id = settings.get("telegram_chat_id", "")
+        tg_notifications = settings.get("telegram_notifications_enabled", "false") == "true"
+        result = {
+            "restaurants": restaurants, "sources": sources, "mode": mode,
+            "settings": {
+                "telegram_chat_id": tg_chat_id, "telegram_notifications_enabled": tg_notifications,
+                "telegram_live_counter": settings.get("telegram_live_counter", "false") == "true",
+            },
+        }
+        if mode == "fast":
+            result["totals"], result["views_age_seconds"], live = parts["main"]
+            result["totals_source"] = "live" if live else "views"
+            return resp(200, result, cors)
+        result["format"] = fmt
+        if pg_json:
+            return resp_raw(200, result, {"responses": parts["main"]}, cors)
+        result["responses"] = parts["main"]
+        return resp(200, result, cors)
 
     # === ADMIN: save settings ===
     if action == "save_settings":
@@ -290,9 +866,11 @@ def handler(event, context):
         tg_notifications = body.get("telegram_notifications_enabled", False)
         set_setting(cur, "telegram_chat_id", tg_chat_id)
         set_setting(cur, "telegram_notifications_enabled", "true" if tg_notifications else "false")
+        if "telegram_live_counter" in body:
+            set_setting(cur, "telegram_live_counter", "true" if body.get("telegram_live_counter") else "false")
         conn.commit()
         cur.close()
-        conn.close()
+        release_db(conn)
         return resp(200, {"ok": True}, cors)
 
     # === ADMIN: test telegram ===
@@ -313,43 +891,14 @@ def handler(event, context):
         if not user_id:
             return resp(401, {"error": "Unauthorized"}, cors)
         period = body.get("period", "today")
-        conn = get_db()
+        conn = get_db(readonly=True)
         cur = conn.cursor()
-        cur.execute("SELECT id, name FROM restaurants ORDER BY id")
-        restaurants = cur.fetchall()
-        cur.execute("SELECT key, label FROM source_options WHERE active = true ORDER BY sort_order")
-        source_map = {r[0]: r[1] for r in cur.fetchall()}
-
-        lines = []
-        total = 0
-        for rid, rname in restaurants:
-            if period == "today":
-                cur.execute(
-                    "SELECT source, COUNT(*) FROM responses WHERE restaurant_id = %s AND created_at::date = CURRENT_DATE GROUP BY source ORDER BY COUNT(*) DESC",
-                    (rid,),
-                )
-            else:
-                cur.execute(
-                    "SELECT source, COUNT(*) FROM responses WHERE restaurant_id = %s GROUP BY source ORDER BY COUNT(*) DESC",
-                    (rid,),
-                )
-            rows = cur.fetchall()
-            if not rows:
-                continue
-            rcount = sum(r[1] for r in rows)
-            total += rcount
-            lines.append(f"\n🏪 <b>{rname}</b> — {rcount}")
-            for skey, cnt in rows:
-                lines.append(f"   • {source_map.get(skey, skey)}: {cnt}")
-
+        aggregate = summary_aggregate(cur, period)
         cur.close()
-        conn.close()
-
-        t = now_msk().strftime("%d.%m.%Y %H:%M")
-        title = "📊 Сводка за сегодня" if period == "today" else "📊 Сводка за всё время"
-        header = f"<b>{title}</b>\n🕐 {t} МСК\n📋 Всего ответов: {total}"
-        text = header + "".join(lines) if lines else header + "\n\nНет данных"
-        return resp(200, {"ok": True, "text": text, "total": total}, cors)
+        release_db(conn)
+        return resp(200, {
+            "ok": True, "text": render_summary(aggregate), "pages": summary_pages(aggregate), "total": aggregate["total"],
+        }, cors)
 
     # === ADMIN: send summary to telegram ===
     if action == "send_summary_telegram":
@@ -360,8 +909,11 @@ def handler(event, context):
         text = body.get("text", "").strip()
         if not chat_id or not text:
             return resp(400, {"error": "chat_id and text required"}, cors)
-        send_telegram(chat_id, text)
-        return resp(200, {"ok": True}, cors)
+        # длинная сводка уходит пачкой сообщений по лимиту Telegram, теги на границах закрываются
+        chunks = split_html(text)
+        for chunk in chunks:
+            send_telegram(chat_id, chunk)
+        return resp(200, {"ok": True, "messages": len(chunks)}, cors)
 
     if action == "create_restaurant":
         user_id = check_auth(event)
@@ -382,7 +934,7 @@ def handler(event, context):
         new_id = cur.fetchone()[0]
         conn.commit()
         cur.close()
-        conn.close()
+        release_db(conn)
         return resp(200, {"ok": True, "id": new_id, "slug": slug, "password": pw}, cors)
 
     if action == "rename_restaurant":
@@ -400,14 +952,14 @@ def handler(event, context):
             cur.execute("SELECT id FROM restaurants WHERE slug = %s AND id != %s", (slug, rid))
             if cur.fetchone():
                 cur.close()
-                conn.close()
+                release_db(conn)
                 return resp(400, {"error": "Slug already taken"}, cors)
             cur.execute("UPDATE restaurants SET name = %s, slug = %s WHERE id = %s", (name, slug, rid))
         else:
             cur.execute("UPDATE restaurants SET name = %s WHERE id = %s", (name, rid))
         conn.commit()
         cur.close()
-        conn.close()
+        release_db(conn)
         return resp(200, {"ok": True}, cors)
 
     if action == "delete_restaurant":
@@ -420,10 +972,13 @@ def handler(event, context):
         conn = get_db()
         cur = conn.cursor()
         cur.execute("DELETE FROM responses WHERE restaurant_id = %s", (rid,))
+        # архивные месяцы ресторана остаются в hourly_counts и не уменьшаются триггером
+        cur.execute("DELETE FROM hourly_counts WHERE restaurant_id = %s", (rid,))
+        cur.execute("DELETE FROM archived_monthly_counts WHERE restaurant_id = %s", (rid,))
         cur.execute("DELETE FROM restaurants WHERE id = %s", (rid,))
         conn.commit()
         cur.close()
-        conn.close()
+        release_db(conn)
         return resp(200, {"ok": True}, cors)
 
     if action == "reset_restaurant_password":
@@ -433,20 +988,21 @@ def handler(event, context):
         rid = body.get("restaurant_id")
         if not rid:
             return resp(400, {"error": "Missing restaurant_id"}, cors)
-        pw = generate_password()
-        pw_hash = hashlib.sha256(pw.encode()).hexdigest()
         conn = get_db()
         cur = conn.cursor()
-        cur.execute("UPDATE restaurants SET password_hash = %s WHERE id = %s", (pw_hash, rid))
+        pw = set_restaurant_password(cur, rid)
         conn.commit()
         cur.close()
-        conn.close()
+        release_db(conn)
         return resp(200, {"ok": True, "password": pw}, cors)
 
     if action == "change_password":
-        user_id = check_auth(event)
-        if not user_id:
+        principal = authenticate(event)
+        if not principal:
             return resp(401, {"error": "Unauthorized"}, cors)
+        kind, user_id = principal
+        if kind != "admin":
+            return resp(400, {"error": "Password login only"}, cors)
         old_pw = body.get("old_password", "")
         new_pw = body.get("new_password", "")
         if not old_pw or not new_pw:
@@ -460,13 +1016,13 @@ def handler(event, context):
         row = cur.fetchone()
         if not row:
             cur.close()
-            conn.close()
+            release_db(conn)
             return resp(400, {"error": "Wrong old password"}, cors)
         new_hash = hashlib.sha256(new_pw.encode()).hexdigest()
         cur.execute("UPDATE admin_users SET password_hash = %s WHERE id = %s", (new_hash, user_id))
         conn.commit()
         cur.close()
-        conn.close()
+        release_db(conn)
         return resp(200, {"ok": True}, cors)
 
     if action == "update_source":
@@ -479,17 +1035,24 @@ def handler(event, context):
         active = body.get("active")
         if not sid:
             return resp(400, {"error": "Missing source_id"}, cors)
-        conn = get_db()
-        cur = conn.cursor()
+        fields = {}
         if label:
-            cur.execute("UPDATE source_options SET label = %s WHERE id = %s", (label, sid))
+            fields["label"] = label
         if icon:
-            cur.execute("UPDATE source_options SET icon = %s WHERE id = %s", (icon, sid))
+            fields["icon"] = icon
         if active is not None:
-            cur.execute("UPDATE source_options SET active = %s WHERE id = %s", (active, sid))
+            fields["active"] = bool(active)
+        if not fields:
+            return resp(200, {"ok": True}, cors)
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute(
+            "UPDATE source_options SET " + ", ".join(f"{col} = %s" for col in fields) + " WHERE id = %s",
+            (*fields.values(), sid),
+        )
         conn.commit()
         cur.close()
-        conn.close()
+        release_db(conn)
         return resp(200, {"ok": True}, cors)
 
     if action == "create_source":
@@ -512,7 +1075,7 @@ def handler(event, context):
         new_id = cur.fetchone()[0]
         conn.commit()
         cur.close()
-        conn.close()
+        release_db(conn)
         return resp(200, {"ok": True, "id": new_id}, cors)
 
     if action == "delete_source":
@@ -527,7 +1090,7 @@ def handler(event, context):
         cur.execute("DELETE FROM source_options WHERE id = %s", (sid,))
         conn.commit()
         cur.close()
-        conn.close()
+        release_db(conn)
         return resp(200, {"ok": True}, cors)
 
     if action == "reorder_sources":
@@ -537,13 +1100,20 @@ def handler(event, context):
         order = body.get("order", [])
         if not order:
             return resp(400, {"error": "Order required"}, cors)
+        try:
+            order = [int(sid) for sid in order]
+        except (TypeError, ValueError):
+            return resp(400, {"error": "Order must be a list of source ids"}, cors)
         conn = get_db()
         cur = conn.cursor()
-        for i, sid in enumerate(order):
-            cur.execute("UPDATE source_options SET sort_order = %s WHERE id = %s", (i, sid))
+        cur.execute(
+            "UPDATE source_options s SET sort_order = o.ord - 1 "
+            "FROM unnest(%s::int[]) WITH ORDINALITY AS o(id, ord) WHERE s.id = o.id",
+            (order,),
+        )
         conn.commit()
         cur.close()
-        conn.close()
+        release_db(conn)
         return resp(200, {"ok": True}, cors)
 
     if action == "delete_response":
@@ -558,9 +1128,106 @@ def handler(event, context):
         cur.execute("DELETE FROM responses WHERE id = %s", (response_id,))
         conn.commit()
         cur.close()
-        conn.close()
+        release_db(conn)
         return resp(200, {"ok": True}, cors)
 
+    if action == "delete_responses":
+        user_id = check_auth(event)
+        if not user_id:
+            return resp(401, {"error": "Unauthorized"}, cors)
+        where, args = responses_filter(body)
+        if where is None:
+            return resp(400, {"error": args}, cors)
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute("DELETE FROM responses WHERE " + " AND ".join(where), args)
+        deleted = cur.rowcount
+        conn.commit()
+        cur.close()
+        release_db(conn)
+        return resp(200, {"ok": True, "deleted": deleted}, cors)
+
+    if action == "import_responses":
+        user_id = check_auth(event)
+        if not user_id:
+            return resp(401, {"error": "Unauthorized"}, cors)
+        fmt = body.get("format", "csv")
+        data = body.get("data", "")
+        if fmt not in ("csv", "ndjson") or not isinstance(data, str) or not data.strip():
+            return resp(400, {"error": "format (csv|ndjson) and data required"}, cors)
+        dry_run = bool(body.get("dry_run"))
+        conn = get_db()
+        cur = conn.cursor()
+        try:
+            result = import_text(cur, data, fmt, replace=bool(body.get("replace")), dry_run=dry_run,
+                                 max_rows=MAX_IMPORT_ROWS)
+        except ImportFailed as e:
+            conn.rollback()
+            cur.close()
+            release_db(conn)
+            return resp(400, {"error": str(e)}, cors)
+        if result["ok"] and not dry_run:
+            conn.commit()
+        else:
+            conn.rollback()
+        cur.close()
+        release_db(conn)
+        return resp(200 if result["ok"] else 422, result, cors)
+
+    if action == "export_responses":
+        user_id = check_auth(event)
+        if not user_id:
+            return resp(401, {"error": "Unauthorized"}, cors)
+        restaurant_id = body.get("restaurant_id")
+        since = body.get("since")
+        try:
+            since = datetime.fromisoformat(since.replace("Z", "+00:00")).replace(tzinfo=None) if since else None
+        except (AttributeError, ValueError):
+            return resp(400, {"error": "since must be an ISO datetime"}, cors)
+        conn = get_db(readonly=True)
+        cur = conn.cursor()
+        # архив целиком старше живых данных, поэтому его строки идут первыми и порядок по времени сохраняется
+        rows = list(iter_archived_rows(cur, since=since, restaurant_id=restaurant_id))
+        where, args = ["TRUE"], []
+        if restaurant_id:
+            where.append("restaurant_id = %s")
+            args.append(restaurant_id)
+        if since:
+            where.append("created_at >= %s")
+            args.append(since)
+        cur.execute(
+            "SELECT id, restaurant_id, source, created_at FROM responses WHERE " + " AND ".join(where)
+            + " ORDER BY created_at", args,
+        )
+        rows.extend(cur.fetchall())
+        cur.close()
+        release_db(conn)
+        return resp(200, {"responses": [
+            {"id": rid, "restaurant_id": restaurant, "source": source, "created_at": created_at.isoformat()}
+            for rid, restaurant, source, created_at in rows
+        ]}, cors)
+
+    if action == "archive_months":
+        user_id = check_auth(event)
+        if not user_id:
+            return resp(401, {"error": "Unauthorized"}, cors)
+        keep = body.get("keep_months")
+        if keep is not None and (not isinstance(keep, int) or keep < 1):
+            return resp(400, {"error": "keep_months must be a positive integer"}, cors)
+        # локальный каталог функции не переживает инстанс: без S3 строки были бы потеряны
+        if not os.environ.get("ARCHIVE_PATH", "").startswith("s3://"):
+            return resp(409, {"error": "ARCHIVE_PATH must point to s3:// storage"}, cors)
+        conn = get_db()
+        cur = conn.cursor()
+        archived = []
+        # каждый месяц — своя транзакция: файл уже записан, строки удаляются только вместе с записью о нём
+        for month in archivable_months(cur, keep):
+            archived.append(archive_month(cur, month))
+            conn.commit()
+        cur.close()
+        release_db(conn)
+        return resp(200, {"ok": True, "archived": archived}, cors)
+
     if action == "clear_responses":
         user_id = check_auth(event)
         if not user_id:
@@ -580,7 +1247,7 @@ def handler(event, context):
         deleted = cur.rowcount
         conn.commit()
         cur.close()
-        conn.close()
+        release_db(conn)
         return resp(200, {"ok": True, "deleted": deleted}, cors)
 
     if action == "get_hourly_stats":
@@ -588,25 +1255,113 @@ def handler(event, context):
         if not user_id:
             return resp(401, {"error": "Unauthorized"}, cors)
         restaurant_id = body.get("restaurant_id")
-        conn = get_db()
+        conn = get_db(readonly=True)
         cur = conn.cursor()
         if restaurant_id:
             cur.execute(
-                "SELECT EXTRACT(HOUR FROM created_at + INTERVAL '3 hours')::int as hour, COUNT(*) as cnt "
-                "FROM responses WHERE restaurant_id = %s GROUP BY hour ORDER BY hour",
+                "SELECT EXTRACT(HOUR FROM hour_msk)::int as hour, SUM(count) as cnt "
+                "FROM hourly_counts WHERE restaurant_id = %s GROUP BY hour ORDER BY hour",
                 (restaurant_id,),
             )
         else:
             cur.execute(
-                "SELECT EXTRACT(HOUR FROM created_at + INTERVAL '3 hours')::int as hour, COUNT(*) as cnt "
-                "FROM responses GROUP BY hour ORDER BY hour"
+                "SELECT EXTRACT(HOUR FROM hour_msk)::int as hour, SUM(count) as cnt "
+                "FROM hourly_counts GROUP BY hour ORDER BY hour"
             )
         rows = cur.fetchall()
         cur.close()
-        conn.close()
+        release_db(conn)
         hourly = {h: 0 for h in range(24)}
         for r in rows:
-            hourly[r[0]] = r[1]
+            hourly[r[0]] = int(r[1])
         return resp(200, {"hourly": [{"hour": h, "count": c} for h, c in hourly.items()]}, cors)
 
+    if action == "get_heatmap":
+        user_id = check_auth(event)
+        if not user_id:
+            return resp(401, {"error": "Unauthorized"}, cors)
+        restaurant_id = body.get("restaurant_id")
+        source = body.get("source")
+        date_to = parse_date(body.get("date_to")) or now_msk().date()
+        date_from = parse_date(body.get("date_from")) or date_to - timedelta(days=27)
+        if date_from > date_to:
+            return resp(400, {"error": "date_from must not be after date_to"}, cors)
+        compare_from = parse_date(body.get("compare_from"))
+        compare_to = parse_date(body.get("compare_to"))
+        if (compare_from is None) != (compare_to is None) or (compare_from and compare_from > compare_to):
+            return resp(400, {"error": "Invalid comparison period"}, cors)
+        if not compare_from:
+            conn = get_db(readonly=True)
+            cur = conn.cursor()
+            result = {"heatmap": heatmap_matrix(cur, date_from, date_to, restaurant_id, source)}
+            cur.close()
+            release_db(conn)
+            return resp(200, result, cors)
+        result = run_concurrently({
+            "heatmap": lambda cur: heatmap_matrix(cur, date_from, date_to, restaurant_id, source),
+            "compare": lambda cur: heatmap_matrix(cur, compare_from, compare_to, restaurant_id, source),
+        })
+        result["diff"] = [
+            [a - b for a, b in zip(row, other_row)]
+            for row, other_row in zip(result["heatmap"]["matrix"], result["compare"]["matrix"])
+        ]
+        return resp(200, result, cors)
+
+    if action == "get_metrics":
+        user_id = check_auth(event)
+        if not user_id:
+            return resp(401, {"error": "Unauthorized"}, cors)
+        return resp(200, {"metrics": snapshot("sweep-api")}, cors)
+
+    # === CRON: только с X-Maintenance-Key = MAINTENANCE_KEY, иначе 403 ===
+    # расписание: refresh_views — каждые 5 минут (старше VIEWS_MAX_AGE быстрый get_stats их не читает),
+    # flush_live_counters — каждую минуту, cleanup_idempotency_keys — раз в час
+    if action == "refresh_views":
+        if not check_maintenance(event):
+            return resp(403, {"error": "Forbidden"}, cors)
+        conn = get_db()
+        cur = conn.cursor()
+        refreshed = refresh_dashboard_views(cur)
+        conn.commit()
+        age = views_age_seconds(cur)
+        cur.close()
+        release_db(conn)
+        return resp(200, {"ok": True, "refreshed": refreshed, "views_age_seconds": age}, cors)
+
+    if action == "flush_live_counters":
+        if not check_maintenance(event):
+            return resp(403, {"error": "Forbidden"}, cors)
+        return resp(200, {"ok": True, "flushed": live_counter.flush_pending()}, cors)
+
+    if action == "cleanup_idempotency_keys":
+        if not check_maintenance(event):
+            return resp(403, {"error": "Forbidden"}, cors)
+        conn = get_db()
+        cur = conn.cursor()
+        removed = cleanup_idempotency_keys(cur)
+        conn.commit()
+        cur.close()
+        release_db(conn)
+        return resp(200, {"ok": True, "removed": removed}, cors)
+
+    if action == "reconcile_rollups":
+        user_id = check_auth(event)
+        if not user_id:
+            return resp(401, {"error": "Unauthorized"}, cors)
+        date_to = parse_date(body.get("date_to")) or now_msk().date()
+        date_from = parse_date(body.get("date_from")) or date_to - timedelta(days=6)
+        if date_from > date_to:
+            return resp(400, {"error": "date_from must not be after date_to"}, cors)
+        repair = bool(body.get("repair"))
+        conn = get_db()
+        cur = conn.cursor()
+        mismatches = reconcile_hourly_counts(cur, date_from, date_to, repair)
+        conn.commit()
+        cur.close()
+        release_db(conn)
+        return resp(200, {
+            "ok": not mismatches, "repaired": repair and bool(mismatches),
+            "mismatch_count": len(mismatches), "mismatches": mismatches[:100],
+        }, cors)
+
     return resp(400, {"error": "Unknown action"}, cors)
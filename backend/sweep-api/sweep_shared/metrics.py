@@ -0,0 +1,171 @@
+"""
+Инструментирование вызовов функции.
+
+На каждый вызов считаются: общее время, время и число запросов к БД (через
+InstrumentedCursor), время и число вызовов Telegram API, размер запроса и ответа.
+По завершении в лог пишется одна JSON-строка, а время складывается в скользящее
+окно по action — из него get_metrics отдаёт p50/p95 тёплого инстанса.
+"""
+
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from functools import wraps
+
+import psycopg2.extensions
+
+WINDOW = 200
+MAX_ACTIONS = 100
+
+_lock = threading.Lock()
+_current = None
+_history = defaultdict(lambda: deque(maxlen=WINDOW))
+
+
+class Invocation:
+    def __init__(self, function):
+        self.function = function
+        self.action = ""
+        self.started = time.perf_counter()
+        self.db_ms = 0.0
+        self.queries = 0
+        self.tg_ms = 0.0
+        self.tg_calls = 0
+        self.tg_errors = 0
+        self.req_bytes = 0
+        self.resp_bytes = 0
+        self.status = None
+        self.error = None
+
+
+def current():
+    return _current
+
+
+def set_action(action):
+    if _current is not None:
+        _current.action = action
+
+
+def add_db_time(elapsed):
+    inv = _current
+    if inv is not None:
+        with _lock:
+            inv.db_ms += elapsed * 1000
+            inv.queries += 1
+
+
+def add_telegram_time(elapsed, ok=True):
+    inv = _current
+    if inv is not None:
+        with _lock:
+            inv.tg_ms += elapsed * 1000
+            inv.tg_calls += 1
+            if not ok:
+                inv.tg_errors += 1
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    """Курсор, учитывающий время каждого запроса в метриках текущего вызова."""
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            add_db_time(time.perf_counter() - start)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            add_db_time(time.perf_counter() - start)
+
+    def copy_expert(self, sql, file, size=8192):
+        start = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            add_db_time(time.perf_counter() - start)
+
+
+def log_event(kind, **fields):
+    """Одна структурированная строка лога."""
+    print(json.dumps({"event": kind, **fields}, default=str, ensure_ascii=False))
+
+
+def instrumented(function):
+    """Декоратор handler(event, context): замеряет вызов и пишет строку лога."""
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(event, context):
+            global _current
+            inv = Invocation(function)
+            inv.req_bytes = len((event.get("body") or "").encode())
+            _current = inv
+            try:
+                result = handler(event, context)
+                inv.status = result.get("statusCode")
+                inv.resp_bytes = len((result.get("body") or "").encode())
+                return result
+            except Exception as e:
+                inv.status = 500
+                inv.error = repr(e)
+                raise
+            finally:
+                _current = None
+                finish(inv)
+        return wrapper
+    return decorator
+
+
+def finish(inv):
+    wall_ms = (time.perf_counter() - inv.started) * 1000
+    key = (inv.function, inv.action)
+    with _lock:
+        if key not in _history and len(_history) >= MAX_ACTIONS:
+            key = (inv.function, "other")
+        _history[key].append((wall_ms, inv.db_ms, inv.tg_ms, inv.queries))
+    record = {
+        "function": inv.function,
+        "action": inv.action,
+        "status": inv.status,
+        "wall_ms": round(wall_ms, 2),
+        "db_ms": round(inv.db_ms, 2),
+        "queries": inv.queries,
+        "tg_ms": round(inv.tg_ms, 2),
+        "tg_calls": inv.tg_calls,
+        "tg_errors": inv.tg_errors,
+        "req_bytes": inv.req_bytes,
+        "resp_bytes": inv.resp_bytes,
+    }
+    if inv.error:
+        record["error"] = inv.error
+    log_event("invocation", **record)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return round(ordered[round(q * (len(ordered) - 1))], 2) if ordered else None
+
+
+def snapshot(function):
+    """{action: {count, wall/db/tg p50 и p95, среднее число запросов}} по окну последних вызовов."""
+    with _lock:
+        items = [(action, list(samples)) for (fn, action), samples in _history.items() if fn == function]
+    result = {}
+    for action, samples in items:
+        wall, db, tg, queries = zip(*samples)
+        result[action or "-"] = {
+            "count": len(samples),
+            "wall_p50": percentile(wall, 0.5),
+            "wall_p95": percentile(wall, 0.95),
+            "db_p50": percentile(db, 0.5),
+            "db_p95": percentile(db, 0.95),
+            "tg_p50": percentile(tg, 0.5),
+            "tg_p95": percentile(tg, 0.95),
+            "queries_avg": round(sum(queries) / len(queries), 2),
+        }
+    return result
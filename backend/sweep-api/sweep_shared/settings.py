@@ -0,0 +1,53 @@
+"""
+Чтение и запись app_settings с кешем в памяти инстанса.
+
+Значения живут SETTINGS_CACHE_TTL секунд (по умолчанию 30); запись через
+set_setting сбрасывает ключ в кеше этого инстанса.
+"""
+
+import os
+import time
+
+from sweep_shared import prepared
+from sweep_shared.db import get_schema
+
+SETTINGS_TTL = float(os.environ.get("SETTINGS_CACHE_TTL", "30"))
+
+_cache = {}
+
+prepared.register("settings_read", f"SELECT key, value FROM {get_schema()}app_settings WHERE key = ANY(%s)")
+
+
+def get_settings(cur, keys, max_age=None) -> dict:
+    """{key: value} для существующих ключей; отсутствующие в кеше читаются одним запросом."""
+    max_age = SETTINGS_TTL if max_age is None else max_age
+    now = time.monotonic()
+    result, missing = {}, []
+    for key in keys:
+        cached = _cache.get(key)
+        if cached and now - cached[1] <= max_age:
+            if cached[0] is not None:
+                result[key] = cached[0]
+        else:
+            missing.append(key)
+    if missing:
+        prepared.execute(cur, "settings_read", (missing,))
+        found = dict(cur.fetchall())
+        for key in missing:
+            _cache[key] = (found.get(key), now)
+            if key in found:
+                result[key] = found[key]
+    return result
+
+
+def get_setting(cur, key, default="", max_age=None):
+    return get_settings(cur, [key], max_age).get(key, default)
+
+
+def set_setting(cur, key, value) -> None:
+    cur.execute(
+        f"INSERT INTO {get_schema()}app_settings (key, value, updated_at) VALUES (%s, %s, NOW()) "
+        "ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, updated_at = NOW()",
+        (key, value),
+    )
+    _cache.pop(key, None)
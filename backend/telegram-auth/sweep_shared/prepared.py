@@ -0,0 +1,80 @@
+"""
+Реестр серверных prepared statements для горячих запросов.
+
+Запрос регистрируется один раз (register) с плейсхолдерами %s. На каждом соединении
+пула при первом вызове выполняется PREPARE, дальше — EXECUTE по имени, без повторного
+разбора и планирования. Какие имена уже подготовлены, помнит само соединение
+(PreparingConnection из db.get_db_pool).
+
+DB_PREPARE=off — обычные запросы; нужно за пулером в режиме transaction (PgBouncer),
+где соседние транзакции попадают на разные серверные соединения. Если сервер всё же
+ответит, что statement не существует или уже есть, а транзакция ещё не начиналась,
+запрос повторяется обычным SQL и режим выключается до конца жизни инстанса.
+"""
+
+import os
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+
+from sweep_shared.metrics import log_event
+
+_statements = {}
+_disabled = False
+
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """Соединение, которое помнит имена уже выполненных на нём PREPARE."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+def is_enabled() -> bool:
+    return not _disabled and os.environ.get("DB_PREPARE", "server") != "off"
+
+
+def register(name: str, sql: str) -> None:
+    """Регистрирует запрос с плейсхолдерами %s под именем name (идентификатор SQL)."""
+    count = sql.count("%s")
+    parts = sql.split("%s")
+    server_sql = parts[0] + "".join(f"${i}{part}" for i, part in enumerate(parts[1:], 1))
+    _statements[name] = (sql, server_sql, count)
+
+
+def statement_sql(name: str):
+    """SQL зарегистрированного запроса с плейсхолдерами %s; None — имя не зарегистрировано."""
+    entry = _statements.get(name)
+    return entry[0] if entry else None
+
+
+def execute(cur, name: str, args=()):
+    """cur.execute зарегистрированного запроса: EXECUTE по имени или обычный SQL в режиме off."""
+    sql, server_sql, count = _statements[name]
+    conn = cur.connection
+    prepared = getattr(conn, "prepared", None)
+    if prepared is None or not is_enabled():
+        return cur.execute(sql, args)
+    idle = conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    try:
+        if name not in prepared:
+            cur.execute(f"PREPARE {name} AS {server_sql}")
+            prepared.add(name)
+        return cur.execute(f"EXECUTE {name}" + (f" ({', '.join(['%s'] * count)})" if count else ""), args)
+    except (psycopg2.errors.InvalidSqlStatementName, psycopg2.errors.DuplicatePreparedStatement) as e:
+        # соединение подменил пулер: серверные statements не переживают транзакцию
+        _disable(repr(e))
+        prepared.clear()
+        if not idle:
+            raise
+        conn.rollback()
+        return cur.execute(sql, args)
+
+
+def _disable(reason):
+    global _disabled
+    if not _disabled:
+        _disabled = True
+        log_event("prepared_disabled", reason=reason)
@@ -4,24 +4,41 @@ Telegram Bot Function — Sweep REF
 Обрабатывает:
 1. Webhook от Telegram (авторизация, команды в группах)
 2. Отправку уведомлений через API
-3. Команды сводок: /summary_today, /summary_all
+3. Команды сводок: /summary_today, /summary_all (длинные — постранично, кнопками ◀️ ▶️)
 4. Приветствие при добавлении в группу
+5. Inline-запросы (@bot ispanskiy) — счётчики ресторана за сегодня и 7 дней
 """
 
 import json
 import os
+import time
 import uuid
 import hashlib
+import html
 from datetime import datetime, timezone, timedelta
-from typing import Optional
 
-import psycopg2
+import requests
 import telebot
 
-MSK = timezone(timedelta(hours=3))
+from sweep_shared.db import get_db, get_schema, release_db
+from sweep_shared.metrics import add_telegram_time, instrumented, log_event, set_action
+from sweep_shared.msk import msk_today_start, now_msk
+from sweep_shared.summary import load_snapshot, save_snapshot, summary_aggregate, summary_pages
+from sweep_shared.web import cors_headers, json_response, options_response as empty_response
 
-def now_msk():
-    return datetime.now(MSK)
+
+def timed_request_sender(method, url, **kwargs):
+    """Отправка запросов telebot с учётом времени Telegram API в метриках вызова."""
+    start = time.perf_counter()
+    ok = False
+    try:
+        result = requests.request(method, url, **kwargs)
+        ok = result.ok
+        return result
+    finally:
+        add_telegram_time(time.perf_counter() - start, ok)
+
+telebot.apihelper.CUSTOM_REQUEST_SENDER = timed_request_sender
 
 def get_bot_token() -> str:
     token = os.environ.get("TELEGRAM_BOT_TOKEN", "")
@@ -32,69 +49,14 @@ def get_bot_token() -> str:
 def get_bot() -> telebot.TeleBot:
     return telebot.TeleBot(get_bot_token())
 
-def get_schema() -> str:
-    schema = os.environ.get("MAIN_DB_SCHEMA", "public")
-    return f"{schema}." if schema else ""
-
 def get_cors_headers() -> dict:
-    return {
-        "Access-Control-Allow-Origin": "*",
-        "Access-Control-Allow-Methods": "POST, OPTIONS",
-        "Access-Control-Allow-Headers": "Content-Type, X-Telegram-Bot-Api-Secret-Token",
-    }
+    return cors_headers(allow_headers="Content-Type, X-Telegram-Bot-Api-Secret-Token")
 
 def cors_response(status: int, body: dict) -> dict:
-    return {
-        "statusCode": status,
-        "headers": {**get_cors_headers(), "Content-Type": "application/json"},
-        "body": json.dumps(body),
-    }
+    return json_response(status, body, get_cors_headers())
 
 def options_response() -> dict:
-    return {"statusCode": 204, "headers": get_cors_headers(), "body": ""}
-
-
-def get_db():
-    return psycopg2.connect(os.environ["DATABASE_URL"])
-
-
-def build_summary(conn, period="today"):
-    """Собирает сводку по всем ресторанам."""
-    schema = get_schema()
-    cur = conn.cursor()
-    cur.execute(f"SELECT id, name FROM {schema}restaurants ORDER BY id")
-    restaurants = cur.fetchall()
-    cur.execute(f"SELECT key, label FROM {schema}source_options WHERE active = true ORDER BY sort_order")
-    source_map = {r[0]: r[1] for r in cur.fetchall()}
-
-    lines = []
-    total = 0
-    for rid, rname in restaurants:
-        if period == "today":
-            cur.execute(
-                f"SELECT source, COUNT(*) FROM {schema}responses WHERE restaurant_id = %s AND created_at::date = CURRENT_DATE GROUP BY source ORDER BY COUNT(*) DESC",
-                (rid,),
-            )
-        else:
-            cur.execute(
-                f"SELECT source, COUNT(*) FROM {schema}responses WHERE restaurant_id = %s GROUP BY source ORDER BY COUNT(*) DESC",
-                (rid,),
-            )
-        rows = cur.fetchall()
-        if not rows:
-            continue
-        rcount = sum(r[1] for r in rows)
-        total += rcount
-        lines.append(f"\n🏪 <b>{rname}</b> — {rcount}")
-        for skey, cnt in rows:
-            lines.append(f"   • {source_map.get(skey, skey)}: {cnt}")
-
-    cur.close()
-
-    t = now_msk().strftime("%d.%m.%Y %H:%M")
-    title = "📊 Сводка за сегодня" if period == "today" else "📊 Сводка за всё время"
-    header = f"<b>{title}</b>\n🕐 {t} МСК\n📋 Всего ответов: {total}"
-    return header + "".join(lines) if lines else header + "\n\nНет данных"
+    return empty_response(get_cors_headers())
 
 
 def save_auth_token(telegram_id, username, first_name, last_name):
@@ -113,7 +75,7 @@ def save_auth_token(telegram_id, username, first_name, last_name):
               datetime.now(timezone.utc) + timedelta(minutes=5)))
         conn.commit()
     finally:
-        conn.close()
+        release_db(conn)
     return token
 
 
@@ -154,19 +116,148 @@ def handle_start(chat_id):
     )
 
 
+def summary_keyboard(snapshot_id, page, pages):
+    """Кнопки листания; callback_data sp:<id снимка>:<страница> — страницы рендерятся из сохранённого агрегата."""
+    buttons = []
+    if page > 0:
+        buttons.append(telebot.types.InlineKeyboardButton("◀️", callback_data=f"sp:{snapshot_id}:{page - 1}"))
+    buttons.append(telebot.types.InlineKeyboardButton(f"{page + 1}/{pages}", callback_data="noop"))
+    if page < pages - 1:
+        buttons.append(telebot.types.InlineKeyboardButton("▶️", callback_data=f"sp:{snapshot_id}:{page + 1}"))
+    return telebot.types.InlineKeyboardMarkup().row(*buttons)
+
+
 def handle_summary(chat_id, period="today"):
     try:
-        conn = get_db()
-        text = build_summary(conn, period)
-        conn.close()
+        conn = get_db(readonly=True)
+        try:
+            cur = conn.cursor()
+            aggregate = summary_aggregate(cur, period)
+            cur.close()
+        finally:
+            release_db(conn)
+        pages = summary_pages(aggregate)
         bot = get_bot()
-        bot.send_message(chat_id, text, parse_mode="HTML")
+        if len(pages) == 1:
+            bot.send_message(chat_id, pages[0], parse_mode="HTML")
+            return
+        conn = get_db()
+        try:
+            cur = conn.cursor()
+            snapshot_id = save_snapshot(cur, aggregate)
+            conn.commit()
+            cur.close()
+        finally:
+            release_db(conn)
+        bot.send_message(chat_id, pages[0], parse_mode="HTML", reply_markup=summary_keyboard(snapshot_id, 0, len(pages)))
     except Exception as e:
-        print(f"Summary error: {e}")
+        log_event("error", where="summary", error=repr(e))
         bot = get_bot()
         bot.send_message(chat_id, "❌ Ошибка при получении сводки")
 
 
+def handle_summary_page(message, data):
+    """Перелистывает сводку в том же сообщении. Возвращает текст для answerCallbackQuery или None."""
+    try:
+        _, snapshot_id, page = data.split(":")
+        snapshot_id, page = int(snapshot_id), int(page)
+    except ValueError:
+        return None
+    # снимок только что записан на primary — на реплике его может ещё не быть
+    conn = get_db()
+    try:
+        cur = conn.cursor()
+        aggregate = load_snapshot(cur, snapshot_id)
+        cur.close()
+    finally:
+        release_db(conn)
+    if aggregate is None:
+        return "Сводка устарела — запросите новую"
+    pages = summary_pages(aggregate)
+    page = min(max(page, 0), len(pages) - 1)
+    bot = get_bot()
+    bot.edit_message_text(
+        pages[page], message.get("chat", {}).get("id"), message.get("message_id"),
+        parse_mode="HTML", reply_markup=summary_keyboard(snapshot_id, page, len(pages)),
+    )
+    return None
+
+
+INLINE_RESULTS_LIMIT = 20
+INLINE_CACHE_TIME = int(os.environ.get("INLINE_CACHE_TIME", "60"))
+
+
+def inline_stats_public() -> bool:
+    return os.environ.get("INLINE_STATS_PUBLIC", "") == "true"
+
+
+def like_prefix(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def fetch_inline_stats(cur, telegram_id, query):
+    """
+    Одним запросом: доступ пользователя, рестораны по префиксу slug или названия (индексы text_pattern_ops)
+    и их счётчики за сегодня и 7 дней МСК из hourly_counts. -> (allowed, [(id, name, today, week)]).
+    Доступ — у админов из ADMIN_TELEGRAM_USERS (users.id) или у всех при INLINE_STATS_PUBLIC=true.
+    """
+    schema = get_schema()
+    today = msk_today_start()
+    admins = [int(x) for x in os.environ.get("ADMIN_TELEGRAM_USERS", "").split(",") if x.strip().isdigit()]
+    cur.execute(f"""
+        WITH allowed AS (
+            SELECT %(public)s OR EXISTS (
+                SELECT 1 FROM {schema}users WHERE telegram_id = %(telegram_id)s AND id = ANY(%(admins)s)
+            ) AS ok
+        ), found AS (
+            SELECT id, name, slug FROM {schema}restaurants
+            WHERE slug LIKE %(prefix)s OR LOWER(name) LIKE %(prefix)s
+            ORDER BY name LIMIT %(limit)s
+        )
+        SELECT a.ok, f.id, f.name,
+               COALESCE(SUM(h.count) FILTER (WHERE h.hour_msk >= %(today)s), 0)::int,
+               COALESCE(SUM(h.count), 0)::int
+        FROM allowed a
+        LEFT JOIN found f ON a.ok
+        LEFT JOIN {schema}hourly_counts h ON h.restaurant_id = f.id AND h.hour_msk >= %(week)s
+        GROUP BY a.ok, f.id, f.name, f.slug
+        ORDER BY f.name
+    """, {
+        "public": inline_stats_public(), "telegram_id": str(telegram_id), "admins": admins,
+        "prefix": like_prefix(query.strip().lower()), "limit": INLINE_RESULTS_LIMIT,
+        "today": today, "week": today - timedelta(days=6),
+    })
+    rows = cur.fetchall()
+    allowed = bool(rows and rows[0][0])
+    return allowed, [r[1:] for r in rows if r[1] is not None]
+
+
+def handle_inline_query(inline_query):
+    """Ответ на @bot <префикс>: карточка на ресторан; Telegram кеширует ответ cache_time секунд."""
+    conn = get_db(readonly=True)
+    try:
+        cur = conn.cursor()
+        allowed, rows = fetch_inline_stats(cur, inline_query.get("from", {}).get("id", ""), inline_query.get("query", ""))
+        cur.close()
+    finally:
+        release_db(conn)
+    t = now_msk().strftime("%d.%m.%Y %H:%M")
+    results = [
+        telebot.types.InlineQueryResultArticle(
+            id=str(rid), title=name, description=f"Сегодня: {today} · 7 дней: {week}",
+            input_message_content=telebot.types.InputTextMessageContent(
+                f"🏪 <b>{html.escape(name)}</b>\n📊 Сегодня: {today}\n📈 За 7 дней: {week}\n🕐 {t} МСК",
+                parse_mode="HTML",
+            ),
+        )
+        for rid, name, today, week in rows
+    ] if allowed else []
+    bot = get_bot()
+    # без публичного доступа ответ зависит от пользователя — Telegram кеширует его для каждого отдельно
+    bot.answer_inline_query(inline_query.get("id"), results, cache_time=INLINE_CACHE_TIME,
+                            is_personal=not inline_stats_public())
+
+
 def handle_new_member(message):
     """Приветствие при добавлении бота в группу."""
     bot = get_bot()
@@ -201,18 +292,35 @@ def handle_new_member(message):
 def process_webhook(body):
     message = body.get("message")
     callback_query = body.get("callback_query")
+    inline_query = body.get("inline_query")
+
+    if inline_query:
+        try:
+            handle_inline_query(inline_query)
+        except Exception as e:
+            log_event("error", where="inline_query", error=repr(e))
+        return {"statusCode": 200, "body": json.dumps({"ok": True})}
 
     if callback_query:
         data = callback_query.get("data", "")
         chat_id = callback_query.get("message", {}).get("chat", {}).get("id")
+        notice = None
         if chat_id:
             if data == "summary_today":
                 handle_summary(chat_id, "today")
             elif data == "summary_all":
                 handle_summary(chat_id, "all")
+            elif data.startswith("sp:"):
+                try:
+                    notice = handle_summary_page(callback_query["message"], data)
+                except telebot.apihelper.ApiTelegramException as e:
+                    # «message is not modified» при повторном нажатии — не ошибка
+                    log_event("telegram_error", where="summary_page", error=repr(e))
+                except Exception as e:
+                    log_event("error", where="summary_page", error=repr(e))
         try:
             bot = get_bot()
-            bot.answer_callback_query(callback_query.get("id"))
+            bot.answer_callback_query(callback_query.get("id"), text=notice)
         except:
             pass
         return {"statusCode": 200, "body": json.dumps({"ok": True})}
@@ -224,7 +332,7 @@ def process_webhook(body):
         try:
             handle_new_member(message)
         except Exception as e:
-            print(f"New member error: {e}")
+            log_event("error", where="new_member", error=repr(e))
         return {"statusCode": 200, "body": json.dumps({"ok": True})}
 
     text = message.get("text", "")
@@ -246,9 +354,9 @@ def process_webhook(body):
         elif text in ("/summary_all", "📈 Сводка за всё время"):
             handle_summary(chat_id, "all")
     except telebot.apihelper.ApiTelegramException as e:
-        print(f"Telegram API error: {e}")
+        log_event("telegram_error", where="webhook", error=repr(e))
     except Exception as e:
-        print(f"Error processing webhook: {e}")
+        log_event("error", where="webhook", error=repr(e))
 
     return {"statusCode": 200, "body": json.dumps({"ok": True})}
 
@@ -273,6 +381,7 @@ def handle_send(body):
         return cors_response(500, {"error": str(e)})
 
 
+@instrumented("telegram-bot")
 def handler(event: dict, context) -> dict:
     """Telegram Bot для Sweep REF — уведомления и сводки"""
     method = event.get("httpMethod", "POST")
@@ -281,6 +390,7 @@ def handler(event: dict, context) -> dict:
 
     params = event.get("queryStringParameters") or {}
     action = params.get("action", "")
+    set_action(action or "webhook")
 
     if action:
         raw_body = event.get("body") or "{}"
@@ -0,0 +1,8 @@
+"""
+Общий код функций Sweep REF: пул соединений, кеш настроек, HTTP/CORS,
+клиент Telegram, колоночная аналитика и движок сводок.
+
+Исходник — backend/shared/sweep_shared. В каждую функцию пакет копируется
+скриптом backend/shared/sync.py; копии не редактируются вручную.
+Подмодули импортируются по отдельности, чтобы холодный старт тянул только нужное.
+"""
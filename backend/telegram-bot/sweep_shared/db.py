@@ -0,0 +1,189 @@
+"""
+Доступ к БД через пулы соединений, живущие столько же, сколько тёплый инстанс функции.
+
+Если задан DATABASE_REPLICA_URL, чтения с get_db(readonly=True) идут на реплику
+через отдельный пул; при отставании больше REPLICA_MAX_LAG секунд или
+недоступности реплики — на primary.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import psycopg2
+import psycopg2.pool
+
+from sweep_shared.metrics import InstrumentedCursor, log_event
+from sweep_shared.prepared import PreparingConnection
+
+_pools = {}
+_pools_lock = threading.Lock()
+_checked_out = {}
+_replica_state = {"checked_at": -1e9, "healthy": False, "lag": None}
+_executor = None
+# запас сверх statement_timeout на ожидание соединения и разбор результата; сколько ждать потоки после отмены
+WAIT_MARGIN = 5
+CANCEL_WAIT = 5
+
+
+def get_schema() -> str:
+    """Префикс схемы БД (MAIN_DB_SCHEMA)."""
+    schema = os.environ.get("MAIN_DB_SCHEMA", "public")
+    return f"{schema}." if schema else ""
+
+
+def get_cursor_factory():
+    """InstrumentedCursor; SamplingCursor, если включено сэмплирование медленных запросов."""
+    from sweep_shared import slowlog
+    return slowlog.SamplingCursor if slowlog.is_enabled() else InstrumentedCursor
+
+
+def get_db_pool(name="primary"):
+    """Пул primary (DATABASE_URL) или replica (DATABASE_REPLICA_URL)."""
+    pool = _pools.get(name)
+    if pool is not None and not pool.closed:
+        return pool
+    # потоки run_concurrently на холодном инстансе не должны создать по своему пулу
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None or pool.closed:
+            dsn = os.environ["DATABASE_REPLICA_URL" if name == "replica" else "DATABASE_URL"]
+            pool = psycopg2.pool.ThreadedConnectionPool(
+                1, int(os.environ.get("DB_POOL_MAX", "4")), dsn,
+                connection_factory=PreparingConnection, cursor_factory=get_cursor_factory(),
+            )
+            _pools[name] = pool
+    return pool
+
+
+def replica_lag(conn):
+    """Отставание реплики в секундах (0, если всё воспроизведено или это не реплика)."""
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 "
+        "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+    )
+    lag = float(cur.fetchone()[0])
+    cur.close()
+    conn.rollback()
+    return lag
+
+
+def _replica_conn():
+    """Соединение с репликой или None, если реплики нет, она недоступна или отстаёт больше REPLICA_MAX_LAG."""
+    if not os.environ.get("DATABASE_REPLICA_URL"):
+        return None
+    now = time.monotonic()
+    recheck = now - _replica_state["checked_at"] >= float(os.environ.get("REPLICA_LAG_CHECK_INTERVAL", "5"))
+    if not recheck and not _replica_state["healthy"]:
+        return None
+    try:
+        pool = get_db_pool("replica")
+        conn = pool.getconn()
+    except (psycopg2.Error, ValueError) as e:
+        _replica_state.update(checked_at=now, healthy=False, lag=None)
+        log_event("replica_unavailable", error=repr(e))
+        return None
+    if recheck:
+        try:
+            lag = replica_lag(conn)
+        except psycopg2.Error as e:
+            pool.putconn(conn, close=True)
+            _replica_state.update(checked_at=now, healthy=False, lag=None)
+            log_event("replica_unavailable", error=repr(e))
+            return None
+        healthy = lag <= float(os.environ.get("REPLICA_MAX_LAG", "10"))
+        _replica_state.update(checked_at=now, healthy=healthy, lag=lag)
+        if not healthy:
+            pool.putconn(conn)
+            log_event("replica_lagging", lag=lag)
+            return None
+    _checked_out[conn] = "replica"
+    return conn
+
+
+def get_db(readonly=False):
+    """
+    Соединение из пула; вернуть через release_db.
+    readonly=True — для чтений, которые можно обслужить с реплики (если она настроена и не отстаёт).
+    """
+    if readonly:
+        conn = _replica_conn()
+        if conn is not None:
+            return conn
+    conn = get_db_pool().getconn()
+    _checked_out[conn] = "primary"
+    return conn
+
+
+def release_db(conn) -> None:
+    """Возвращает соединение в пул (незавершённая транзакция откатывается, сломанное соединение закрывается)."""
+    name = _checked_out.pop(conn, None)
+    if name is None:
+        return  # уже возвращено
+    _put_back(conn, name)
+
+
+def _put_back(conn, name) -> None:
+    if not conn.closed:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            pass
+    get_db_pool(name).putconn(conn, close=bool(conn.closed))
+
+
+def release_all() -> None:
+    """Возвращает в пул соединения, которые обработчик не отпустил сам."""
+    for conn in list(_checked_out):
+        release_db(conn)
+
+
+def _run_on_own_connection(fn, readonly, timeout_ms, active):
+    conn = get_db(readonly=readonly)
+    # соединение потока не числится в _checked_out: его возвращает только сам поток,
+    # а release_all обработчика не отдаст его в пул, пока запрос ещё идёт
+    name = _checked_out.pop(conn)
+    active.add(conn)
+    try:
+        cur = conn.cursor()
+        cur.execute("SET LOCAL statement_timeout = %s", (timeout_ms,))
+        result = fn(cur)
+        cur.close()
+        return result
+    finally:
+        active.discard(conn)
+        _put_back(conn, name)
+
+
+def run_concurrently(tasks, readonly=True, timeout_ms=None):
+    """
+    Независимые чтения параллельно, каждое на своём соединении из пула.
+    tasks: {name: fn(cur)} -> {name: результат}. Каждый запрос ограничен statement_timeout
+    (DB_QUERY_TIMEOUT_MS, по умолчанию 10 с); первая ошибка пробрасывается. Если ответа нет
+    и после запаса, незавершённые запросы отменяются (conn.cancel) и выбрасывается TimeoutError.
+    Потоков на одно меньше DB_POOL_MAX, чтобы обработчику всегда оставалось соединение.
+    """
+    global _executor
+    timeout_ms = timeout_ms or int(os.environ.get("DB_QUERY_TIMEOUT_MS", "10000"))
+    if _executor is None:
+        workers = max(1, int(os.environ.get("DB_POOL_MAX", "4")) - 1)
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+    active = set()
+    futures = {
+        name: _executor.submit(_run_on_own_connection, fn, readonly, timeout_ms, active)
+        for name, fn in tasks.items()
+    }
+    # statement_timeout отменит запрос на сервере; WAIT_MARGIN — на ожидание соединения и разбор результата
+    done, pending = wait(futures.values(), timeout=timeout_ms / 1000 + WAIT_MARGIN)
+    if pending:
+        # отменяем то, что ещё выполняется, и даём потокам вернуть соединения
+        for conn in list(active):
+            conn.cancel()
+        wait(pending, timeout=CANCEL_WAIT)
+        raise TimeoutError(f"queries did not finish in {timeout_ms} ms: "
+                           + ", ".join(name for name, f in futures.items() if f in pending))
+    return {name: f.result() for name, f in futures.items()}
+
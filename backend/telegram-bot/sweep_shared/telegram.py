@@ -0,0 +1,55 @@
+"""
+Минимальный клиент Telegram Bot API на urllib — без импорта telebot на холодном старте.
+"""
+
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+
+from sweep_shared.metrics import add_telegram_time, log_event
+
+
+def get_bot_token() -> str:
+    return os.environ.get("TELEGRAM_BOT_TOKEN", "")
+
+
+def api_request(method: str, payload: dict, timeout: float = 5):
+    """Вызов метода Bot API -> (result, error); error — description из ответа Telegram, None при успехе."""
+    bot_token = get_bot_token()
+    if not bot_token:
+        return None, "TELEGRAM_BOT_TOKEN not configured"
+    req = urllib.request.Request(
+        f"https://api.telegram.org/bot{bot_token}/{method}",
+        data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"}, method="POST",
+    )
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as r:
+            result = json.loads(r.read()).get("result")
+        add_telegram_time(time.perf_counter() - start)
+        return result, None
+    except Exception as e:
+        add_telegram_time(time.perf_counter() - start, ok=False)
+        error = repr(e)
+        if isinstance(e, urllib.error.HTTPError):
+            try:
+                error = json.loads(e.read()).get("description") or error
+            except Exception:
+                pass
+        log_event("telegram_error", method=method, error=error)
+        return None, error
+
+
+def api_call(method: str, payload: dict, timeout: float = 5):
+    """Вызов метода Bot API; возвращает поле result или None, если токена нет или запрос не удался."""
+    if not get_bot_token():
+        return None
+    return api_request(method, payload, timeout)[0]
+
+
+def send_message(chat_id, text: str, parse_mode: str = "HTML", **extra):
+    if not chat_id:
+        return None
+    return api_call("sendMessage", {"chat_id": chat_id, "text": text, "parse_mode": parse_mode, **extra})
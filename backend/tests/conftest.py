@@ -0,0 +1,119 @@
+"""
+Интеграционные тесты функций на настоящем Postgres.
+
+    pip install -r backend/tests/requirements.txt
+    TEST_DATABASE_URL=postgresql://postgres@localhost/postgres python -m pytest backend/tests
+
+На каждый модуль тестов создаётся чистая БД со всеми миграциями из db_migrations и
+удаляется после него. Без TEST_DATABASE_URL тесты, которым нужна БД, пропускаются.
+"""
+
+import importlib.util
+import json
+import os
+import sys
+import uuid
+from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit
+
+import pytest
+
+BACKEND = Path(__file__).resolve().parent.parent
+MIGRATIONS = BACKEND.parent / "db_migrations"
+
+# общий пакет берётся из исходника, а не из копий в папках функций
+sys.path.insert(0, str(BACKEND / "shared"))
+
+import psycopg2  # noqa: E402
+from psycopg2.extensions import make_dsn  # noqa: E402
+
+from sweep_shared import db  # noqa: E402
+
+
+def reset_pools():
+    for pool in db._pools.values():
+        if not pool.closed:
+            pool.closeall()
+    db._pools.clear()
+    db._checked_out.clear()
+    db._replica_state.update(checked_at=-1e9, healthy=False, lag=None)
+
+
+def migrations():
+    return sorted(MIGRATIONS.glob("V*.sql"), key=lambda p: int(p.name[1:].split("__")[0]))
+
+
+def database_dsn(admin_url, name):
+    """DSN того же сервера с другой БД."""
+    if "://" in admin_url:
+        return urlunsplit(urlsplit(admin_url)._replace(path=f"/{name}"))
+    return make_dsn(admin_url, dbname=name)
+
+
+def create_database(admin_url, name):
+    conn = psycopg2.connect(admin_url)
+    conn.autocommit = True
+    conn.cursor().execute(f'CREATE DATABASE "{name}"')
+    conn.close()
+    url = database_dsn(admin_url, name)
+    conn = psycopg2.connect(url)
+    with conn, conn.cursor() as cur:
+        for path in migrations():
+            cur.execute(path.read_text())
+    conn.close()
+    return url
+
+
+def drop_database(admin_url, name):
+    conn = psycopg2.connect(admin_url)
+    conn.autocommit = True
+    conn.cursor().execute(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)')
+    conn.close()
+
+
+@pytest.fixture(scope="module")
+def database_url():
+    admin_url = os.environ.get("TEST_DATABASE_URL")
+    if not admin_url:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    name = f"sweep_test_{uuid.uuid4().hex[:12]}"
+    url = create_database(admin_url, name)
+    yield url
+    reset_pools()
+    drop_database(admin_url, name)
+
+
+@pytest.fixture
+def db_env(database_url, monkeypatch):
+    """DATABASE_URL тестовой БД и свежие пулы sweep_shared.db; -> соединение для проверок (autocommit)."""
+    monkeypatch.setenv("DATABASE_URL", database_url)
+    monkeypatch.delenv("DATABASE_REPLICA_URL", raising=False)
+    reset_pools()
+    conn = psycopg2.connect(database_url)
+    conn.autocommit = True
+    yield conn
+    conn.close()
+    reset_pools()
+
+
+def load_function(name):
+    """index.py функции как модуль (соседние модули функции тоже импортируются)."""
+    module_name = name.replace("-", "_").replace("/", "_") + "_index"
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    folder = BACKEND / name
+    sys.path.append(str(folder))
+    spec = importlib.util.spec_from_file_location(module_name, folder / "index.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def call(handler, method="POST", body=None, params=None, headers=None):
+    """Вызов handler функции как платформой -> (status, body как dict, headers)."""
+    result = handler({
+        "httpMethod": method, "queryStringParameters": params or {}, "headers": headers or {},
+        "body": json.dumps(body if body is not None else {}),
+    }, None)
+    return result["statusCode"], json.loads(result["body"] or "null"), result.get("headers", {})
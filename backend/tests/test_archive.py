@@ -0,0 +1,94 @@
+"""
+Холодный архив: hourly_counts и представления сохраняют архивные месяцы, экспорт читает
+файл из хранилища по его location и не отдаёт строки удалённых ресторанов.
+"""
+
+from datetime import date, datetime
+
+import pytest
+
+from sweep_shared.archive import LocalStorage, archive_month, decode_rows, encode_rows, iter_archived_rows
+
+MONTH = date(2023, 1, 1)
+
+
+@pytest.fixture
+def cur(db_env):
+    cursor = db_env.cursor()
+    for table in ("responses", "hourly_counts", "archived_files", "archived_monthly_counts"):
+        cursor.execute(f"DELETE FROM {table}")
+    cursor.execute("INSERT INTO restaurants (name, slug) VALUES ('Архивный', 'archived') RETURNING id")
+    rid = cursor.fetchone()[0]
+    cursor.execute(
+        "INSERT INTO responses (restaurant_id, source, created_at) VALUES (%s, 'instagram', %s), (%s, 'friends', %s)",
+        (rid, datetime(2023, 1, 10, 12), rid, datetime(2023, 1, 20, 18)),
+    )
+    # archive_month работает в транзакции вызывающего
+    db_env.autocommit = False
+    yield cursor
+    db_env.rollback()
+    db_env.autocommit = True
+    cursor.execute("DELETE FROM responses")
+    cursor.execute("DELETE FROM restaurants WHERE slug = 'archived'")
+
+
+@pytest.fixture
+def rid(cur):
+    cur.execute("SELECT id FROM restaurants WHERE slug = 'archived'")
+    return cur.fetchone()[0]
+
+
+def hourly(cur):
+    cur.execute("SELECT restaurant_id, source, hour_msk, count FROM hourly_counts ORDER BY 1, 2, 3")
+    return cur.fetchall()
+
+
+def test_archiving_keeps_hourly_counts_and_totals(cur, rid, tmp_path, monkeypatch):
+    before = hourly(cur)
+    monkeypatch.chdir(tmp_path)
+    result = archive_month(cur, MONTH, storage=LocalStorage("archive"))
+    assert result["rows"] == 2
+    cur.execute("SELECT COUNT(*) FROM responses")
+    assert cur.fetchone()[0] == 0
+    assert hourly(cur) == before
+
+    cur.execute("REFRESH MATERIALIZED VIEW mv_daily_totals")
+    cur.execute("REFRESH MATERIALIZED VIEW mv_restaurant_totals")
+    cur.execute("SELECT SUM(count) FROM mv_daily_totals WHERE restaurant_id = %s", (rid,))
+    daily = cur.fetchone()[0]
+    cur.execute("SELECT count FROM mv_restaurant_totals WHERE restaurant_id = %s", (rid,))
+    assert daily == cur.fetchone()[0] == 2
+
+    # триггер снова вычитает обычные удаления после архивирования в той же сессии
+    cur.execute("INSERT INTO responses (restaurant_id, source, created_at) VALUES (%s, 'instagram', NOW())",
+                (rid,))
+    cur.execute("DELETE FROM responses")
+    assert hourly(cur) == before
+
+
+def test_archived_rows_are_read_from_their_location(cur, rid, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    archive_month(cur, MONTH, storage=LocalStorage("archive"))
+    # ARCHIVE_PATH с тех пор сменился: файл всё равно читается по сохранённому пути
+    monkeypatch.setenv("ARCHIVE_PATH", str(tmp_path / "elsewhere"))
+    monkeypatch.chdir("/")
+    rows = list(iter_archived_rows(cur, restaurant_id=rid))
+    assert [r[2] for r in rows] == ["instagram", "friends"]
+
+
+def test_archived_rows_of_deleted_restaurant_are_skipped(cur, rid, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    archive_month(cur, MONTH, storage=LocalStorage("archive"))
+    cur.execute("DELETE FROM restaurants WHERE id = %s", (rid,))
+    assert list(iter_archived_rows(cur)) == []
+
+
+@pytest.mark.parametrize("fmt", ["ndjson", "parquet"])
+def test_encoded_rows_round_trip_as_naive_utc(fmt):
+    if fmt == "parquet":
+        pytest.importorskip("pyarrow")
+    rows = [
+        (1, 2, "instagram", datetime(2023, 1, 10, 21, 30, 15, 123456)),
+        (2, 2, "friends", datetime(2023, 1, 31, 23, 59, 59)),
+    ]
+    assert list(decode_rows(encode_rows(rows, fmt), fmt)) == rows
@@ -0,0 +1,102 @@
+"""
+sweep_shared.db: пулы соединений, маршрутизация чтений на реплику и параллельные чтения.
+"""
+
+import os
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+import pytest
+
+from conftest import create_database, database_dsn, drop_database, reset_pools
+from sweep_shared import db
+
+
+def test_run_concurrently_on_cold_pools(db_env):
+    # все потоки одновременно берут соединение до создания пула
+    results = db.run_concurrently({i: lambda cur: cur.execute("SELECT 1") or cur.fetchone()[0] for i in range(3)})
+    assert results == {0: 1, 1: 1, 2: 1}
+    assert list(db._pools) == ["primary"]
+    assert not db._checked_out
+
+
+def test_timed_out_worker_keeps_its_connection(db_env, monkeypatch):
+    monkeypatch.setattr(db, "WAIT_MARGIN", 0)
+    monkeypatch.setattr(db, "CANCEL_WAIT", 0)
+    release = threading.Event()
+
+    def slow(cur):
+        cur.execute("SELECT 1")
+        release.wait(5)
+
+    with pytest.raises(TimeoutError):
+        db.run_concurrently({"slow": slow}, timeout_ms=50)
+    # соединение занято потоком: release_all обработчика не возвращает его в пул
+    db.release_all()
+    pool = db.get_db_pool()
+    assert len(pool._used) == 1
+    release.set()
+    deadline = time.monotonic() + 5
+    while pool._used and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not pool._used
+
+
+@pytest.fixture(scope="module")
+def replica_url(database_url):
+    admin_url = os.environ["TEST_DATABASE_URL"]
+    name = f"sweep_replica_{uuid.uuid4().hex[:12]}"
+    yield create_database(admin_url, name)
+    reset_pools()
+    drop_database(admin_url, name)
+
+
+@pytest.fixture
+def replica(db_env, replica_url, monkeypatch):
+    monkeypatch.setenv("DATABASE_REPLICA_URL", replica_url)
+    monkeypatch.setenv("REPLICA_LAG_CHECK_INTERVAL", "60")
+    return replica_url
+
+
+def served_by(readonly):
+    conn = db.get_db(readonly=readonly)
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT current_database()")
+        return db._checked_out[conn], cur.fetchone()[0]
+    finally:
+        db.release_db(conn)
+
+
+def dbname(url):
+    return urlsplit(url).path.lstrip("/")
+
+
+def test_reads_without_replica_use_primary(db_env, database_url):
+    assert served_by(readonly=True) == ("primary", dbname(database_url))
+
+
+def test_readonly_reads_go_to_healthy_replica(replica, database_url):
+    assert served_by(readonly=True) == ("replica", dbname(replica))
+    assert served_by(readonly=False) == ("primary", dbname(database_url))
+    assert db._replica_state["healthy"] and db._replica_state["lag"] == 0
+
+
+def test_lagging_replica_falls_back_to_primary(replica, database_url, monkeypatch):
+    monkeypatch.setattr(db, "replica_lag", lambda conn: 120.0)
+    assert served_by(readonly=True) == ("primary", dbname(database_url))
+    assert not db._replica_state["healthy"] and db._replica_state["lag"] == 120.0
+    # до следующей проверки реплика не спрашивается
+    monkeypatch.setattr(db, "replica_lag", lambda conn: 0.0)
+    assert served_by(readonly=True)[0] == "primary"
+    db._replica_state["checked_at"] = -1e9
+    assert served_by(readonly=True)[0] == "replica"
+
+
+def test_unreachable_replica_falls_back_to_primary(db_env, database_url, monkeypatch):
+    monkeypatch.setenv("DATABASE_REPLICA_URL", database_dsn(os.environ["TEST_DATABASE_URL"], "sweep_missing_replica"))
+    assert served_by(readonly=True) == ("primary", dbname(database_url))
+    assert not db._replica_state["healthy"]
+    assert not db._checked_out
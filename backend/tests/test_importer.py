@@ -0,0 +1,49 @@
+"""
+Импорт ответов: ошибки разбора и лимит строк — ImportFailed, а не сбой COPY.
+"""
+
+import csv
+
+import pytest
+
+from sweep_shared.importer import ImportFailed, import_text
+
+HEADER = "restaurant,source,created_at\n"
+ROW = "ispanskiy,instagram,2024-03-01T12:00:00\n"
+
+
+@pytest.fixture
+def cur(db_env):
+    db_env.autocommit = False
+    cursor = db_env.cursor()
+    yield cursor
+    db_env.rollback()
+    db_env.autocommit = True
+
+
+def test_valid_rows_are_inserted(cur):
+    result = import_text(cur, HEADER + ROW * 3)
+    assert result["ok"] and result["inserted"] == 3
+
+
+def test_row_limit_raises_import_failed(cur):
+    with pytest.raises(ImportFailed, match="Too many rows"):
+        import_text(cur, HEADER + ROW * 3, max_rows=2)
+    # транзакция не прервана сбоем COPY: откат и дальнейшие запросы работают
+    cur.connection.rollback()
+    cur.execute("SELECT 1")
+
+
+def test_malformed_csv_raises_import_failed(cur):
+    limit = csv.field_size_limit(10)
+    try:
+        with pytest.raises(ImportFailed, match="Malformed csv"):
+            import_text(cur, HEADER + "ispanskiy,instagram," + "x" * 50 + "\n")
+    finally:
+        csv.field_size_limit(limit)
+
+
+def test_unknown_references_are_reported(cur):
+    result = import_text(cur, HEADER + "nowhere,instagram,2024-03-01T12:00:00\n" + ROW)
+    assert not result["ok"] and result["inserted"] == 0
+    assert result["errors"] == [{"line": 2, "error": "unknown restaurant 'nowhere'"}]
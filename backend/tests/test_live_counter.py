@@ -0,0 +1,76 @@
+"""
+Живой счётчик: без таймеров — отложенную правку дописывает следующий touch или flush_pending.
+"""
+
+import pytest
+
+from sweep_shared import live_counter
+
+CHAT = "-100"
+
+
+@pytest.fixture
+def calls(db_env, monkeypatch):
+    cur = db_env.cursor()
+    cur.execute("DELETE FROM live_counters")
+    sent = []
+
+    def api_request(method, payload):
+        sent.append((method, payload.get("message_id")))
+        if method == "sendMessage":
+            return {"message_id": 7}, None
+        return True, None
+
+    monkeypatch.setattr(live_counter, "api_request", api_request)
+    monkeypatch.setattr(live_counter, "INTERVAL", 60)
+    return sent
+
+
+def expire_interval(conn):
+    conn.cursor().execute("UPDATE live_counters SET edited_at = NOW() - INTERVAL '1 hour'")
+
+
+def test_touch_inside_interval_only_marks_dirty(db_env, calls):
+    live_counter.touch(CHAT, 1)
+    assert [m for m, _ in calls] == ["sendMessage", "pinChatMessage"]
+    live_counter.touch(CHAT, 1)
+    assert len(calls) == 2
+    cur = db_env.cursor()
+    cur.execute("SELECT dirty, message_id FROM live_counters")
+    assert cur.fetchone() == (True, 7)
+
+
+def test_next_touch_flushes_other_dirty_counters(db_env, calls):
+    live_counter.touch(CHAT, 1)
+    live_counter.touch(CHAT, 1)
+    expire_interval(db_env)
+    calls.clear()
+    live_counter.touch(CHAT, 2)
+    # новый счётчик ресторана 2 и отложенная правка ресторана 1
+    assert ("editMessageText", 7) in calls
+    cur = db_env.cursor()
+    cur.execute("SELECT COUNT(*) FROM live_counters WHERE dirty")
+    assert cur.fetchone()[0] == 0
+
+
+def test_flush_pending_publishes_due_counters_only(db_env, calls):
+    live_counter.touch(CHAT, 1)
+    live_counter.touch(CHAT, 1)
+    calls.clear()
+    assert live_counter.flush_pending() == 0
+    expire_interval(db_env)
+    assert live_counter.flush_pending() == 1
+    assert calls == [("editMessageText", 7)]
+    assert live_counter.flush_pending() == 0
+
+
+def test_new_day_unpins_previous_message(db_env, calls):
+    live_counter.touch(CHAT, 1)
+    db_env.cursor().execute("UPDATE live_counters SET day = day - 1")
+    calls.clear()
+    live_counter.touch(CHAT, 1)
+    assert calls == [("unpinChatMessage", 7), ("sendMessage", None), ("pinChatMessage", 7)]
+    calls.clear()
+    expire_interval(db_env)
+    live_counter.touch(CHAT, 1)
+    assert calls == [("editMessageText", 7)]
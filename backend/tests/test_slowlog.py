@@ -0,0 +1,79 @@
+"""
+Сэмплер медленных запросов: EXPLAIN ANALYZE в откатываемой транзакции, подготовленные
+запросы — по их SQL, одно служебное соединение на инстанс.
+"""
+
+import time
+
+import psycopg2
+import pytest
+
+from sweep_shared import db, prepared, slowlog
+
+
+@pytest.fixture
+def sampling(db_env, monkeypatch):
+    for key, value in {
+        "SLOW_QUERY_SAMPLING": "1", "SLOW_QUERY_MS": "0", "SLOW_QUERY_SINK": "table",
+        "EXPLAIN_SAMPLE_RATE": "1", "EXPLAIN_MIN_INTERVAL": "0",
+    }.items():
+        monkeypatch.setenv(key, value)
+    monkeypatch.setattr(slowlog, "_last_explain", {})
+    db_env.cursor().execute("DELETE FROM query_samples")
+    yield db_env
+    if slowlog._service_conn is not None:
+        slowlog._service_conn.close()
+        slowlog._service_conn = None
+
+
+def samples(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT query, plan IS NOT NULL FROM query_samples ORDER BY id")
+    return cur.fetchall()
+
+
+def test_explain_analyze_rolls_back_writes(sampling):
+    cur = sampling.cursor()
+    cur.execute("SELECT COUNT(*), (SELECT COALESCE(SUM(count), 0) FROM hourly_counts) FROM responses")
+    before = cur.fetchone()
+    plan = slowlog.explain("INSERT INTO responses (restaurant_id, source) VALUES (1, 'instagram')")
+    assert "Actual Total Time" in plan[0]["Plan"] and "Shared Hit Blocks" in plan[0]["Plan"]
+    cur.execute("SELECT COUNT(*), (SELECT COALESCE(SUM(count), 0) FROM hourly_counts) FROM responses")
+    assert cur.fetchone() == before
+
+
+def test_explain_is_bounded_by_timeout(sampling, monkeypatch):
+    monkeypatch.setenv("EXPLAIN_TIMEOUT_MS", "100")
+    start = time.perf_counter()
+    with pytest.raises(psycopg2.errors.QueryCanceled):
+        slowlog.explain("SELECT pg_sleep(2)")
+    assert time.perf_counter() - start < 1
+    # транзакция откатана: служебное соединение пригодно для следующего плана
+    assert "Actual Total Time" in slowlog.explain("SELECT 1")[0]["Plan"]
+
+
+def test_prepared_statement_is_sampled_by_its_sql(sampling):
+    prepared.register("slowlog_restaurant_name", "SELECT name FROM restaurants WHERE id = %s")
+    conn = db.get_db()
+    try:
+        cur = conn.cursor()
+        prepared.execute(cur, "slowlog_restaurant_name", (1,))
+        prepared.execute(cur, "slowlog_restaurant_name", (2,))
+    finally:
+        db.release_db(conn)
+    # PREPARE остаётся отдельным сэмплом; оба EXECUTE — под одним отпечатком исходного SQL
+    rows = [r for r in samples(sampling) if not r[0].startswith("PREPARE")]
+    assert rows == [("SELECT name FROM restaurants WHERE id = ?", True)] * 2
+
+
+def test_samples_reuse_one_service_connection(sampling):
+    conn = db.get_db()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        service = slowlog._service_conn
+        cur.execute("SELECT 2")
+    finally:
+        db.release_db(conn)
+    assert service is not None and slowlog._service_conn is service
+    assert len(samples(sampling)) == 2
@@ -0,0 +1,52 @@
+"""
+Сводка: агрегат считается в Postgres по hourly_counts, включая архивные месяцы.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from sweep_shared.msk import MSK_TODAY_START_SQL
+from sweep_shared.summary import summary_aggregate
+
+
+@pytest.fixture
+def cur(db_env):
+    cursor = db_env.cursor()
+    cursor.execute("DELETE FROM responses")
+    cursor.execute("DELETE FROM hourly_counts")
+    cursor.execute(
+        "INSERT INTO responses (restaurant_id, source, created_at) VALUES "
+        "(1, 'instagram', NOW()), (1, 'instagram', NOW()), (1, 'friends', NOW()), (1, 'friends', %s)",
+        (datetime.utcnow() - timedelta(days=40),),
+    )
+    # архивный месяц: строк в responses нет, итог остаётся в hourly_counts
+    cursor.execute("INSERT INTO hourly_counts (restaurant_id, source, hour_msk, count) VALUES (1, 'friends', '2020-01-01', 5)")
+    yield cursor
+    cursor.execute("DELETE FROM responses")
+    cursor.execute("DELETE FROM hourly_counts")
+
+
+def test_today_counts_only_current_day(cur):
+    aggregate = summary_aggregate(cur, "today")
+    assert aggregate["total"] == 3
+    name, count, rows = aggregate["restaurants"][0]
+    assert count == 3 and [cnt for _, cnt in rows] == [2, 1]
+
+
+def test_all_time_includes_archived_months(cur):
+    aggregate = summary_aggregate(cur, "all")
+    assert aggregate["total"] == 9
+    assert dict(aggregate["restaurants"][0][2])["Рекомендация друзей"] == 7
+
+
+def test_today_is_the_msk_day(cur):
+    today, all_time = summary_aggregate(cur, "today")["total"], summary_aggregate(cur, "all")["total"]
+    # минута до и минута после полуночи МСК: в «сегодня» попадает только вторая
+    cur.execute(
+        "INSERT INTO responses (restaurant_id, source, created_at) VALUES "
+        f"(1, 'instagram', {MSK_TODAY_START_SQL} - INTERVAL '1 minute'), "
+        f"(1, 'instagram', {MSK_TODAY_START_SQL} + INTERVAL '1 minute')"
+    )
+    assert summary_aggregate(cur, "today")["total"] == today + 1
+    assert summary_aggregate(cur, "all")["total"] == all_time + 2
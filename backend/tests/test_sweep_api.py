@@ -0,0 +1,198 @@
+"""
+sweep-api: действия админки на тестовой БД.
+"""
+
+import pytest
+
+from conftest import call, load_function
+
+
+@pytest.fixture
+def api(db_env, monkeypatch):
+    monkeypatch.delenv("ARCHIVE_PATH", raising=False)
+    monkeypatch.setenv("MAINTENANCE_KEY", "test-maintenance")
+    module = load_function("sweep-api")
+    module.admin = {"Authorization": f"Bearer {module.make_token(1)}"}
+    module.maintenance = {"X-Maintenance-Key": "test-maintenance"}
+    return module
+
+
+def test_archive_months_requires_s3_storage(api):
+    status, body, _ = call(api.handler, body={"action": "archive_months"}, headers=api.admin)
+    assert status == 409
+    assert "s3://" in body["error"]
+
+
+def post(api, body, key=None):
+    headers = dict(api.admin, **({"Idempotency-Key": key} if key else {}))
+    return call(api.handler, body=body, headers=headers)
+
+
+def count(conn, sql, *args):
+    cur = conn.cursor()
+    cur.execute(sql, args)
+    return cur.fetchone()[0]
+
+
+def test_idempotent_replay_returns_stored_response(api, db_env):
+    body = {"action": "create_source", "key": "replay_src", "label": "Replay"}
+    status, first, _ = post(api, body, "key-replay")
+    assert status == 200
+    status, second, headers = post(api, body, "key-replay")
+    assert status == 200 and second == first
+    assert headers["Idempotent-Replayed"] == "true"
+    assert count(db_env, "SELECT COUNT(*) FROM source_options WHERE key = 'replay_src'") == 1
+
+
+def test_idempotency_key_reused_with_other_request(api):
+    assert post(api, {"action": "create_source", "key": "mismatch_a", "label": "A"}, "key-mismatch")[0] == 200
+    status, body, _ = post(api, {"action": "create_source", "key": "mismatch_b", "label": "B"}, "key-mismatch")
+    assert status == 422
+    assert "different request" in body["error"]
+
+
+def test_unauthorized_request_does_not_reserve_key(api, db_env, monkeypatch):
+    monkeypatch.setattr(api, "run_idempotent", lambda *args: pytest.fail("key reserved before auth"))
+    status, _, _ = call(
+        api.handler, body={"action": "create_source", "key": "anon", "label": "Anon"},
+        headers={"Idempotency-Key": "key-anon"},
+    )
+    assert status == 401
+    assert count(db_env, "SELECT COUNT(*) FROM idempotency_keys WHERE key = 'key-anon'") == 0
+
+
+def test_replay_reissues_unstored_password(api, db_env):
+    body = {"action": "create_restaurant", "name": "Idempotent Place"}
+    status, first, _ = post(api, body, "key-secret")
+    assert status == 200 and first["password"]
+    stored = count(db_env, "SELECT response FROM idempotency_keys WHERE key = 'key-secret'")
+    assert first["password"] not in stored
+    status, second, headers = post(api, body, "key-secret")
+    assert status == 200 and headers["Idempotent-Replayed"] == "true"
+    assert second["id"] == first["id"] and second["password"] not in (None, first["password"])
+    assert "redacted" not in second
+    check = {"action": "check_restaurant_password", "restaurant_id": first["id"]}
+    assert post(api, dict(check, password=second["password"]))[0] == 200
+    assert post(api, dict(check, password=first["password"]))[0] == 401
+
+
+def test_hostess_tap_replay_inserts_once(api, db_env):
+    body = {"action": "add_response", "restaurant_id": 1, "source": "instagram"}
+    status, first, _ = post(api, body, "key-tap")
+    assert status == 200
+    status, second, headers = post(api, body, "key-tap")
+    assert status == 200 and headers["Idempotent-Replayed"] == "true"
+    assert second["response_id"] == first["response_id"]
+    assert count(db_env, "SELECT COUNT(*) FROM responses WHERE request_key = 'key-tap'") == 1
+    assert count(db_env, "SELECT COUNT(*) FROM idempotency_keys WHERE key = 'key-tap'") == 0
+    status, _, _ = post(api, dict(body, source="friends"), "key-tap")
+    assert status == 422
+
+
+def test_undo_replay_returns_stored_response(api):
+    _, added, _ = post(api, {"action": "add_response", "restaurant_id": 1, "source": "instagram"})
+    body = {"action": "undo_response", "restaurant_id": 1, "response_id": added["response_id"]}
+    assert post(api, body, "key-undo")[0] == 200
+    status, _, headers = post(api, body, "key-undo")
+    assert status == 200 and headers["Idempotent-Replayed"] == "true"
+
+
+def test_cleanup_idempotency_keys_removes_expired(api, db_env):
+    cur = db_env.cursor()
+    cur.execute(
+        "INSERT INTO idempotency_keys (key, action, request_hash, expires_at) VALUES "
+        "('old', 'save_settings', 'h', NOW() - INTERVAL '1 second'), ('live', 'save_settings', 'h', NOW() + INTERVAL '1 hour')"
+    )
+    assert call(api.handler, body={"action": "cleanup_idempotency_keys"})[0] == 403
+    assert post(api, {"action": "cleanup_idempotency_keys"})[0] == 403
+    status, body, _ = call(api.handler, body={"action": "cleanup_idempotency_keys"}, headers=api.maintenance)
+    assert status == 200 and body["removed"] == 1
+    assert count(db_env, "SELECT COUNT(*) FROM idempotency_keys WHERE key IN ('old', 'live')") == 1
+
+
+def test_delete_responses_by_ids_and_filter(api, db_env):
+    cur = db_env.cursor()
+    cur.execute(
+        "INSERT INTO responses (restaurant_id, source, created_at) VALUES "
+        "(1, 'friends', '2024-02-01 09:00'), (1, 'friends', '2024-02-02 09:00'), (1, 'instagram', '2024-02-02 10:00') "
+        "RETURNING id"
+    )
+    ids = [r[0] for r in cur.fetchall()]
+    status, body, _ = post(api, {"action": "delete_responses", "ids": ids[:1]})
+    assert status == 200 and body["deleted"] == 1
+    flt = {"restaurant_id": 1, "source": "friends", "date_from": "2024-02-01", "date_to": "2024-02-02"}
+    status, body, _ = post(api, {"action": "delete_responses", "filter": flt})
+    assert status == 200 and body["deleted"] == 1
+    assert count(db_env, "SELECT COUNT(*) FROM responses WHERE id = ANY(%s)", ids) == 1
+    assert post(api, {"action": "delete_responses", "filter": {}})[0] == 400
+
+
+def test_import_responses_validation(api, db_env, monkeypatch):
+    csv_rows = "restaurant,source,created_at\n" + "ispanskiy,instagram,2024-03-01T12:00:00\n" * 2
+    assert post(api, {"action": "import_responses", "format": "xml", "data": csv_rows})[0] == 400
+
+    monkeypatch.setattr(api, "MAX_IMPORT_ROWS", 1)
+    status, body, _ = post(api, {"action": "import_responses", "data": csv_rows})
+    assert status == 400 and "Too many rows" in body["error"]
+    monkeypatch.undo()
+
+    status, body, _ = post(api, {"action": "import_responses", "data": csv_rows + "nowhere,instagram,2024-03-01\n"})
+    assert status == 422 and body["error_count"] == 1 and body["inserted"] == 0
+    status, body, _ = post(api, {"action": "import_responses", "data": csv_rows, "dry_run": True})
+    assert status == 200 and body["ok"] and body["rows"] == 2
+
+
+def test_fast_stats_read_views_within_max_age(api, db_env):
+    assert call(api.handler, body={"action": "refresh_views"}, headers=api.maintenance)[1]["refreshed"] is True
+    cur = db_env.cursor()
+    cur.execute("SELECT COALESCE(SUM(count), 0) FROM mv_restaurant_totals")
+    before = cur.fetchone()[0]
+    cur.execute("INSERT INTO responses (restaurant_id, source) VALUES (1, 'instagram')")
+
+    status, body, _ = post(api, {"action": "get_stats", "mode": "fast"})
+    assert status == 200 and body["totals_source"] == "views"
+    assert body["views_age_seconds"] < 60
+    assert sum(body["totals"]["by_restaurant"].values()) == before
+
+    # устаревшие представления не читаются и не обновляются: итоги считаются по hourly_counts
+    cur.execute("UPDATE app_settings SET value = '1' WHERE key = 'views_refreshed_at'")
+    status, body, _ = post(api, {"action": "get_stats", "mode": "fast"})
+    assert body["totals_source"] == "live" and body["views_age_seconds"] > api.VIEWS_MAX_AGE
+    assert sum(body["totals"]["by_restaurant"].values()) == before + 1
+    assert sum(body["totals"]["by_source"].values()) == before + 1
+    assert count(db_env, "SELECT COALESCE(SUM(count), 0) FROM mv_restaurant_totals") == before
+
+
+def test_hostess_token_needs_secret(api, monkeypatch):
+    monkeypatch.delenv("HOSTESS_TOKEN_SECRET", raising=False)
+    assert api.make_hostess_token(1) is None
+    monkeypatch.setenv("HOSTESS_TOKEN_SECRET", "first")
+    token = api.make_hostess_token(1)
+    assert api.verify_hostess_token(token) == 1
+    monkeypatch.setenv("HOSTESS_TOKEN_SECRET", "second")
+    assert api.verify_hostess_token(token) is None
+    monkeypatch.delenv("HOSTESS_TOKEN_SECRET")
+    assert api.verify_hostess_token(token) is None
+
+
+def test_live_counter_failure_does_not_fail_the_tap(api, monkeypatch):
+    def broken(chat_id, restaurant_id):
+        raise RuntimeError("telegram is down")
+
+    monkeypatch.setattr(api, "live_counter_chat", lambda settings: "-100")
+    monkeypatch.setattr(api.live_counter, "touch", broken)
+    status, added, _ = post(api, {"action": "add_response", "restaurant_id": 1, "source": "instagram"})
+    assert status == 200
+    body = {"action": "undo_response", "restaurant_id": 1, "response_id": added["response_id"]}
+    assert post(api, body)[0] == 200
+
+
+def test_today_count_uses_msk_day(api, db_env):
+    _, before, _ = post(api, {"action": "get_today_count", "restaurant_id": 1})
+    db_env.cursor().execute(
+        "INSERT INTO responses (restaurant_id, source, created_at) VALUES "
+        f"(1, 'instagram', {api.MSK_TODAY_START_SQL} - INTERVAL '1 minute'), "
+        f"(1, 'instagram', {api.MSK_TODAY_START_SQL} + INTERVAL '1 minute')"
+    )
+    _, after, _ = post(api, {"action": "get_today_count", "restaurant_id": 1})
+    assert after["today_count"] == before["today_count"] + 1
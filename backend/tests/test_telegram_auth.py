@@ -0,0 +1,183 @@
+"""
+telegram-auth: ротация refresh-токенов, обнаружение повторного использования, logout и очистка.
+"""
+
+import hashlib
+
+import pytest
+
+from conftest import call, load_function
+
+
+@pytest.fixture
+def auth(db_env, monkeypatch):
+    monkeypatch.setenv("JWT_SECRET", "test-secret")
+    monkeypatch.setenv("MAINTENANCE_KEY", "maintenance")
+    monkeypatch.setenv("TOKEN_CLEANUP_PROBABILITY", "0")
+    module = load_function("telegram-auth")
+    cur = db_env.cursor()
+    cur.execute("DELETE FROM refresh_tokens")
+    cur.execute("DELETE FROM telegram_auth_tokens")
+    cur.execute(
+        "INSERT INTO users (telegram_id, name) VALUES ('42', 'Test') "
+        "ON CONFLICT (telegram_id) DO UPDATE SET name = EXCLUDED.name RETURNING id"
+    )
+    module.test_user_id = cur.fetchone()[0]
+    return module
+
+
+def sha(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def insert_legacy_token(conn, user_id, token):
+    """Токен без префикса семьи, как до V0009, с семьёй, проставленной миграцией."""
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO refresh_tokens (user_id, token_hash, expires_at) VALUES (%s, %s, NOW() + INTERVAL '1 day')",
+        (user_id, sha(token)),
+    )
+    cur.execute("UPDATE refresh_tokens SET family_id = md5(id::text || token_hash) WHERE family_id IS NULL")
+
+
+def refresh(auth, token):
+    return call(auth.handler, params={"action": "refresh"}, body={"refresh_token": token})
+
+
+def token_count(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM refresh_tokens")
+    return cur.fetchone()[0]
+
+
+def test_legacy_token_refresh_refresh_logout(auth, db_env):
+    insert_legacy_token(db_env, auth.test_user_id, "legacy-secret")
+
+    status, body, _ = refresh(auth, "legacy-secret")
+    assert status == 200
+    first = body["refresh_token"]
+    status, body, _ = refresh(auth, first)
+    assert status == 200
+    second = body["refresh_token"]
+    assert second.split(".")[0] == first.split(".")[0]
+
+    status, _, _ = call(auth.handler, params={"action": "logout"}, body={"refresh_token": second})
+    assert status == 200
+    assert token_count(db_env) == 0
+    assert refresh(auth, second)[0] == 401
+
+
+def test_logout_falls_back_to_hash_when_family_does_not_match(auth, db_env):
+    # строка, выданная до исправления: префикс токена не совпадает с сохранённой семьёй
+    cur = db_env.cursor()
+    cur.execute(
+        "INSERT INTO refresh_tokens (user_id, token_hash, expires_at, family_id) "
+        "VALUES (%s, %s, NOW() + INTERVAL '1 day', md5('other'))",
+        (auth.test_user_id, sha("f00d.secret")),
+    )
+    assert call(auth.handler, params={"action": "logout"}, body={"refresh_token": "f00d.secret"})[0] == 200
+    assert token_count(db_env) == 0
+
+
+def test_mismatched_family_is_rekeyed_on_rotation(auth, db_env):
+    cur = db_env.cursor()
+    cur.execute(
+        "INSERT INTO refresh_tokens (user_id, token_hash, expires_at, family_id) "
+        "VALUES (%s, %s, NOW() + INTERVAL '1 day', md5('other'))",
+        (auth.test_user_id, sha("beef.secret")),
+    )
+    status, body, _ = refresh(auth, "beef.secret")
+    assert status == 200
+    cur.execute("SELECT family_id FROM refresh_tokens")
+    assert cur.fetchone()[0] == "beef" == body["refresh_token"].split(".")[0]
+
+
+def test_replayed_token_revokes_family(auth, db_env):
+    insert_legacy_token(db_env, auth.test_user_id, "legacy-secret")
+    first = refresh(auth, "legacy-secret")[1]["refresh_token"]
+    second = refresh(auth, first)[1]["refresh_token"]
+
+    assert refresh(auth, first)[0] == 401
+    assert token_count(db_env) == 0
+    assert refresh(auth, second)[0] == 401
+
+
+def test_unknown_token_with_family_prefix_revokes_nothing(auth, db_env):
+    insert_legacy_token(db_env, auth.test_user_id, "legacy-secret")
+    current = refresh(auth, "legacy-secret")[1]["refresh_token"]
+    family = current.split(".")[0]
+
+    # префикс семьи не проверен: подделанный или истёкший токен не должен разлогинить владельца
+    assert refresh(auth, f"{family}.forged")[0] == 401
+    cur = db_env.cursor()
+    cur.execute(
+        "INSERT INTO refresh_tokens (user_id, token_hash, expires_at, family_id) "
+        "VALUES (%s, %s, NOW() - INTERVAL '1 second', %s)",
+        (auth.test_user_id, sha(f"{family}.expired"), family),
+    )
+    assert refresh(auth, f"{family}.expired")[0] == 401
+    assert call(auth.handler, params={"action": "logout"}, body={"refresh_token": f"{family}.forged"})[0] == 200
+    assert refresh(auth, current)[0] == 200
+
+
+def test_callback_does_not_consume_unbound_token(auth, db_env, monkeypatch):
+    monkeypatch.setenv("JWT_SECRET", "x" * 32)
+    cur = db_env.cursor()
+    cur.execute(
+        "INSERT INTO telegram_auth_tokens (token_hash, expires_at) VALUES (%s, NOW() + INTERVAL '5 minutes')",
+        (sha("pending"),),
+    )
+    status, body, _ = call(auth.handler, params={"action": "callback"}, body={"token": "pending"})
+    assert status == 400 and body["error"] == "Token not authenticated"
+
+    # бот привязал токен после первой попытки — повторный callback проходит
+    cur.execute("UPDATE telegram_auth_tokens SET telegram_id = '42' WHERE token_hash = %s", (sha("pending"),))
+    status, body, _ = call(auth.handler, params={"action": "callback"}, body={"token": "pending"})
+    assert status == 200 and body["refresh_token"]
+    status, body, _ = call(auth.handler, params={"action": "callback"}, body={"token": "pending"})
+    assert status == 410 and body["error"] == "Token already used"
+
+
+def test_cleanup_requires_maintenance_key(auth):
+    assert call(auth.handler, params={"action": "cleanup"})[0] == 403
+    assert call(auth.handler, params={"action": "cleanup"}, headers={"X-Maintenance-Key": "wrong"})[0] == 403
+
+
+def test_cleanup_removes_only_expired_tokens(auth, db_env):
+    cur = db_env.cursor()
+    cur.execute(
+        "INSERT INTO refresh_tokens (user_id, token_hash, expires_at, family_id) VALUES "
+        "(%s, 'expired', NOW() - INTERVAL '1 day', 'a'), (%s, 'live', NOW() + INTERVAL '1 day', 'b')",
+        (auth.test_user_id, auth.test_user_id),
+    )
+    cur.execute(
+        "INSERT INTO telegram_auth_tokens (token_hash, telegram_id, expires_at) "
+        "VALUES ('old', '42', NOW() - INTERVAL '1 hour')"
+    )
+    status, body, _ = call(auth.handler, params={"action": "cleanup"}, headers={"X-Maintenance-Key": "maintenance"})
+    assert status == 200
+    assert body["removed"] == {"auth_tokens": 1, "refresh_tokens": 1}
+    cur.execute("SELECT token_hash FROM refresh_tokens")
+    assert cur.fetchall() == [("live",)]
+
+
+def test_probabilistic_cleanup_runs_after_request(auth, db_env, monkeypatch):
+    cur = db_env.cursor()
+    cur.execute(
+        "INSERT INTO refresh_tokens (user_id, token_hash, expires_at, family_id) "
+        "VALUES (%s, 'expired', NOW() - INTERVAL '1 day', 'a')",
+        (auth.test_user_id,),
+    )
+    monkeypatch.setenv("TOKEN_CLEANUP_PROBABILITY", "1")
+    monkeypatch.setattr(auth, "_last_cleanup", -1e9)
+    assert call(auth.handler, params={"action": "logout"}, body={})[0] == 200
+    assert token_count(db_env) == 0
+
+    # не чаще раза в CLEANUP_MIN_INTERVAL на инстанс
+    cur.execute(
+        "INSERT INTO refresh_tokens (user_id, token_hash, expires_at, family_id) "
+        "VALUES (%s, 'expired', NOW() - INTERVAL '1 day', 'a')",
+        (auth.test_user_id,),
+    )
+    assert call(auth.handler, params={"action": "logout"}, body={})[0] == 200
+    assert token_count(db_env) == 1
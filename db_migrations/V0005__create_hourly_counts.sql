@@ -0,0 +1,60 @@
+CREATE TABLE hourly_counts (
+    restaurant_id INTEGER NOT NULL,
+    source VARCHAR(50) NOT NULL,
+    hour_msk TIMESTAMP NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (restaurant_id, source, hour_msk)
+);
+
+CREATE INDEX idx_hourly_counts_hour_msk ON hourly_counts(hour_msk);
+
+INSERT INTO hourly_counts (restaurant_id, source, hour_msk, count)
+SELECT restaurant_id, source, date_trunc('hour', created_at + INTERVAL '3 hours'), COUNT(*)
+FROM responses
+WHERE created_at IS NOT NULL
+GROUP BY 1, 2, 3;
+
+CREATE OR REPLACE FUNCTION hourly_counts_on_insert() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO hourly_counts (restaurant_id, source, hour_msk, count)
+    SELECT restaurant_id, source, date_trunc('hour', created_at + INTERVAL '3 hours'), COUNT(*)
+    FROM new_rows
+    WHERE created_at IS NOT NULL
+    GROUP BY 1, 2, 3
+    ON CONFLICT (restaurant_id, source, hour_msk)
+    DO UPDATE SET count = hourly_counts.count + EXCLUDED.count;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION hourly_counts_on_delete() RETURNS trigger AS $$
+BEGIN
+    UPDATE hourly_counts h
+    SET count = h.count - d.cnt
+    FROM (
+        SELECT restaurant_id, source, date_trunc('hour', created_at + INTERVAL '3 hours') AS hour_msk, COUNT(*) AS cnt
+        FROM old_rows
+        WHERE created_at IS NOT NULL
+        GROUP BY 1, 2, 3
+    ) d
+    WHERE h.restaurant_id = d.restaurant_id AND h.source = d.source AND h.hour_msk = d.hour_msk;
+    DELETE FROM hourly_counts h
+    USING (
+        SELECT DISTINCT restaurant_id, source, date_trunc('hour', created_at + INTERVAL '3 hours') AS hour_msk
+        FROM old_rows
+        WHERE created_at IS NOT NULL
+    ) d
+    WHERE h.restaurant_id = d.restaurant_id AND h.source = d.source AND h.hour_msk = d.hour_msk AND h.count <= 0;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_responses_hourly_insert
+AFTER INSERT ON responses
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION hourly_counts_on_insert();
+
+CREATE TRIGGER trg_responses_hourly_delete
+AFTER DELETE ON responses
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION hourly_counts_on_delete();
@@ -0,0 +1,23 @@
+CREATE MATERIALIZED VIEW mv_daily_totals AS
+SELECT restaurant_id, source, hour_msk::date AS day_msk, SUM(count)::int AS count
+FROM hourly_counts
+GROUP BY 1, 2, 3;
+
+CREATE UNIQUE INDEX idx_mv_daily_totals_key ON mv_daily_totals(restaurant_id, source, day_msk);
+CREATE INDEX idx_mv_daily_totals_day ON mv_daily_totals(day_msk);
+
+CREATE MATERIALIZED VIEW mv_restaurant_totals AS
+SELECT restaurant_id, SUM(count)::int AS count
+FROM hourly_counts
+GROUP BY 1;
+
+CREATE UNIQUE INDEX idx_mv_restaurant_totals_key ON mv_restaurant_totals(restaurant_id);
+
+CREATE MATERIALIZED VIEW mv_source_totals AS
+SELECT source, SUM(count)::int AS count
+FROM hourly_counts
+GROUP BY 1;
+
+CREATE UNIQUE INDEX idx_mv_source_totals_key ON mv_source_totals(source);
+
+INSERT INTO app_settings (key, value) VALUES ('views_refreshed_at', EXTRACT(EPOCH FROM NOW())::bigint::text) ON CONFLICT DO NOTHING;
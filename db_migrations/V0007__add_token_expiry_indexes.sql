@@ -0,0 +1,3 @@
+CREATE INDEX IF NOT EXISTS idx_telegram_auth_tokens_expires_at ON telegram_auth_tokens(expires_at);
+CREATE INDEX IF NOT EXISTS idx_telegram_auth_tokens_used_created_at ON telegram_auth_tokens(created_at) WHERE used = TRUE;
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_expires_at ON refresh_tokens(expires_at);
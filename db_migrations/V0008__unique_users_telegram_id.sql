@@ -0,0 +1,13 @@
+DELETE FROM refresh_tokens rt
+USING users u, users keep
+WHERE rt.user_id = u.id
+  AND keep.telegram_id = u.telegram_id
+  AND keep.id < u.id;
+
+DELETE FROM users u
+USING users keep
+WHERE keep.telegram_id = u.telegram_id
+  AND keep.id < u.id;
+
+DROP INDEX IF EXISTS idx_users_telegram_id;
+ALTER TABLE users ADD CONSTRAINT users_telegram_id_key UNIQUE (telegram_id);
@@ -0,0 +1,5 @@
+ALTER TABLE refresh_tokens ADD COLUMN family_id VARCHAR(64);
+
+UPDATE refresh_tokens SET family_id = md5(id::text || token_hash) WHERE family_id IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_family_id ON refresh_tokens(family_id);
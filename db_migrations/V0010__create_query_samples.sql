@@ -0,0 +1,13 @@
+CREATE TABLE IF NOT EXISTS query_samples (
+    id SERIAL PRIMARY KEY,
+    fingerprint VARCHAR(32) NOT NULL,
+    query TEXT NOT NULL,
+    duration_ms NUMERIC(12, 2) NOT NULL,
+    function VARCHAR(50),
+    action VARCHAR(100),
+    plan JSONB,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_query_samples_fingerprint ON query_samples(fingerprint, created_at);
+CREATE INDEX IF NOT EXISTS idx_query_samples_created_at ON query_samples(created_at);
@@ -0,0 +1,12 @@
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key VARCHAR(200) NOT NULL,
+    action VARCHAR(50) NOT NULL,
+    request_hash VARCHAR(64) NOT NULL,
+    status INTEGER,
+    response TEXT,
+    created_at TIMESTAMP DEFAULT NOW(),
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (key, action)
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys(expires_at);
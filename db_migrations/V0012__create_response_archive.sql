@@ -0,0 +1,44 @@
+CREATE TABLE IF NOT EXISTS archived_files (
+    id SERIAL PRIMARY KEY,
+    month_msk DATE NOT NULL,
+    part INTEGER NOT NULL,
+    location TEXT NOT NULL,
+    format VARCHAR(20) NOT NULL,
+    row_count INTEGER NOT NULL,
+    archived_at TIMESTAMP DEFAULT NOW(),
+    UNIQUE (month_msk, part)
+);
+
+CREATE TABLE IF NOT EXISTS archived_monthly_counts (
+    restaurant_id INTEGER NOT NULL,
+    source VARCHAR(50) NOT NULL,
+    month_msk DATE NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (restaurant_id, source, month_msk)
+);
+
+DROP MATERIALIZED VIEW IF EXISTS mv_restaurant_totals;
+
+CREATE MATERIALIZED VIEW mv_restaurant_totals AS
+SELECT restaurant_id, SUM(count)::int AS count
+FROM (
+    SELECT restaurant_id, count FROM hourly_counts
+    UNION ALL
+    SELECT restaurant_id, count FROM archived_monthly_counts
+) t
+GROUP BY 1;
+
+CREATE UNIQUE INDEX idx_mv_restaurant_totals_key ON mv_restaurant_totals(restaurant_id);
+
+DROP MATERIALIZED VIEW IF EXISTS mv_source_totals;
+
+CREATE MATERIALIZED VIEW mv_source_totals AS
+SELECT source, SUM(count)::int AS count
+FROM (
+    SELECT source, count FROM hourly_counts
+    UNION ALL
+    SELECT source, count FROM archived_monthly_counts
+) t
+GROUP BY 1;
+
+CREATE UNIQUE INDEX idx_mv_source_totals_key ON mv_source_totals(source);
@@ -0,0 +1,9 @@
+CREATE TABLE IF NOT EXISTS summary_snapshots (
+    id SERIAL PRIMARY KEY,
+    period VARCHAR(20) NOT NULL,
+    payload TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW(),
+    expires_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_summary_snapshots_expires_at ON summary_snapshots(expires_at);
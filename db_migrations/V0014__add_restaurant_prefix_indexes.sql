@@ -0,0 +1,2 @@
+CREATE INDEX IF NOT EXISTS idx_restaurants_slug_prefix ON restaurants(slug text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_restaurants_name_prefix ON restaurants(LOWER(name) text_pattern_ops);
@@ -0,0 +1,11 @@
+CREATE TABLE IF NOT EXISTS live_counters (
+    chat_id VARCHAR(50) NOT NULL,
+    restaurant_id INTEGER NOT NULL,
+    day DATE NOT NULL,
+    message_id BIGINT,
+    edited_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    dirty BOOLEAN NOT NULL DEFAULT false,
+    PRIMARY KEY (chat_id, restaurant_id)
+);
+
+INSERT INTO app_settings (key, value) VALUES ('telegram_live_counter', 'false') ON CONFLICT DO NOTHING;
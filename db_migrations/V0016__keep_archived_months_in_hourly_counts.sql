@@ -0,0 +1,54 @@
+-- Архивирование не уменьшает hourly_counts: удаление строк с sweep.keep_rollups = 'on'
+-- пропускается триггером, и все представления считают архивные месяцы одинаково.
+CREATE OR REPLACE FUNCTION hourly_counts_on_delete() RETURNS trigger AS $$
+BEGIN
+    IF current_setting('sweep.keep_rollups', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    UPDATE hourly_counts h
+    SET count = h.count - d.cnt
+    FROM (
+        SELECT restaurant_id, source, date_trunc('hour', created_at + INTERVAL '3 hours') AS hour_msk, COUNT(*) AS cnt
+        FROM old_rows
+        WHERE created_at IS NOT NULL
+        GROUP BY 1, 2, 3
+    ) d
+    WHERE h.restaurant_id = d.restaurant_id AND h.source = d.source AND h.hour_msk = d.hour_msk;
+    DELETE FROM hourly_counts h
+    USING (
+        SELECT DISTINCT restaurant_id, source, date_trunc('hour', created_at + INTERVAL '3 hours') AS hour_msk
+        FROM old_rows
+        WHERE created_at IS NOT NULL
+    ) d
+    WHERE h.restaurant_id = d.restaurant_id AND h.source = d.source AND h.hour_msk = d.hour_msk AND h.count <= 0;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- месяцы, архивированные до этой миграции, уже вычтены из hourly_counts: их итоги
+-- возвращаются из archived_monthly_counts в первый час месяца (почасовая разбивка утеряна)
+INSERT INTO hourly_counts (restaurant_id, source, hour_msk, count)
+SELECT restaurant_id, source, month_msk::timestamp, count
+FROM archived_monthly_counts
+ON CONFLICT (restaurant_id, source, hour_msk)
+DO UPDATE SET count = hourly_counts.count + EXCLUDED.count;
+
+DROP MATERIALIZED VIEW IF EXISTS mv_restaurant_totals;
+
+CREATE MATERIALIZED VIEW mv_restaurant_totals AS
+SELECT restaurant_id, SUM(count)::int AS count
+FROM hourly_counts
+GROUP BY 1;
+
+CREATE UNIQUE INDEX idx_mv_restaurant_totals_key ON mv_restaurant_totals(restaurant_id);
+
+DROP MATERIALIZED VIEW IF EXISTS mv_source_totals;
+
+CREATE MATERIALIZED VIEW mv_source_totals AS
+SELECT source, SUM(count)::int AS count
+FROM hourly_counts
+GROUP BY 1;
+
+CREATE UNIQUE INDEX idx_mv_source_totals_key ON mv_source_totals(source);
+
+REFRESH MATERIALIZED VIEW mv_daily_totals;
@@ -0,0 +1,5 @@
+-- Idempotency-Key тапа хостес хранится в самой строке ответа: повтор add_response
+-- упирается в уникальный индекс, и отдельной записи в idempotency_keys не нужно.
+ALTER TABLE responses ADD COLUMN request_key VARCHAR(200);
+
+CREATE UNIQUE INDEX idx_responses_request_key ON responses(request_key) WHERE request_key IS NOT NULL;
@@ -0,0 +1,3 @@
+-- Ротация помечает refresh-токен использованным вместо удаления: повтор такого токена —
+-- признак кражи, и только он отзывает всю семью. Строки удаляет очистка по expires_at.
+ALTER TABLE refresh_tokens ADD COLUMN used_at TIMESTAMP;
@@ -26,6 +26,7 @@ import {
   AlertDialogHeader,
   AlertDialogTitle,
 } from "@/components/ui/alert-dialog";
+import { Checkbox } from "@/components/ui/checkbox";
 import Icon from "@/components/ui/icon";
 import { apiCall, sourceLabel, type Restaurant, type ResponseRecord, type SourceOption } from "@/lib/store";
 import { useToast } from "@/hooks/use-toast";
@@ -58,11 +59,27 @@ const ResponsesTab = ({
   const [clearMode, setClearMode] = useState(false);
   const [page, setPage] = useState(0);
   const [sourceFilter, setSourceFilter] = useState("all");
+  const [selected, setSelected] = useState<Set<number>>(new Set());
+  const [bulkMode, setBulkMode] = useState(false);
 
   const finalFiltered = sourceFilter === "all" ? filtered : filtered.filter((r) => r.source === sourceFilter);
   const sorted = [...finalFiltered].reverse();
   const totalPages = Math.ceil(sorted.length / PAGE_SIZE);
   const paged = sorted.slice(page * PAGE_SIZE, (page + 1) * PAGE_SIZE);
+  const pageSelected = paged.length > 0 && paged.every((r) => selected.has(r.id));
+
+  const toggleSelected = (id: number) => {
+    const next = new Set(selected);
+    if (next.has(id)) next.delete(id);
+    else next.add(id);
+    setSelected(next);
+  };
+
+  const togglePage = () => {
+    const next = new Set(selected);
+    paged.forEach((r) => (pageSelected ? next.delete(r.id) : next.add(r.id)));
+    setSelected(next);
+  };
 
   const handleDelete = async () => {
     if (!deleteId) return;
@@ -79,6 +96,22 @@ const ResponsesTab = ({
     setDeleteId(null);
   };
 
+  const handleBulkDelete = async () => {
+    if (selected.size === 0) return;
+    try {
+      const data = await apiCall("sweep-api", {
+        method: "POST",
+        body: JSON.stringify({ action: "delete_responses", ids: [...selected] }),
+      });
+      toast({ title: `Удалено ${data.deleted} записей` });
+      setSelected(new Set());
+      onDataChanged();
+    } catch {
+      toast({ title: "Ошибка", variant: "destructive" });
+    }
+    setBulkMode(false);
+  };
+
   const handleClearAll = async () => {
     const rid = selectedRestaurant !== "all" ? Number(selectedRestaurant) : undefined;
     if (!rid) {
@@ -141,6 +174,12 @@ const ResponsesTab = ({
           <span className="text-sm text-muted-foreground">
             {finalFiltered.length} записей
           </span>
+          {selected.size > 0 && (
+            <Button variant="outline" size="sm" className="text-destructive hover:text-destructive" onClick={() => setBulkMode(true)}>
+              <Icon name="Trash2" size={14} className="mr-1.5" />
+              Удалить выбранные ({selected.size})
+            </Button>
+          )}
           {selectedRestaurant !== "all" && finalFiltered.length > 0 && (
             <Button variant="outline" size="sm" className="text-destructive hover:text-destructive" onClick={() => setClearMode(true)}>
               <Icon name="Trash2" size={14} className="mr-1.5" />
@@ -155,6 +194,9 @@ const ResponsesTab = ({
             <Table>
               <TableHeader>
                 <TableRow>
+                  <TableHead className="w-[40px]">
+                    <Checkbox checked={pageSelected} onCheckedChange={togglePage} />
+                  </TableHead>
                   <TableHead className="w-[180px]">Дата</TableHead>
                   <TableHead>Ресторан</TableHead>
                   <TableHead>Источник</TableHead>
@@ -164,13 +206,16 @@ const ResponsesTab = ({
               <TableBody>
                 {paged.length === 0 ? (
                   <TableRow>
-                    <TableCell colSpan={4} className="text-center py-12 text-muted-foreground">
+                    <TableCell colSpan={5} className="text-center py-12 text-muted-foreground">
                       Нет данных
                     </TableCell>
                   </TableRow>
                 ) : (
                   paged.map((r) => (
                     <TableRow key={r.id} className="group">
+                      <TableCell>
+                        <Checkbox checked={selected.has(r.id)} onCheckedChange={() => toggleSelected(r.id)} />
+                      </TableCell>
                       <TableCell className="text-sm text-muted-foreground">
                         {new Date(r.created_at).toLocaleString("ru-RU")}
                       </TableCell>
@@ -229,6 +274,21 @@ const ResponsesTab = ({
         </AlertDialogContent>
       </AlertDialog>
 
+      <AlertDialog open={bulkMode} onOpenChange={(open) => !open && setBulkMode(false)}>
+        <AlertDialogContent>
+          <AlertDialogHeader>
+            <AlertDialogTitle>Удалить выбранные записи?</AlertDialogTitle>
+            <AlertDialogDescription>{selected.size} записей будут удалены из статистики безвозвратно.</AlertDialogDescription>
+          </AlertDialogHeader>
+          <AlertDialogFooter>
+            <AlertDialogCancel>Отмена</AlertDialogCancel>
+            <AlertDialogAction onClick={handleBulkDelete} className="bg-destructive text-destructive-foreground hover:bg-destructive/90">
+              Удалить
+            </AlertDialogAction>
+          </AlertDialogFooter>
+        </AlertDialogContent>
+      </AlertDialog>
+
       <AlertDialog open={clearMode} onOpenChange={(open) => !open && setClearMode(false)}>
         <AlertDialogContent>
           <AlertDialogHeader>
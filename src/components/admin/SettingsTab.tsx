@@ -48,6 +48,7 @@ const SettingsTab = ({ restaurants, sources, settings, onDataChanged }: Settings
 
   const [tgChatId, setTgChatId] = useState(settings.telegram_chat_id);
   const [tgNotifications, setTgNotifications] = useState(settings.telegram_notifications_enabled);
+  const [tgLiveCounter, setTgLiveCounter] = useState(settings.telegram_live_counter);
   const [savingTg, setSavingTg] = useState(false);
   const [testingTg, setTestingTg] = useState(false);
   const [sendingSummary, setSendingSummary] = useState<string | null>(null);
@@ -213,6 +214,7 @@ const SettingsTab = ({ restaurants, sources, settings, onDataChanged }: Settings
           action: "save_settings",
           telegram_chat_id: tgChatId.trim(),
           telegram_notifications_enabled: tgNotifications,
+          telegram_live_counter: tgLiveCounter,
         }),
       });
       toast({ title: "Настройки Telegram сохранены" });
@@ -310,6 +312,20 @@ const SettingsTab = ({ restaurants, sources, settings, onDataChanged }: Settings
             />
           </div>
 
+          <div className="flex items-center justify-between p-3 rounded-lg bg-white border border-border/40">
+            <div>
+              <p className="text-sm font-medium">Живой счётчик вместо сообщений</p>
+              <p className="text-xs text-muted-foreground">
+                Бот закрепит по сообщению «Сегодня» на ресторан и будет обновлять его, не присылая новых
+              </p>
+            </div>
+            <Switch
+              checked={tgLiveCounter}
+              onCheckedChange={setTgLiveCounter}
+              disabled={!tgNotifications}
+            />
+          </div>
+
           <div className="flex gap-2">
             <Button onClick={handleSaveTelegram} disabled={savingTg} size="sm">
               {savingTg ? <Icon name="Loader2" size={14} className="animate-spin mr-1.5" /> : <Icon name="Save" size={14} className="mr-1.5" />}
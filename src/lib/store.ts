@@ -24,10 +24,13 @@ export interface ResponseRecord {
 export interface AppSettings {
   telegram_chat_id: string;
   telegram_notifications_enabled: boolean;
+  telegram_live_counter: boolean;
 }
 
 let backendUrls: Record<string, string> = {};
 
+const MAX_RETRIES = 2;
+
 export async function loadUrls() {
   if (Object.keys(backendUrls).length > 0) return backendUrls;
   try {
@@ -39,6 +42,17 @@ export async function loadUrls() {
   return backendUrls;
 }
 
+async function fetchWithRetry(url: string, init: RequestInit, retries: number): Promise<Response> {
+  for (let attempt = 0; ; attempt++) {
+    try {
+      return await fetch(url, init);
+    } catch (err) {
+      if (attempt >= retries) throw err;
+      await new Promise((r) => setTimeout(r, 500 * (attempt + 1)));
+    }
+  }
+}
+
 export async function apiCall(funcName: string, options: RequestInit = {}) {
   const urls = await loadUrls();
   const url = urls[funcName];
@@ -53,7 +67,13 @@ export async function apiCall(funcName: string, options: RequestInit = {}) {
     headers["Authorization"] = `Bearer ${token}`;
   }
 
-  const res = await fetch(url, { ...options, headers });
+  // один ключ на вызов: при сетевой ошибке запрос повторяется, и сервер не выполнит его дважды
+  const isPost = (options.method || "GET").toUpperCase() === "POST";
+  if (isPost && !headers["Idempotency-Key"]) {
+    headers["Idempotency-Key"] = crypto.randomUUID();
+  }
+
+  const res = await fetchWithRetry(url, { ...options, headers }, isPost ? MAX_RETRIES : 0);
   const data = await res.json();
   if (!res.ok) throw new Error(data.error || "Request failed");
   return data;
@@ -15,7 +15,9 @@ const AdminPage = () => {
   const [restaurants, setRestaurants] = useState<Restaurant[]>([]);
   const [responses, setResponses] = useState<ResponseRecord[]>([]);
   const [sources, setSources] = useState<SourceOption[]>([]);
-  const [settings, setSettings] = useState<AppSettings>({ telegram_chat_id: "", telegram_notifications_enabled: false });
+  const [settings, setSettings] = useState<AppSettings>({
+    telegram_chat_id: "", telegram_notifications_enabled: false, telegram_live_counter: false,
+  });
   const [selectedRestaurant, setSelectedRestaurant] = useState<string>("all");
   const [dateRange, setDateRange] = useState<string>("all");
   const [loading, setLoading] = useState(true);
@@ -47,25 +49,47 @@ const AdminPage = () => {
     setLoading(false);
   };
 
+  const rangeCutoff = (): Date | null => {
+    if (dateRange === "all") return null;
+    const now = new Date();
+    const cutoff = new Date();
+    if (dateRange === "today") cutoff.setHours(0, 0, 0, 0);
+    else if (dateRange === "week") cutoff.setDate(now.getDate() - 7);
+    else if (dateRange === "month") cutoff.setMonth(now.getMonth() - 1);
+    return cutoff;
+  };
+
   const filtered = useMemo(() => {
     let result = responses;
     if (selectedRestaurant !== "all") {
       result = result.filter((r) => r.restaurant_id === Number(selectedRestaurant));
     }
-    if (dateRange !== "all") {
-      const now = new Date();
-      const cutoff = new Date();
-      if (dateRange === "today") cutoff.setHours(0, 0, 0, 0);
-      else if (dateRange === "week") cutoff.setDate(now.getDate() - 7);
-      else if (dateRange === "month") cutoff.setMonth(now.getMonth() - 1);
+    const cutoff = rangeCutoff();
+    if (cutoff) {
       result = result.filter((r) => new Date(r.created_at) >= cutoff);
     }
     return result;
   }, [responses, selectedRestaurant, dateRange]);
 
-  const handleExport = () => {
+  // экспорт идёт через сервер: он добавляет к живым данным ответы из архива закрытых месяцев
+  const handleExport = async () => {
+    const cutoff = rangeCutoff();
+    let exported: ResponseRecord[] = filtered;
+    try {
+      const data = await apiCall("sweep-api", {
+        method: "POST",
+        body: JSON.stringify({
+          action: "export_responses",
+          restaurant_id: selectedRestaurant === "all" ? null : Number(selectedRestaurant),
+          since: cutoff ? cutoff.toISOString() : null,
+        }),
+      });
+      exported = data.responses || [];
+    } catch {
+      // без сервера выгружаем то, что уже загружено
+    }
     const headers = ["Дата", "Ресторан", "Источник"];
-    const rows = filtered.map((r) => [
+    const rows = exported.map((r) => [
       new Date(r.created_at).toLocaleString("ru-RU"),
       restaurants.find((rest) => rest.id === r.restaurant_id)?.name || "",
       sourceLabel(r.source, sources),
@@ -24,25 +24,37 @@ const HostessPage = () => {
   const [initialLoading, setInitialLoading] = useState(true);
   const [todayCount, setTodayCount] = useState(0);
   const [undoTimer, setUndoTimer] = useState(0);
+  const [hostessToken, setHostessToken] = useState<string | null>(null);
   const { toast } = useToast();
 
+  const applyBootstrap = (data: {
+    restaurant: Restaurant;
+    sources: SourceOption[];
+    today_count: number;
+    needs_auth: boolean;
+    hostess_token: string | null;
+  }) => {
+    setRestaurant(data.restaurant);
+    setSources(data.sources || []);
+    setTodayCount(data.today_count || 0);
+    setNeedsAuth(data.needs_auth);
+    setHostessToken(data.hostess_token);
+    if (data.hostess_token) sessionStorage.setItem(`sweep_hostess_${slug}`, data.hostess_token);
+    else sessionStorage.removeItem(`sweep_hostess_${slug}`);
+  };
+
   useEffect(() => {
     if (!slug) return;
     setInitialLoading(true);
-    apiCall("sweep-api", { method: "POST", body: JSON.stringify({ action: "get_restaurant_by_slug", slug }) })
-      .then((data) => {
-        setRestaurant(data.restaurant);
-        setSources(data.sources || []);
-        const authed = sessionStorage.getItem(`sweep_auth_${data.restaurant.id}`);
-        if (data.restaurant && !authed) {
-          setNeedsAuth(true);
-        }
-        return apiCall("sweep-api", {
-          method: "POST",
-          body: JSON.stringify({ action: "get_today_count", restaurant_id: data.restaurant.id }),
-        });
-      })
-      .then((data) => setTodayCount(data.today_count || 0))
+    apiCall("sweep-api", {
+      method: "POST",
+      body: JSON.stringify({
+        action: "hostess_bootstrap",
+        slug,
+        hostess_token: sessionStorage.getItem(`sweep_hostess_${slug}`) || undefined,
+      }),
+    })
+      .then(applyBootstrap)
       .catch(() => setNotFound(true))
       .finally(() => setInitialLoading(false));
   }, [slug]);
@@ -66,12 +78,11 @@ const HostessPage = () => {
     if (!restaurant || !password) return;
     setAuthLoading(true);
     try {
-      await apiCall("sweep-api", {
+      const data = await apiCall("sweep-api", {
         method: "POST",
-        body: JSON.stringify({ action: "check_restaurant_password", restaurant_id: restaurant.id, password }),
+        body: JSON.stringify({ action: "hostess_bootstrap", slug, password }),
       });
-      sessionStorage.setItem(`sweep_auth_${restaurant.id}`, "1");
-      setNeedsAuth(false);
+      applyBootstrap(data);
     } catch {
       toast({ title: "Неверный пароль", variant: "destructive" });
     }
@@ -84,7 +95,12 @@ const HostessPage = () => {
     try {
       const data = await apiCall("sweep-api", {
         method: "POST",
-        body: JSON.stringify({ action: "add_response", restaurant_id: restaurant.id, source: sourceKey }),
+        body: JSON.stringify({
+          action: "add_response",
+          restaurant_id: restaurant.id,
+          source: sourceKey,
+          hostess_token: hostessToken,
+        }),
       });
       setLastResponseId(data.response_id);
       setLastSource(sources.find((s) => s.key === sourceKey)?.label || sourceKey);
@@ -102,7 +118,12 @@ const HostessPage = () => {
     try {
       const data = await apiCall("sweep-api", {
         method: "POST",
-        body: JSON.stringify({ action: "undo_response", response_id: lastResponseId, restaurant_id: restaurant.id }),
+        body: JSON.stringify({
+          action: "undo_response",
+          response_id: lastResponseId,
+          restaurant_id: restaurant.id,
+          hostess_token: hostessToken,
+        }),
       });
       setTodayCount(data.today_count);
       setLastResponseId(null);